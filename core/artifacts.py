@@ -0,0 +1,184 @@
+# core/artifacts.py
+"""
+Job artifacts: the result zip, built on demand, and the files left behind.
+
+The zip is no longer written when a job finishes.  ``views.download``
+streams it straight from the stored ``ResultRow``s through
+``writers.iter_zip``, stamped with ``Job.updated`` so the same job always
+yields the same bytes: the ETag names those bytes, and a Range request is
+served by regenerating the stream and cutting out the requested slice.
+The total size is only known after one full pass; it is cached per ETag
+(and computed with a throwaway pass when a Range or HEAD needs it first).
+Experiment jobs (``Job.variants``) also get the ``comparison`` sheet.
+
+``sweep`` is the janitor behind ``tasks.sweep_artifacts``: it removes
+entries of MEDIA_ROOT/tmp and TRANSLATION_JOB_ROOT older than ARTIFACT_TTL
+and, oldest first, whatever else is needed to get under ARTIFACT_QUOTA_MB.
+"""
+
+import hashlib
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count
+
+from .logic import Variant
+from .models import ResultRow
+from .store import METRIC_FIELDS
+from .writers import iter_zip
+
+log = logging.getLogger(__name__)
+
+# bump when the archive layout changes, so old ETags stop matching
+ZIP_VERSION = 1
+
+_TRANS_FIELDS = ("sql_index", "temperature", "type", "content")
+
+
+def job_root() -> Path:
+    return Path(getattr(settings, "TRANSLATION_JOB_ROOT", "jobs"))
+
+
+def job_dir(job_id) -> Path:
+    """Working directory of a job (payload, checkpoints, failed-row queues)."""
+    return job_root() / str(job_id)
+
+
+def _records(job, metrics: bool):
+    fields = _TRANS_FIELDS + ("variant",) + (tuple(METRIC_FIELDS) if metrics else ())
+    rows = (ResultRow.objects.filter(job_id=job.id)
+            .order_by("sql_index", "id")           # an experiment's rows in grid order
+            .values_list(*fields).iterator(chunk_size=2000))
+    for r in rows:
+        rec = {"SQL_Index": r[0], "Temperature": r[1], "prompt": job.prompt}
+        if job.variants:
+            rec["Variant"] = r[4]
+        rec.update({"Type": r[2], "Content": r[3]})
+        if metrics:
+            rec.update(zip(METRIC_FIELDS.values(), r[5:]))
+        yield rec
+
+
+_SCORES = ("accurate", "concise", "complete")
+
+
+def comparison(job) -> list:
+    """
+    The experiment's side-by-side sheet: per variant (in grid order) the
+    rows and sections it produced and the mean of each score (the share
+    of 1s) and confidence.
+    """
+    stats = {r["variant"]: r for r in
+             ResultRow.objects.filter(job_id=job.id).values("variant").annotate(
+                 rows=Count("sql_index", distinct=True), sections=Count("id"),
+                 **{f: Avg(f) for f in _SCORES},
+                 **{f"{f}_confidence": Avg(f"{f}_confidence") for f in _SCORES})}
+    out = []
+    for v in (Variant(**d) for d in job.variants or ()):
+        agg = stats.get(v.label, {})
+        rec = {"Variant": v.label, "Model": v.model, "Temperature": v.temperature,
+               "Max_Tokens": v.max_tokens, "Rows": agg.get("rows", 0),
+               "Sections": agg.get("sections", 0)}
+        for f in _SCORES:
+            name = METRIC_FIELDS[f]
+            for key, col in ((f, name), (f"{f}_confidence", f"{name} Confidence (%)")):
+                rec[col] = None if agg.get(key) is None else round(agg[key], 3)
+        out.append(rec)
+    return out
+
+
+def etag(job, fmt: str) -> str:
+    key = f"{job.id}:{job.updated.isoformat()}:{fmt}:{ZIP_VERSION}"
+    return f'"{hashlib.sha1(key.encode()).hexdigest()[:32]}"'
+
+
+def stream(job, fmt: str):
+    """The job zip as byte chunks; the size is cached once a pass completes."""
+    entries = {"translation": _records(job, False), "analysis": _records(job, True)}
+    if job.variants:
+        entries["comparison"] = iter(comparison(job))
+    size = 0
+    for chunk in iter_zip(entries, fmt,
+                          extra={"summary.json": json.dumps(job.summary or {}, indent=2)},
+                          stamp=job.updated):
+        size += len(chunk)
+        yield chunk
+    cache.set(f"{job.id}:zipsize:{etag(job, fmt)}", size, 86400)
+
+
+def size(job, fmt: str, compute: bool = True) -> int | None:
+    """Byte length of the job zip; one discarded pass when not cached yet (or None)."""
+    n = cache.get(f"{job.id}:zipsize:{etag(job, fmt)}")
+    if n is None and compute:
+        n = sum(len(chunk) for chunk in stream(job, fmt))
+    return n
+
+
+def byte_slice(chunks, start: int, end: int):
+    """Bytes *start*..*end* (inclusive) of a chunk stream."""
+    pos = 0
+    for chunk in chunks:
+        lo, hi = max(start - pos, 0), min(end + 1 - pos, len(chunk))
+        if lo < hi:
+            yield chunk[lo:hi]
+        pos += len(chunk)
+        if pos > end:
+            return
+
+
+# ── janitor ────────────────────────────────────────────────────────
+def _usage(path: Path):
+    """(newest mtime, total bytes) of a file or a directory tree."""
+    st = path.stat()
+    if not path.is_dir():
+        return st.st_mtime, st.st_size
+    mtime, total = st.st_mtime, 0
+    for p in path.rglob("*"):
+        try:
+            s = p.stat()
+        except OSError:                          # removed while we walked
+            continue
+        mtime = max(mtime, s.st_mtime)
+        total += s.st_size if p.is_file() else 0
+    return mtime, total
+
+
+def sweep(roots, ttl: float, quota: int, keep=(), now: float | None = None) -> dict:
+    """
+    Delete entries of *roots* older than *ttl* seconds, then the oldest
+    others until all of them fit in *quota* bytes.  Entries named (stem)
+    in *keep* – running jobs – count towards the quota but stay.
+    """
+    now, keep = now or time.time(), set(keep)
+    entries, total = [], 0
+    for root in map(Path, roots):
+        if not root.is_dir():
+            continue
+        for path in root.iterdir():
+            try:
+                mtime, nbytes = _usage(path)
+            except OSError:
+                continue
+            total += nbytes
+            if path.stem not in keep:
+                entries.append((mtime, nbytes, path))
+
+    removed = freed = 0
+    for mtime, nbytes, path in sorted(entries, key=lambda e: e[0]):
+        if now - mtime < ttl and total <= quota:
+            break
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        total   -= nbytes
+        freed   += nbytes
+        removed += 1
+    if removed:
+        log.info("artifact sweep removed %d entries (%.1f MB)", removed, freed / 2**20)
+    return {"removed": removed, "freed_bytes": freed, "used_bytes": total}
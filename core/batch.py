@@ -0,0 +1,278 @@
+# core/batch.py
+"""
+Bulk mode: every translation goes out as one Anthropic Message Batch, then
+every evaluation as one OpenAI Batch.  Results are matched back to their row
+through custom IDs (``r<idx>_<variant#>``), so the output has the same order
+and SQL_Index values as ``logic.run_rows``.  Cached responses are never
+resent, identical translations are evaluated once, and near-duplicate SQL
+is reused or sent as an update request the way ``run_rows`` does.
+"""
+
+import json
+import logging
+import os
+from collections import Counter
+from pathlib import Path
+
+from . import logic, metrics
+
+log = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+POLL_ERRORS  = 5          # failed status reads in a row before the job gives up
+# polls a job may take: both batches' 24 h completion windows and a margin
+MAX_POLLS    = int(2 * 26 * 3600 / max(POLL_SECONDS, 1))
+
+_OA_DONE = {"completed", "failed", "expired", "cancelled"}
+
+
+class Pending(Exception):
+    """A provider batch is still running; call again in *countdown* seconds."""
+
+    def __init__(self, countdown: float):
+        super().__init__(f"provider batch still running; poll again in {countdown:g} s")
+        self.countdown = countdown
+
+
+def _load(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _save(path: Path, state: dict) -> None:
+    part = path.with_name(path.name + ".part")
+    part.write_text(json.dumps(state))
+    os.replace(part, path)
+
+
+def _retrieve(state: dict, path: Path, poll: float, fetch):
+    """*fetch*(), saving *state* and asking for a later poll when the read fails."""
+    try:
+        batch = fetch()
+    except Exception as e:
+        state["poll_errors"] = state.get("poll_errors", 0) + 1
+        if state["poll_errors"] > POLL_ERRORS:
+            raise
+        log.warning("batch poll failed (%d in a row): %s", state["poll_errors"], e)
+        _save(path, state)
+        raise Pending(poll) from e
+    state["poll_errors"] = 0
+    return batch
+
+
+def _cid(row: dict, ti: int) -> str:
+    return f"r{row['idx']}_{ti}"
+
+
+def _plan_translations(rows: list, variants: list, stats: Counter) -> tuple:
+    """(texts known without a request, cache keys, models, similar lookups, plan, requests)."""
+    # oversized rows are sent as several parts ("<cid>_p<k>") and merged afterwards
+    texts, keys, requests, plan, models, similar = {}, {}, [], {}, {}, {}
+    for row in rows:
+        parts = logic._parts(row)
+        if len(parts) > 1:
+            stats["chunked_rows"] += 1
+            stats["chunks"] += len(parts)
+        for ti, v in enumerate(variants):
+            plan[_cid(row, ti)] = pids = []
+            for k, part in enumerate(parts):
+                pid = _cid(row, ti) + (f"_p{k}" if len(parts) > 1 else "")
+                pids.append(pid)
+                models[pid] = v.model
+                key = logic._translate_key(part, v)
+                if (hit := logic.llm_cache.get(key)) is not None:
+                    stats["cache_hits"] += 1
+                    texts[pid] = hit
+                    continue
+                stats["cache_misses"] += 1
+                look, m = logic._nearest(part, v, stats)
+                if logic._reusable(m, part):
+                    texts[pid] = logic._reuse(m, part, stats)
+                    continue
+                keys[pid]    = key
+                similar[pid] = (look, m, part)
+                requests.append({"custom_id": pid,
+                                 "params": logic._update_params(part, v, m) if m
+                                 else logic._translate_params(part, v)})
+    return texts, keys, models, similar, plan, requests
+
+
+def _translate_batch(rows: list, state: dict, path: Path, poll: float, on_progress,
+                     stats: Counter, variants: list) -> dict:
+    # a resumed job plans again to map the results back, without counting twice
+    resumed = "translate" in state
+    texts, keys, models, similar, plan, requests = _plan_translations(
+        rows, variants, Counter() if resumed else stats)
+
+    if not resumed:
+        state["translate"] = None
+        if requests:
+            state["translate"] = logic.ant.messages.batches.create(requests=requests).id
+            state["translate_n"] = len(requests)
+            stats["batch_requests"] += len(requests)
+        state["stats"] = dict(stats)
+        _save(path, state)
+
+    if bid := state["translate"]:
+        batch = _retrieve(state, path, poll, lambda: logic.ant.messages.batches.retrieve(bid))
+        c = batch.request_counts
+        on_progress(c.succeeded + c.errored + c.canceled + c.expired, 2 * state["translate_n"])
+        if batch.processing_status != "ended":
+            _save(path, state)
+            raise Pending(poll)
+
+        for entry in logic.ant.messages.batches.results(bid):
+            if entry.custom_id not in keys:      # cached by another job since
+                continue
+            if entry.result.type == "succeeded":
+                text_out = logic._message_text(entry.result.message)
+                logic._record_usage(stats, entry.result.message.usage,
+                                    model=models[entry.custom_id])
+                logic.llm_cache.set(keys[entry.custom_id], text_out)
+                look, m, part = similar[entry.custom_id]
+                # a batch has no per-request latency: an update saves no time here
+                logic._indexed(keys[entry.custom_id], look, m, part, text_out,
+                               m.seconds if m else 0.0, stats)
+            else:
+                text_out = f"[Translation Error] batch request {entry.result.type}"
+                metrics.inc("sqlsite_llm_errors_total", provider="anthropic",
+                            model=models[entry.custom_id], type=f"batch_{entry.result.type}")
+            texts[entry.custom_id] = text_out
+
+    missing = "[Translation Error] missing batch result"
+    return {cid: texts.get(pids[0], missing) if len(pids) == 1
+            else logic._merge_translations([texts.get(p, missing) for p in pids])
+            for cid, pids in plan.items()}
+
+
+def _evaluate_batch(texts: dict, state: dict, path: Path, poll: float, on_progress,
+                    stats: Counter) -> dict:
+    resumed = "evaluate" in state
+    count   = Counter() if resumed else stats
+    evals, keys, lines, first = {}, {}, [], {}
+    for cid, text_out in texts.items():
+        if text_out.startswith("[Translation Error]"):
+            continue                             # the row is re-queued, not evaluated
+        if text_out in first:                    # same text from another variant
+            count["evals_shared"] += 1
+            continue
+        first[text_out] = cid
+        key = logic._eval_key(text_out)
+        if (hit := logic.llm_cache.get(key)) is not None:
+            count["cache_hits"] += 1
+            evals[cid] = hit
+            continue
+        count["cache_misses"] += 1
+        keys[cid] = key
+        lines.append(json.dumps({
+            "custom_id": cid, "method": "POST", "url": "/v1/chat/completions",
+            "body": logic._eval_params(text_out)}))
+
+    if not resumed:
+        state["evaluate"] = None
+        if lines:
+            upload = logic.oa.files.create(
+                file=("evaluations.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+            state["evaluate"] = logic.oa.batches.create(
+                input_file_id=upload.id, endpoint="/v1/chat/completions",
+                completion_window="24h").id
+            state["evaluate_n"] = len(lines)
+            stats["batch_requests"] += len(lines)
+        state["stats"] = dict(stats)
+        _save(path, state)
+    if not (bid := state["evaluate"]):
+        return _share(evals, texts, first)
+
+    batch = _retrieve(state, path, poll, lambda: logic.oa.batches.retrieve(bid))
+    c, n  = batch.request_counts, state["evaluate_n"]
+    on_progress(n + (c.completed + c.failed if c else 0), 2 * n)
+    if batch.status not in _OA_DONE:
+        _save(path, state)
+        raise Pending(poll)
+
+    if batch.output_file_id:
+        for line in logic.oa.files.content(batch.output_file_id).text.splitlines():
+            item = json.loads(line)
+            if item["custom_id"] not in keys:
+                continue
+            body = (item.get("response") or {}).get("body") or {}
+            if item.get("error") or not body.get("choices"):
+                metrics.inc("sqlsite_llm_errors_total", provider="openai",
+                            model=logic.OA_MODEL, type="batch_error")
+                evals[item["custom_id"]] = f"[Evaluation Error] {item.get('error')}"
+                continue
+            raw_eval = body["choices"][0]["message"]["content"].strip()
+            logic._record_usage(stats, body.get("usage"), "openai")
+            logic.llm_cache.set(keys[item["custom_id"]], raw_eval)
+            evals[item["custom_id"]] = raw_eval
+    return _share(evals, texts, first)
+
+
+def _share(evals: dict, texts: dict, first: dict) -> dict:
+    """Copy each evaluation to the other ids whose translation was identical."""
+    for cid, text_out in texts.items():
+        if cid not in evals and first.get(text_out) in evals:
+            evals[cid] = evals[first[text_out]]
+    return evals
+
+
+def run_rows_batch(rows, state_path, poll: float | None = None, on_progress=None,
+                   stats: Counter | None = None, sink=None, on_fail=None,
+                   grid: list | None = None):
+    """
+    Batch-API counterpart of ``logic.run_rows`` with the same return shape,
+    sink, ``on_fail`` and *grid*: a row with an errored batch request is left out.
+
+    Nothing waits here.  Each call submits what is not submitted yet or
+    reads the running batch's status once, and raises ``Pending`` while it
+    runs, so the caller can come back later (the task re-schedules itself).
+    The batch ids, the fetched translations and the counters so far live in
+    the *state_path* JSON file, so a retried or redelivered task resumes
+    the same batches instead of paying for new ones.  The file is removed
+    once the rows are out.
+    """
+    rows  = list(rows)
+    path  = Path(state_path)
+    poll  = POLL_SECONDS if poll is None else poll
+    stats = Counter() if stats is None else stats
+    variants = grid or logic.default_variants()
+    on_progress = on_progress or (lambda done, total: None)
+
+    state = _load(path)
+    run   = Counter(state.get("stats") or {})     # this job's batch counters, every call
+    if "texts" not in state:
+        state["texts"] = _translate_batch(rows, state, path, poll, on_progress, run, variants)
+        state["stats"] = dict(run)
+        _save(path, state)
+    texts = state["texts"]
+    evals = _evaluate_batch(texts, state, path, poll, on_progress, run)
+    stats.update(run)
+
+    trans_rows, eval_rows = [], []
+    for row in rows:
+        row_trans, row_evals, error = [], [], None
+        for ti, v in enumerate(variants):
+            cid = _cid(row, ti)
+            text_out = texts.get(cid, "[Translation Error] missing batch result")
+            raw_eval = evals.get(cid, "[Evaluation Error] missing batch result")
+            if text_out.startswith("[Translation Error]"):
+                error = text_out
+            elif raw_eval.startswith("[Evaluation Error]"):
+                error = raw_eval
+            trans, evs = logic._row_records(row, v, text_out, raw_eval, stats,
+                                            tagged=grid is not None)
+            row_trans += trans
+            row_evals += evs
+        if error:
+            stats["failed_rows"] += 1
+            if on_fail:
+                on_fail(row, error)
+        elif sink:
+            sink(row, row_trans, row_evals)
+        else:
+            trans_rows += row_trans
+            eval_rows  += row_evals
+    path.unlink(missing_ok=True)
+    return trans_rows, eval_rows
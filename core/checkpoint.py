@@ -0,0 +1,117 @@
+# core/checkpoint.py
+"""
+Append-only JSONL checkpoints in the job directory.
+
+Every finished row is written (and fsynced) as one line
+``{"idx": …, "sql_hash": …, "trans": [...], "eval": [...]}`` the moment it
+completes, so a retried task with the same job directory skips rows that
+are already paid for.  Rows are read back in ``idx`` order through a small offset index;
+the records themselves are never all held in memory.
+
+Rows that still fail after the call retries go to a ``FailedRows`` queue
+next to the checkpoint instead of into the results, for a targeted re-run.
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _scan(self):
+        """Yield (offset, record) for every complete line; a torn tail is ignored."""
+        if not self.path.exists():
+            return
+        with self.path.open("rb") as fh:
+            offset = 0
+            for line in fh:
+                if line.endswith(b"\n"):
+                    try:
+                        yield offset, json.loads(line)
+                    except ValueError:
+                        pass
+                offset += len(line)
+
+    def records(self):
+        """Every complete record, in file order."""
+        for _, rec in self._scan():
+            yield rec
+
+    def index(self) -> dict:
+        """idx -> byte offset of its record (last write wins)."""
+        return {rec["idx"]: off for off, rec in self._scan()}
+
+    def done(self) -> set:
+        """Indexes already finished; also cuts off a torn tail from a crash."""
+        if self.path.exists():
+            with self.path.open("rb+") as fh:
+                good = sum(len(line) for line in fh if line.endswith(b"\n"))
+                fh.truncate(good)
+        return set(self.index())
+
+    def read_from(self, offset: int, limit: int):
+        """Up to *limit* complete records after byte *offset*; returns (records, new offset)."""
+        records = []
+        if not self.path.exists():
+            return records, offset
+        with self.path.open("rb") as fh:
+            fh.seek(offset)
+            while len(records) < limit:
+                line = fh.readline()
+                if not line.endswith(b"\n"):          # EOF or a row still being written
+                    break
+                offset += len(line)
+                records.append(json.loads(line))
+        return records, offset
+
+    def append(self, row: dict, trans: list, evals: list) -> None:
+        line = json.dumps({"idx": row["idx"], "sql_hash": row.get("sql_hash"),
+                           "trans": trans, "eval": evals},
+                          ensure_ascii=False, default=str)
+        with self.path.open("a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+def iter_results(checkpoints):
+    """Yield (trans, evals) per row in idx order across one or more checkpoints."""
+    where = {}
+    for ck in checkpoints:
+        where.update({idx: (ck.path, off) for idx, off in ck.index().items()})
+
+    handles = {}
+    try:
+        for idx in sorted(where):
+            path, off = where[idx]
+            fh = handles.get(path) or handles.setdefault(path, path.open("rb"))
+            fh.seek(off)
+            rec = json.loads(fh.readline())
+            yield rec["trans"], rec["eval"]
+    finally:
+        for fh in handles.values():
+            fh.close()
+
+
+class FailedRows:
+    """``failed*.jsonl``: one ``{"row": …, "error": …}`` line per failed row."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def append(self, row: dict, error: str) -> None:
+        line = json.dumps({"row": row, "error": error}, ensure_ascii=False, default=str)
+        with self.path.open("a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+    def rows(self) -> list:
+        if not self.path.exists():
+            return []
+        with self.path.open(encoding="utf-8") as fh:
+            return [json.loads(line)["row"] for line in fh if line.strip()]
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
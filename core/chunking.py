@@ -0,0 +1,65 @@
+# core/chunking.py
+"""
+Statement-level splitting of oversized SQL rows.
+
+A row whose SQL is estimated above the token budget is cut at statement
+boundaries (``sqlparse.parse`` keeps every character, so line offsets stay
+exact) and packed greedily into parts under the budget; a single statement
+that is still too large is cut between lines.  Each part is a normal job row
+whose ``line_spec`` is its own absolute range inside the upload.
+"""
+
+import sqlparse
+
+from .ratelimit import estimate_tokens
+
+
+def _pieces(sql: str, budget: int):
+    """(0-based line offset, text) per statement, or per line window for huge ones."""
+    line = 0
+    for stmt in sqlparse.parse(sql):
+        text = str(stmt)
+        if estimate_tokens(text) <= budget:
+            yield line, text
+        else:
+            for i, ln in enumerate(text.splitlines(keepends=True)):
+                yield line + i, ln
+        line += text.count("\n")
+
+
+def split_sql(sql: str, budget: int) -> list:
+    """Pack statements into [(line offset, text)] parts of at most ~*budget* tokens."""
+    packed, start, cur = [], 0, ""
+    for off, text in _pieces(sql, budget):
+        if cur and estimate_tokens(cur + text) > budget:
+            packed.append((start, cur))
+            cur = ""
+        if not cur:
+            start = off
+        cur += text
+    if cur:
+        packed.append((start, cur))
+
+    parts = []
+    for off, text in packed:
+        body = text.lstrip()
+        off += text[:len(text) - len(body)].count("\n")
+        body = body.rstrip()
+        if body:
+            parts.append((off, body))
+    return parts
+
+
+def split_row(row: dict, budget: int) -> list:
+    """Sub-rows of *row* with their own absolute line ranges ([row] if it fits)."""
+    parts = split_sql(row["sql_code"], budget)
+    if len(parts) <= 1:
+        return [row]
+    base = {k: v for k, v in row.items() if k != "copies"}
+    subs = []
+    for k, (off, text) in enumerate(parts):
+        first = row["ln_start"] + off
+        last  = first + text.count("\n")
+        subs.append({**base, "sql_code": text, "part": k,
+                     "line_spec": f"(lines {first}-{last})"})
+    return subs
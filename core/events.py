@@ -0,0 +1,70 @@
+# core/events.py
+"""
+Job progress events over Redis pub/sub.
+
+The worker publishes the same JSON the polling endpoint returns on channel
+``job:<id>`` whenever progress changes; ``views.progress_stream`` relays it
+to the browser as Server-Sent Events.  Publishing is best effort – the cache
+value stays the source of truth for ``views.progress``.
+"""
+
+import json
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+_redis = None
+
+
+def channel(job_id) -> str:
+    return f"job:{job_id}"
+
+
+FAILED = -1  # progress value of a job that stopped for good (summary carries "error")
+
+
+def job_status(job_id, pct, summary=None, queue=None) -> dict:
+    """
+    Progress payload shared by the polling endpoint and the SSE stream;
+    *queue* (``scheduler.queue_state``) marks a job still waiting to start.
+    """
+    if pct is None:
+        return {"status": "unknown"}
+    if queue:
+        return {"status": "queued", "progress": 0, **queue}
+    if pct == FAILED:
+        return {"status": "failed", "error": (summary or {}).get("error")}
+    if pct == 100:
+        return {"status": "done", "progress": 100,
+                "zip_url": f"/api/jobs/{job_id}/download/", "summary": summary}
+    return {"status": "running", "progress": pct}
+
+
+def publish(job_id, payload: dict) -> None:
+    global _redis
+    try:
+        if _redis is None:
+            import redis
+
+            _redis = redis.Redis.from_url(settings.PROGRESS_REDIS_URL)
+        _redis.publish(channel(job_id), json.dumps(payload))
+    except Exception as e:                       # progress must never fail a job
+        log.warning("progress publish failed for %s: %s", job_id, e)
+
+
+@contextmanager
+def subscribe(job_id):
+    """``with subscribe(id) as pubsub``: a redis PubSub on the job channel."""
+    import redis
+
+    conn   = redis.Redis.from_url(settings.PROGRESS_REDIS_URL)
+    pubsub = conn.pubsub()
+    try:
+        pubsub.subscribe(channel(job_id))
+        yield pubsub
+    finally:
+        pubsub.reset()
+        conn.connection_pool.disconnect()
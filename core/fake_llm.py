@@ -0,0 +1,293 @@
+# core/fake_llm.py
+"""
+Local stand-in for the Anthropic and OpenAI HTTP APIs (messages, chat
+completions and both batch APIs), so jobs and benchmarks can run offline
+without spending API money:
+
+    python -m core.fake_llm --port 8765 --latency-ms 300 --rate-limit 0.02
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 \\
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 celery -A sql_site worker
+
+Interactive calls sleep for a log-normal latency (median *latency_ms*,
+spread *latency_sigma*) and a *rate_limit* fraction of them is answered
+with 429 and a ``retry-after-ms`` header.  A packed evaluation gets one
+answer per ``[ID: ...]`` item, less a *pack_drop* fraction of them (which
+exercises the split-and-retry path).
+
+Answers are canned (brace format, line range copied from the request; a
+tool call / JSON-schema object when the request asks for one) and
+a cache-marked system prefix is reported as a prompt-cache write the first
+time and a read afterwards.  A batch reports "in progress" *batch_polls*
+times (once by default) and is finished on the next poll, which exercises
+the polling loop.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import UTC, datetime
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+
+_ids = itertools.count(1)
+_cached_prefixes = set()
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+def translation_text(system: str, user: str) -> str:
+    m    = re.search(r"\(lines \d+-\d+\)", f"{system}\n{user}")
+    span = m.group(0) if m else ""
+    head = user.split("SQL Code:", 1)[-1].strip().splitlines()[:1] or [""]
+    return (f"{{Objective: Stub objective for `{head[0][:60]}` {span}}}\n"
+            f"{{Business Rules: Stub business rules {span}}}\n"
+            f"{{Execution Steps: Stub execution steps {span}}}")
+
+
+def evaluation_text() -> str:
+    return ("{ACCURACY: 1; Accuracy Confidence: 90%; Explanation: stub}\n"
+            "{CONCISENESS: 1; Conciseness Confidence: 85%; Explanation: stub}\n"
+            "{COMPLETENESS: 1; Completeness Confidence: 80%; Explanation: stub}")
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(b.get("text", "") for b in content)
+
+
+def anthropic_message(params: dict) -> dict:
+    user   = _text(params["messages"][-1]["content"])
+    system = params.get("system") or ""
+    text   = translation_text(_text(system), user)
+    if params.get("tools"):
+        fields  = re.findall(r"\{[^:]+: (.*?)\}$", text, re.M)
+        content = [{"type": "tool_use", "id": f"toolu_{next(_ids)}",
+                    "name": params["tools"][0]["name"],
+                    "input": dict(zip(("objective", "business_rules", "execution_steps"), fields))}]
+    else:
+        content = [{"type": "text", "text": text}]
+    usage  = {"input_tokens": len(user) // 4, "output_tokens": len(text) // 4,
+              "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+    if isinstance(system, list) and any("cache_control" in b for b in system):
+        prefix = _text(system)
+        hit    = "cache_read_input_tokens" if prefix in _cached_prefixes else "cache_creation_input_tokens"
+        usage[hit] = len(prefix) // 4
+        _cached_prefixes.add(prefix)
+    else:
+        usage["input_tokens"] += len(_text(system)) // 4
+    return {"id": f"msg_{next(_ids)}", "type": "message", "role": "assistant",
+            "model": params.get("model"), "content": content,
+            "stop_reason": "tool_use" if params.get("tools") else "end_turn", "stop_sequence": None, "usage": usage}
+
+
+_METRICS = {m: {"score": 1, "confidence": c, "explanation": "stub"}
+            for m, c in (("accuracy", 90), ("conciseness", 85), ("completeness", 80))}
+
+
+def openai_completion(body: dict, pack_drop: float = 0.0) -> dict:
+    schema = body.get("response_format", {}).get("type") == "json_schema"
+    ids    = re.findall(r"^\[ID: ([\w-]+)\]$", _text(body["messages"][-1]["content"]), re.M)
+    if not ids:
+        text = json.dumps(_METRICS) if schema else evaluation_text()
+    else:
+        ids  = [i for i in ids if random.random() >= pack_drop]
+        text = (json.dumps({"items": [{"id": i, **_METRICS} for i in ids]}) if schema
+                else "\n".join(f"[ID: {i}]\n{evaluation_text()}" for i in ids))
+    return {"id": f"chatcmpl-{next(_ids)}", "object": "chat.completion",
+            "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text) // 4,
+                      "total_tokens": len(text) // 4}}
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    # shared across handler instances: id -> object
+    ant_batches: ClassVar[dict] = {}
+    oa_batches:  ClassVar[dict] = {}
+    files:       ClassVar[dict] = {}
+    lock = threading.Lock()
+
+    # interactive-call behaviour, set by serve()
+    latency_ms:    float = 0.0
+    latency_sigma: float = 0.0
+    rate_limit:    float = 0.0
+    retry_after:   float = 0.05
+    pack_drop:     float = 0.0
+    batch_polls:   int   = 1
+
+    protocol_version = "HTTP/1.1"               # keep-alive, like the real APIs
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, obj, status: int = 200, raw: bytes | None = None,
+              headers: dict | None = None) -> None:
+        body = raw if raw is not None else json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    # ── interactive calls ──────────────────────────────────────────
+    def _interactive(self, answer) -> None:
+        body = json.loads(self._body())
+        if self.latency_ms:
+            time.sleep(random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma))
+        if random.random() < self.rate_limit:
+            return self._send({"type": "error", "error": {"type": "rate_limit_error",
+                                                          "message": "stub rate limit"}},
+                              429, headers={"retry-after-ms": str(int(self.retry_after * 1000))})
+        self._send(answer(body))
+
+    # ── Anthropic message batches ──────────────────────────────────
+    def _ant_batch(self, bid: str) -> dict:
+        b = self.ant_batches[bid]
+        ended = b["polls"] >= self.batch_polls
+        b["polls"] += 1
+        n = len(b["results"])
+        return {"id": bid, "type": "message_batch",
+                "processing_status": "ended" if ended else "in_progress",
+                "request_counts": {"processing": 0 if ended else n,
+                                   "succeeded": n if ended else 0,
+                                   "errored": 0, "canceled": 0, "expired": 0},
+                "created_at": b["created_at"], "expires_at": b["created_at"],
+                "ended_at": _now() if ended else None, "archived_at": None,
+                "cancel_initiated_at": None,
+                "results_url": (f"http://{self.headers['Host']}/v1/messages/batches/{bid}/results"
+                                if ended else None)}
+
+    # ── OpenAI files + batches ─────────────────────────────────────
+    def _oa_batch(self, bid: str) -> dict:
+        b = self.oa_batches[bid]
+        done = b["polls"] >= self.batch_polls
+        b["polls"] += 1
+        return {"id": bid, "object": "batch", "endpoint": "/v1/chat/completions",
+                "input_file_id": b["input_file_id"], "completion_window": "24h",
+                "status": "completed" if done else "in_progress",
+                "created_at": b["created_at"],
+                "output_file_id": b["output_file_id"] if done else None,
+                "error_file_id": None,
+                "request_counts": {"total": b["n"], "completed": b["n"] if done else 0,
+                                   "failed": 0}}
+
+    def _upload(self) -> dict:
+        ctype = self.headers["Content-Type"].encode()
+        msg   = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + ctype + b"\r\n\r\n"
+                                                    + self._body())
+        data, name = b"", "upload.jsonl"
+        for part in msg.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                data = part.get_payload(decode=True)
+                name = part.get_filename() or name
+        fid = f"file-{next(_ids)}"
+        self.files[fid] = data
+        return {"id": fid, "object": "file", "bytes": len(data), "filename": name,
+                "created_at": int(time.time()), "purpose": "batch", "status": "processed"}
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/messages":
+            return self._interactive(anthropic_message)
+        if path == "/v1/chat/completions":
+            return self._interactive(lambda body: openai_completion(body, self.pack_drop))
+        with self.lock:
+            if path == "/v1/messages/batches":
+                reqs = json.loads(self._body())["requests"]
+                bid  = f"msgbatch_{next(_ids)}"
+                self.ant_batches[bid] = {
+                    "polls": 0, "created_at": _now(),
+                    "results": [{"custom_id": r["custom_id"],
+                                 "result": {"type": "succeeded",
+                                            "message": anthropic_message(r["params"])}}
+                                for r in reqs]}
+                return self._send(self._ant_batch(bid))
+            if path == "/v1/files":
+                return self._send(self._upload())
+            if path == "/v1/batches":
+                req  = json.loads(self._body())
+                out  = []
+                for line in self.files[req["input_file_id"]].decode().splitlines():
+                    item = json.loads(line)
+                    out.append(json.dumps({
+                        "id": f"batch_req_{next(_ids)}", "custom_id": item["custom_id"],
+                        "response": {"status_code": 200,
+                                     "body": openai_completion(item["body"], self.pack_drop)},
+                        "error": None}))
+                ofid = f"file-{next(_ids)}"
+                self.files[ofid] = "\n".join(out).encode()
+                bid = f"batch_{next(_ids)}"
+                self.oa_batches[bid] = {"polls": 0, "n": len(out), "created_at": int(time.time()),
+                                        "input_file_id": req["input_file_id"],
+                                        "output_file_id": ofid}
+                return self._send(self._oa_batch(bid))
+        self._body()
+        self._send({"error": {"type": "not_found", "message": path}}, 404)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        with self.lock:
+            if m := re.fullmatch(r"/v1/messages/batches/([\w-]+)/results", path):
+                lines = "\n".join(json.dumps(r) for r in self.ant_batches[m.group(1)]["results"])
+                return self._send(None, raw=lines.encode())
+            if m := re.fullmatch(r"/v1/messages/batches/([\w-]+)", path):
+                return self._send(self._ant_batch(m.group(1)))
+            if m := re.fullmatch(r"/v1/batches/([\w-]+)", path):
+                return self._send(self._oa_batch(m.group(1)))
+            if m := re.fullmatch(r"/v1/files/([\w-]+)/content", path):
+                return self._send(None, raw=self.files[m.group(1)])
+        self._send({"error": {"type": "not_found", "message": path}}, 404)
+
+
+def _configure(latency_ms: float, latency_sigma: float, rate_limit: float,
+               pack_drop: float = 0.0, batch_polls: int = 1) -> None:
+    FakeLLMHandler.latency_ms    = latency_ms
+    FakeLLMHandler.latency_sigma = latency_sigma
+    FakeLLMHandler.rate_limit    = rate_limit
+    FakeLLMHandler.pack_drop     = pack_drop
+    FakeLLMHandler.batch_polls   = batch_polls
+
+
+def serve(port: int = 0, host: str = "127.0.0.1", latency_ms: float = 0.0,
+          latency_sigma: float = 0.0, rate_limit: float = 0.0, pack_drop: float = 0.0,
+          batch_polls: int = 1):
+    """Start the stub on a background thread; returns (server, base_url)."""
+    _configure(latency_ms, latency_sigma, rate_limit, pack_drop, batch_polls)
+    server = ThreadingHTTPServer((host, port), FakeLLMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="median interactive latency")
+    ap.add_argument("--latency-sigma", type=float, default=0.0, help="log-normal spread")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="fraction answered with 429")
+    ap.add_argument("--pack-drop", type=float, default=0.0,
+                    help="fraction of packed evaluation items left out")
+    ap.add_argument("--batch-polls", type=int, default=1,
+                    help="polls a batch answers 'in progress' before it ends")
+    args = ap.parse_args()
+    _configure(args.latency_ms, args.latency_sigma, args.rate_limit, args.pack_drop,
+               args.batch_polls)
+    print(f"fake LLM API on http://{args.host}:{args.port}")
+    ThreadingHTTPServer((args.host, args.port), FakeLLMHandler).serve_forever()
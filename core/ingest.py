@@ -0,0 +1,189 @@
+# core/ingest.py
+"""
+Streaming readers for uploaded SQL.
+
+The view only spools the upload into the job directory; ``run_translation``
+turns it into the JSONL payload (core.payload) with ``to_payload``, one row
+at a time, so memory stays bounded by the longest single SQL snippet.
+
+    xlsx / xlsm   openpyxl read-only ``iter_rows``; the ``sql_code`` column,
+                  else the first one (the first row is always the header)
+    csv           same column rule
+    sql / txt     one row per statement, or the whole file as one row
+    zip           every ``.sql`` member in name order, split like ``.sql``
+
+``source.sql`` (the rows joined by newlines, the numbering behind the
+``(lines a-b)`` ranges) and its line index are written on the same pass.
+"""
+
+import csv
+import io
+import os
+from pathlib import Path
+from zipfile import BadZipFile, ZipFile
+
+from sqlparse import tokens as T
+from sqlparse.engine import FilterStack
+
+from .payload import write_payload
+from .sourcefile import SourceWriter
+
+FORMATS = ("xlsx", "xlsm", "csv", "sql", "txt", "zip")
+SPLITS  = ("statement", "file")
+COLUMN  = "sql_code"
+
+csv.field_size_limit(64 * 2**20)          # one cell may hold a long script
+
+
+class IngestError(ValueError):
+    """The upload cannot be read as SQL rows; reported to the user, not retried."""
+
+
+def upload_format(filename: str) -> str | None:
+    ext = Path(filename).suffix.lower().lstrip(".")
+    return ext if ext in FORMATS else None
+
+
+def _column(header) -> int:
+    names = [str(h).strip().lower() if h is not None else "" for h in header]
+    return names.index(COLUMN) if COLUMN in names else 0
+
+
+def _cells(rows):
+    """Values of the SQL column below the header row, blanks skipped."""
+    header = next(rows, None)
+    if header is None:
+        return
+    col = _column(header)
+    for r in rows:
+        v = r[col] if col < len(r) else None
+        if v is not None and str(v).strip():
+            yield str(v)
+
+
+def _xlsx(path):
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(path, read_only=True, data_only=True)
+    except (BadZipFile, KeyError, OSError) as e:
+        raise IngestError(f"not a readable workbook: {e}") from e
+    try:
+        yield from _cells(wb.worksheets[0].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def _csv(path):
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as fh:
+        yield from _cells(csv.reader(fh))
+
+
+def _split(text: str) -> list:
+    """Ungrouped sqlparse statements (what ``sqlparse.split`` uses, minus the strings)."""
+    return list(FilterStack().run(text))
+
+
+def _code(stmt) -> list:
+    return [t for t in stmt.flatten() if not t.is_whitespace and t.ttype not in T.Comment]
+
+
+def _terminated(stmts: list) -> bool:
+    """True when the last statement ends with a ``;`` outside strings and comments."""
+    last = _code(stmts[-1]) if stmts else []
+    return bool(last) and last[-1].ttype is T.Punctuation and last[-1].value == ";"
+
+
+def _statements(fh):
+    """
+    Split a text stream into statements, a few lines at a time: lines pile
+    up until one ends in ``;`` outside any string or comment.  Comment-only
+    pieces are dropped.
+    """
+    buf = []
+    for line in fh:
+        buf.append(line)
+        if not line.rstrip().endswith(";"):
+            continue
+        stmts = _split("".join(buf))
+        if _terminated(stmts):
+            yield from (str(st).strip() for st in stmts if _code(st))
+            buf = []
+    if buf:
+        yield from (str(st).strip() for st in _split("".join(buf)) if _code(st))
+
+
+def _sql(fh, split: str):
+    if split == "file":
+        text = fh.read()
+        if text.strip():
+            yield text
+        return
+    yield from _statements(fh)
+
+
+def _sql_file(path, split):
+    with open(path, encoding="utf-8-sig", errors="replace") as fh:
+        yield from _sql(fh, split)
+
+
+def _zip(path, split):
+    try:
+        zf = ZipFile(path)
+    except BadZipFile as e:
+        raise IngestError(f"not a zip archive: {e}") from e
+    with zf:
+        for info in sorted(zf.infolist(), key=lambda i: i.filename):
+            name = info.filename
+            if info.is_dir() or not name.lower().endswith(".sql") or "__MACOSX" in name:
+                continue
+            with zf.open(info) as raw:
+                yield from _sql(io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace"),
+                                split)
+
+
+def read_upload(path, split: str = "statement"):
+    """Yield the SQL snippets of an upload, picking the reader by extension."""
+    fmt = upload_format(str(path))
+    if fmt is None:
+        raise IngestError(f"unsupported file type; use one of {', '.join(FORMATS)}")
+    if split not in SPLITS:
+        raise IngestError(f"split must be one of {', '.join(SPLITS)}")
+    if fmt in ("xlsx", "xlsm"):
+        rows = _xlsx(path)
+    elif fmt == "csv":
+        rows = _csv(path)
+    elif fmt == "zip":
+        rows = _zip(path, split)
+    else:
+        rows = _sql_file(path, split)
+    for sql in rows:
+        # "\n" only, so source.sql numbers lines the way iter_rows counts them
+        yield "\n".join(sql.rstrip().splitlines())
+
+
+def to_payload(upload, payload, prompt: str, split: str = "statement") -> int:
+    """
+    Stream *upload* into the job *payload* and the indexed ``source.sql``
+    beside it (core.sourcefile); returns the row count.  The files appear
+    only once complete, so a retried task either finds them or starts over.
+    """
+    payload = Path(payload)
+    part    = payload.with_name(payload.name + ".part")
+    source  = SourceWriter(payload.with_name("source.sql"))
+    try:
+        def rows():
+            for sql in read_upload(upload, split):
+                source.write_row(sql)
+                yield sql
+
+        count = write_payload(part, rows(), prompt)
+        if not count:
+            raise IngestError("no SQL found in the upload")
+    except BaseException:
+        part.unlink(missing_ok=True)
+        source.discard()
+        raise
+    source.commit()
+    os.replace(part, payload)
+    return count
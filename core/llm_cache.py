@@ -0,0 +1,91 @@
+# core/llm_cache.py
+"""
+Persistent, content-addressed cache for LLM responses.
+
+Entries live in a small SQLite file keyed by a SHA-256 of
+(model, temperature, system message, user prompt).  Reads bump the LRU
+stamp; writes periodically drop expired rows (TTL) and then the least
+recently used rows until the file is under its size cap.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key     TEXT PRIMARY KEY,
+    value   TEXT    NOT NULL,
+    size    INTEGER NOT NULL,
+    created REAL    NOT NULL,
+    used    REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache(used);
+"""
+
+
+class LLMCache:
+    EVICT_EVERY = 64          # run eviction once per N writes
+
+    def __init__(self, path: str, ttl: float, max_bytes: int, enabled: bool = True):
+        self.path      = path
+        self.ttl       = ttl
+        self.max_bytes = max_bytes
+        self.enabled   = enabled
+        self._conn     = None
+        self._lock     = threading.Lock()
+        self._writes   = 0
+
+    @staticmethod
+    def key(model: str, temperature: float, system, prompt: str) -> str:
+        blob = json.dumps([model, temperature, system, prompt], ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            db  = self._db()
+            row = db.execute("SELECT value, created FROM llm_cache WHERE key = ?",
+                             (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE llm_cache SET used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now))
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        db = self._db()
+        db.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        total, count = db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM llm_cache").fetchone()
+        while total > self.max_bytes and count:
+            # drop the oldest tenth (at least one row) per pass
+            db.execute("DELETE FROM llm_cache WHERE key IN "
+                       "(SELECT key FROM llm_cache ORDER BY used LIMIT ?)",
+                       (max(1, count // 10),))
+            total, count = db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM llm_cache").fetchone()
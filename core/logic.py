@@ -1,7 +1,30 @@
 # core/logic.py
-import os, re, time, pandas as pd
-from anthropic import Anthropic
-from openai import OpenAI
+from __future__ import annotations
+
+import asyncio, difflib, itertools, json, logging, os, threading, time
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:                                # the SDKs load with the first client
+    from anthropic import AsyncAnthropic
+    from openai import AsyncOpenAI
+
+from . import metrics
+from .checkpoint import Checkpoint, FailedRows, iter_results
+from .chunking import split_row
+from .llm_cache import LLMCache
+from .parsing import (EVAL_PACK_RESPONSE_FORMAT, EVAL_RESPONSE_FORMAT, METRICS, SECTIONS,
+                      TRANSLATION_TOOL, parse_evaluation, parse_failed, parse_translation,
+                      render_translation, split_evaluations, translation_json)
+from .payload import read_payload
+from .ratelimit import ProviderLimiter, estimate_tokens
+from .resilience import ProviderGuard
+from .similar import Lookup, Match, SimilarIndex
+from .sqlnorm import dedupe, fan_out, literals, move_spans
+from .writers import get_writer, write_file
+
+log = logging.getLogger(__name__)
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 OPENAI_API_KEY    = os.getenv("OPENAI_API_KEY")
@@ -11,117 +34,812 @@ OA_MODEL       = "gpt-4o"
 ANT_TEMPS      = [0.1]
 ANT_MAX_TOKENS = 4096
 OA_MAX_TOKENS  = 512
+OA_MAX_OUTPUT  = int(os.getenv("OA_MAX_OUTPUT_TOKENS", "16384"))   # OA_MODEL's output limit
+
+# SQL above this many (estimated) tokens is split at statement boundaries,
+# translated part by part and merged, so responses are not truncated
+ANT_CHUNK_TOKENS = int(os.getenv("ANT_CHUNK_TOKENS", "3000"))
+
+# mark the shared instructions + prompt prefix for Anthropic prompt caching
+ANT_PROMPT_CACHE = os.getenv("ANT_PROMPT_CACHE", "True").lower() in {"1", "true", "yes"}
+
+# opt-in structured output: a forced tool call for translations and a
+# JSON-schema response for evaluations, decoded without free-text parsing
+LLM_STRUCTURED = os.getenv("LLM_STRUCTURED", "False").lower() in {"1", "true", "yes"}
+
+# translations evaluated per OpenAI request (1 = one each); a pack waits up
+# to EVAL_PACK_WAIT_MS for other rows' translations before it is sent
+EVAL_PACK      = int(os.getenv("EVAL_PACK", "1"))
+EVAL_PACK_WAIT = float(os.getenv("EVAL_PACK_WAIT_MS", "50")) / 1000
+
+# rows kept in flight at once (1 = serial) and per-provider budgets;
+# Anthropic meters input tokens/min, OpenAI also counts max_tokens
+MAX_IN_FLIGHT  = int(os.getenv("LLM_MAX_IN_FLIGHT", "1"))
+ANT_RPM        = float(os.getenv("ANT_RPM", "50"))
+ANT_TPM        = float(os.getenv("ANT_TPM", "40000"))
+OA_RPM         = float(os.getenv("OA_RPM",  "500"))
+OA_TPM         = float(os.getenv("OA_TPM",  "30000"))
+
+# transient failures (429/529/5xx, connection errors) are retried with
+# jittered backoff; BREAKER_FAILURES in a row pause a provider for
+# BREAKER_COOLDOWN seconds; LLM_HEDGE fires a duplicate past p95 latency
+LLM_RETRIES      = int(os.getenv("LLM_RETRIES", "4"))
+LLM_BACKOFF      = float(os.getenv("LLM_BACKOFF", "1"))
+LLM_BACKOFF_MAX  = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_HEDGE        = os.getenv("LLM_HEDGE", "False").lower() in {"1", "true", "yes"}
+
+# persistent response cache shared by translation and evaluation calls
+LLM_CACHE_PATH   = os.getenv("LLM_CACHE_PATH",
+                             str(Path(__file__).resolve().parent.parent / "llm_cache.sqlite3"))
+LLM_CACHE_TTL    = float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 86400
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+LLM_CACHE_ON     = os.getenv("LLM_CACHE", "True").lower() in {"1", "true", "yes"}
+
+# near-duplicate reuse (core.similar): a cache miss whose SQL is at least
+# SIMILAR_UPDATE similar (estimated Jaccard of token shingles) to an indexed
+# translation sends that translation and the SQL diff for a short update;
+# at SIMILAR_REUSE, and only with the very same literals (a date or an id
+# apart is updated), the translation is reused as is
+SIMILAR_PATH        = os.getenv("SIMILAR_INDEX_PATH",
+                                str(Path(__file__).resolve().parent.parent / "similar_index.sqlite3"))
+SIMILAR_ON          = os.getenv("SIMILAR_INDEX", "True").lower() in {"1", "true", "yes"}
+SIMILAR_UPDATE      = float(os.getenv("SIMILAR_UPDATE", "0.7"))
+SIMILAR_REUSE       = float(os.getenv("SIMILAR_REUSE", "1.0"))
+SIMILAR_MAX_ENTRIES = int(os.getenv("SIMILAR_MAX_ENTRIES", "200000"))
+
+# one keep-alive pool per process and kind (sync / async) shared by both
+# providers; HTTP/2 when the optional h2 package is installed
+LLM_HTTP2       = os.getenv("LLM_HTTP2", "True").lower() in {"1", "true", "yes"}
+LLM_POOL_SIZE   = int(os.getenv("LLM_POOL_SIZE", "100"))
+LLM_KEEPALIVE   = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+
+ant_limit = ProviderLimiter(ANT_RPM, ANT_TPM)
+oa_limit  = ProviderLimiter(OA_RPM,  OA_TPM)
+
+ant_guard = ProviderGuard("ant", LLM_RETRIES, LLM_BACKOFF, LLM_BACKOFF_MAX,
+                          BREAKER_FAILURES, BREAKER_COOLDOWN, LLM_HEDGE)
+oa_guard  = ProviderGuard("oa",  LLM_RETRIES, LLM_BACKOFF, LLM_BACKOFF_MAX,
+                          BREAKER_FAILURES, BREAKER_COOLDOWN, LLM_HEDGE)
+
+llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_MB * 2**20, LLM_CACHE_ON)
+sql_index = SimilarIndex(SIMILAR_PATH, LLM_CACHE_TTL, SIMILAR_MAX_ENTRIES, SIMILAR_ON)
+
+
+# ─────────────────────────── provider clients ──────────────────────
+# Nothing is built at import: the web process never pays for the SDKs.
+# The first use creates this process's clients (a forked worker notices
+# the new pid and starts over): sync ones for the batch APIs, async ones
+# living on a long-lived event-loop thread, so every run_rows call reuses
+# the same warm connections instead of opening a pool per call.
+_proc, _proc_lock = {}, threading.Lock()
+
+
+def _state() -> dict:
+    if _proc.get("pid") != os.getpid():
+        _proc.clear()
+        _proc["pid"] = os.getpid()
+    return _proc
+
+
+def _http_options() -> dict:
+    import httpx
+
+    try:
+        import h2  # noqa: F401
+        http2 = LLM_HTTP2
+    except ImportError:
+        http2 = False
+    return {"http2": http2,
+            "limits": httpx.Limits(max_connections=LLM_POOL_SIZE,
+                                   max_keepalive_connections=LLM_POOL_SIZE,
+                                   keepalive_expiry=LLM_KEEPALIVE)}
+
+
+def sync_clients() -> tuple:
+    """(Anthropic, OpenAI) of this process, built on first use."""
+    with _proc_lock:
+        st = _state()
+        if "ant" not in st:
+            from anthropic import Anthropic, DefaultHttpxClient
+            from openai import OpenAI
+
+            http = DefaultHttpxClient(**_http_options())
+            st["ant"] = Anthropic(api_key=ANTHROPIC_API_KEY, http_client=http)
+            st["oa"]  = OpenAI(api_key=OPENAI_API_KEY, http_client=http)
+        return st["ant"], st["oa"]
+
+
+def __getattr__(name: str):
+    # ``logic.ant`` / ``logic.oa`` (the batch path) resolve lazily; assigning
+    # them (the benchmark does) overrides the process clients
+    if name in ("ant", "oa"):
+        return sync_clients()[name == "oa"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _loop() -> asyncio.AbstractEventLoop:
+    with _proc_lock:
+        st = _state()
+        if "loop" not in st:
+            st["loop"] = asyncio.new_event_loop()
+            threading.Thread(target=st["loop"].run_forever, name="llm-loop", daemon=True).start()
+        return st["loop"]
+
+
+def _async_clients() -> tuple:
+    """(AsyncAnthropic, AsyncOpenAI) bound to the process loop; call on that loop."""
+    st = _state()
+    if "aant" not in st:
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+        from openai import AsyncOpenAI
+
+        # retries are left to the provider guards
+        http = DefaultAsyncHttpxClient(**_http_options())
+        st["aant"] = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0, http_client=http)
+        st["aoa"]  = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, http_client=http)
+    return st["aant"], st["aoa"]
+
+
+def _run(coro):
+    """Run *coro* on the process loop and wait for it (cancelled if the caller is interrupted)."""
+    fut = asyncio.run_coroutine_threadsafe(coro, _loop())
+    try:
+        return fut.result()
+    except BaseException:
+        fut.cancel()
+        raise
+
+
+async def _ready() -> None:
+    _async_clients()
 
-ant = Anthropic(api_key=ANTHROPIC_API_KEY)
-oa  = OpenAI   (api_key=OPENAI_API_KEY)
-
-
-def _parse_eval_block(text: str) -> dict:
-    mkeys = ["Accurate", "Accurate Confidence (%)", "Accurate Explanation",
-             "Concise",  "Concise Confidence (%)",  "Concise Explanation",
-             "Complete", "Complete Confidence (%)", "Complete Explanation"]
-    out = {k: None for k in mkeys}
-
-    for blk in re.findall(r"\{([^}]*)\}", text.replace("}\n{", "}|{")):
-        val  = re.search(r"\b([01])\b", blk)
-        conf = re.search(r"(\d+)%", blk)
-        expl = re.search(r"Explanation\s*:\s*(.+)", blk, re.I)
-        key  = blk.split(':', 1)[0].strip().lower()
-        if key.startswith("accur"):
-            out.update({
-                "Accurate": val.group(1) if val else None,
-                "Accurate Confidence (%)": conf.group(1) if conf else None,
-                "Accurate Explanation": expl.group(1).strip() if expl else None})
-        elif key.startswith("concise"):
-            out.update({
-                "Concise": val.group(1) if val else None,
-                "Concise Confidence (%)": conf.group(1) if conf else None,
-                "Concise Explanation": expl.group(1).strip() if expl else None})
-        elif key.startswith("complete"):
-            out.update({
-                "Complete": val.group(1) if val else None,
-                "Complete Confidence (%)": conf.group(1) if conf else None,
-                "Complete Explanation": expl.group(1).strip() if expl else None})
+
+def warm_up() -> None:
+    """Build the clients and the loop ahead of the first job (celery worker hook)."""
+    sync_clients()
+    _run(_ready())
+
+
+# ─────────────────────────── experiment grid ───────────────────────
+
+
+class Variant(NamedTuple):
+    """One translation setting; a job runs every row under each of its variants."""
+    model: str
+    temperature: float
+    max_tokens: int
+
+    @property
+    def label(self) -> str:
+        return f"{self.model} t={self.temperature:g} max={self.max_tokens}"
+
+
+GRID_MAX = 12   # variants per job at most
+
+
+def default_variants() -> list:
+    """ANT_MODEL at each of ANT_TEMPS: the grid of a plain (non-experiment) job."""
+    return [Variant(ANT_MODEL, t, ANT_MAX_TOKENS) for t in ANT_TEMPS]
+
+
+def parse_grid(spec, models=None, max_tokens: int = ANT_MAX_TOKENS,
+               max_variants: int = GRID_MAX) -> list:
+    """
+    Variants from a list of ``{"model", "temperature", "max_tokens"}`` dicts
+    (missing keys default to ANT_MODEL / ANT_TEMPS[0] / ANT_MAX_TOKENS) or
+    from ``{"models": [...], "temperatures": [...], "max_tokens": [...]}``,
+    expanded as a cross product.  Duplicates are dropped; ValueError if invalid,
+    for a model outside *models* (default: ANT_MODEL only), max_tokens above
+    *max_tokens* or more than *max_variants* variants.
+    """
+    allowed = set(models or ()) | {ANT_MODEL}
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    if isinstance(spec, dict):
+        axes = (spec.get("models") or [ANT_MODEL], spec.get("temperatures") or ANT_TEMPS[:1],
+                spec.get("max_tokens") or [ANT_MAX_TOKENS])
+        if not all(isinstance(a, list) for a in axes):
+            raise ValueError("models, temperatures and max_tokens must be lists")
+        spec = ({"model": m, "temperature": t, "max_tokens": n}
+                for m, t, n in itertools.product(*axes))
+    elif not isinstance(spec, list) or not spec:
+        raise ValueError("grid must be a non-empty list or a models/temperatures/max_tokens dict")
+    out = []
+    for item in spec:
+        try:                                     # AttributeError: the entry is not a dict
+            v = Variant(str(item.get("model") or ANT_MODEL),
+                        float(item.get("temperature", ANT_TEMPS[0])),
+                        int(item.get("max_tokens", ANT_MAX_TOKENS)))
+        except (AttributeError, TypeError):
+            raise ValueError(f"bad grid entry {item!r}") from None
+        if v.model not in allowed:
+            raise ValueError(f"model must be one of {', '.join(sorted(allowed))}")
+        if not 0 <= v.temperature <= 1 or not 0 < v.max_tokens <= max_tokens:
+            raise ValueError(f"bad grid entry {item!r} (temperature 0-1, max_tokens 1-{max_tokens})")
+        if v not in out:
+            out.append(v)
+        if len(out) > max_variants:              # before a huge cross product is expanded
+            raise ValueError(f"at most {max_variants} variants per job")
     return out
 
 
-def run_analysis(sql_path: str, prompt_path: str, out_dir: str):
+def _parse_eval_block(text: str, packed: bool = False) -> dict:
+    """The metric cells of one evaluation; *packed*: {item id: metric cells} of a packed one."""
+    if packed:
+        return {i: parse_evaluation(raw) for i, raw in split_evaluations(text).items()}
+    return parse_evaluation(text)
+
+
+# ─────────────────────────── row pipeline ──────────────────────────
+def read_inputs(sql_path: str, prompt_path: str | None = None):
+    """
+    (sql_codes, prompts) from a JSONL job payload, or – when *prompt_path*
+    is given – from the legacy sql.xlsx / prompt.xlsx pair.
+    """
+    if prompt_path is None:
+        prompt, sql_codes = read_payload(sql_path)
+        return sql_codes, itertools.repeat(prompt)
+
+    import pandas as pd
+
     sql_df    = pd.read_excel(sql_path)
     prompt_df = pd.read_excel(prompt_path)
     if len(sql_df) != len(prompt_df):
         raise ValueError("SQL and Prompt files must have the same number of rows")
+    return sql_df["sql_code"], prompt_df["prompt"]
 
-    trans_rows, eval_rows = [], []
-    cum_line = 1
 
-    for idx in range(len(sql_df)):
-        sql_code  = str(sql_df.at[idx, "sql_code"]).rstrip()
-        prompt    = str(prompt_df.at[idx, "prompt"]).rstrip()
+def iter_rows(sql_codes, prompts):
+    """Yield one job row per SQL snippet with its absolute line range."""
+    cum_line = 1
+    for idx, (sql_code, prompt) in enumerate(zip(sql_codes, prompts)):
+        sql_code  = str(sql_code).rstrip()
+        prompt    = str(prompt).rstrip()
 
         ln_start  = cum_line
         ln_total  = len(sql_code.splitlines())
         cum_line += ln_total
-        line_spec = f"(lines {ln_start}-{ln_start + ln_total - 1})"
-
-        for temp in ANT_TEMPS:
-            user_prompt = f"{prompt}\n\nSQL Code:\n{sql_code}"
-            system_msg  = (
-                "You are a helpful assistant that translates SQL into business "
-                "documentation in plain English.\n"
-                "Output EXACTLY in this format (include the braces):\n"
-                "{Objective: ...}\n{Business Rules: ...}\n{Execution Steps: ...}\n"
-                "At the very end of the text inside each pair of braces, append "
-                f"the absolute SQL line range {line_spec} without changing any "
-                "other punctuation or line breaks."
-            )
+        yield {"idx": idx, "sql_code": sql_code, "prompt": prompt, "ln_start": ln_start,
+               "line_spec": f"(lines {ln_start}-{ln_start + ln_total - 1})"}
 
+
+# Static translation instructions.  Together with the job prompt they form
+# the request prefix, identical for every row, so it is cache-marked
+# (Anthropic prompt caching); the per-row line range and SQL come after it.
+TRANSLATE_SYSTEM = (
+    "You are a helpful assistant that translates SQL into business "
+    "documentation in plain English.\n"
+    "Output EXACTLY in this format (include the braces):\n"
+    "{Objective: ...}\n{Business Rules: ...}\n{Execution Steps: ...}\n"
+    "At the very end of the text inside each pair of braces, append "
+    "the absolute SQL line range given with the SQL code, written as "
+    "(lines a-b), without changing any other punctuation or line breaks."
+)
+if LLM_STRUCTURED:
+    TRANSLATE_SYSTEM = (
+        "You are a helpful assistant that translates SQL into business "
+        "documentation in plain English.  Record the objective, business "
+        "rules and execution steps with the record_translation tool, ending "
+        "each field with the absolute SQL line range given with the SQL code, "
+        "written as (lines a-b)."
+    )
+
+EVAL_SYSTEM = "You are a helpful evaluator."
+
+
+def _system_blocks(prompt: str) -> list:
+    """Cache-marked prefix: static instructions + the job prompt."""
+    last = {"type": "text", "text": prompt}
+    if ANT_PROMPT_CACHE:
+        last["cache_control"] = {"type": "ephemeral"}
+    return [{"type": "text", "text": TRANSLATE_SYSTEM}, last]
+
+
+def _user_prompt(row: dict) -> str:
+    return (f"Absolute SQL line range: {row['line_spec']}\n\n"
+            f"SQL Code:\n{row['sql_code']}")
+
+
+_ANT_USAGE = (("input", "input_tokens"), ("output", "output_tokens"),
+              ("cache_read", "cache_read_input_tokens"),
+              ("cache_write", "cache_creation_input_tokens"))
+_OA_USAGE  = (("input", "prompt_tokens"), ("output", "completion_tokens"))
+
+
+def _record_usage(stats: Counter, usage, provider: str = "anthropic",
+                  model: str | None = None) -> None:
+    """Token counters for one response (Anthropic prompt-cache reads/writes included)."""
+    if usage is None:
+        return
+    prefix, default, fields = (("ant", ANT_MODEL, _ANT_USAGE) if provider == "anthropic"
+                               else ("oa", OA_MODEL, _OA_USAGE))
+    model = model or default
+    for kind, attr in fields:
+        n = (usage.get(attr) if isinstance(usage, dict) else getattr(usage, attr, 0)) or 0
+        stats[f"{prefix}_{kind}_tokens"] += n
+        metrics.inc("sqlsite_llm_tokens_total", n, provider=provider, model=model, kind=kind)
+
+
+def _eval_prompt(text_out: str) -> str:
+    if LLM_STRUCTURED:
+        return ("Rate the translation below for accuracy, conciseness and "
+                "completeness: a 0/1 score, a confidence in percent and a short "
+                "explanation each.\n\n"
+                f"Translation:\n\"\"\"{text_out}\"\"\"")
+    return (
+        "OUTPUT EXACTLY in this format:\n"
+        "{ACCURACY: 0/1; Accuracy Confidence: n%; Explanation: ...}\n"
+        "{CONCISENESS: 0/1; Conciseness Confidence: n%; Explanation: ...}\n"
+        "{COMPLETENESS: 0/1; Completeness Confidence: n%; Explanation: ...}\n\n"
+        f"Translation:\n\"\"\"{text_out}\"\"\""
+    )
+
+
+def _eval_pack_prompt(texts: dict) -> str:
+    """One evaluation request for several translations ({item id: translation})."""
+    items = "\n\n".join(f'[ID: {i}]\nTranslation:\n"""{t}"""' for i, t in texts.items())
+    if LLM_STRUCTURED:
+        return ("Rate each translation below on its own for accuracy, conciseness "
+                "and completeness: a 0/1 score, a confidence in percent and a short "
+                "explanation each, under the item's id.\n\n" + items)
+    return (
+        "Rate each translation below on its own.  For every item write its ID "
+        "line, then EXACTLY this format:\n"
+        "[ID: ...]\n"
+        "{ACCURACY: 0/1; Accuracy Confidence: n%; Explanation: ...}\n"
+        "{CONCISENESS: 0/1; Conciseness Confidence: n%; Explanation: ...}\n"
+        "{COMPLETENESS: 0/1; Completeness Confidence: n%; Explanation: ...}\n\n" + items
+    )
+
+
+def _translate_params(row: dict, v: Variant) -> dict:
+    """messages.create() arguments for one row (shared with the batch path)."""
+    params = {"model": v.model, "max_tokens": v.max_tokens, "temperature": v.temperature,
+              "system": _system_blocks(row["prompt"]),
+              "messages": [{"role": "user",
+                            "content": [{"type": "text", "text": _user_prompt(row)}]}]}
+    if LLM_STRUCTURED:
+        params["tools"]       = [TRANSLATION_TOOL]
+        params["tool_choice"] = {"type": "tool", "name": TRANSLATION_TOOL["name"]}
+    return params
+
+
+def _translate_key(row: dict, v: Variant) -> str:
+    system = [TRANSLATE_SYSTEM, row["prompt"]]
+    if v.max_tokens != ANT_MAX_TOKENS:           # the default keeps existing entries valid
+        system.append(f"max_tokens={v.max_tokens}")
+    return llm_cache.key(v.model, v.temperature, system, _user_prompt(row))
+
+
+def _scope(row: dict, v: Variant) -> str:
+    """What two translations must share to be interchangeable: the cache key minus the SQL."""
+    return _translate_key({**row, "sql_code": "", "line_spec": ""}, v)
+
+
+def _nearest(row: dict, v: Variant, stats: Counter) -> tuple:
+    """
+    (index lookup, match) for a translation cache miss; the match is None
+    below SIMILAR_UPDATE, or when the SQL diff would be longer than the SQL.
+    """
+    if not sql_index.enabled:
+        return None, None
+    stats["similar_lookups"] += 1
+    look = sql_index.lookup(_scope(row, v), row["sql_code"])
+    m    = look.match
+    if m is None or m.similarity < SIMILAR_UPDATE:
+        return look, None
+    if not _reusable(m, row) and len(_sql_diff(m, row)) >= len(row["sql_code"]):
+        return look, None
+    return look, m
+
+
+def _reusable(m: Match | None, row: dict) -> bool:
+    """True when *m*'s translation fits *row* as is (else it is only a base for an update)."""
+    return (m is not None and m.similarity >= SIMILAR_REUSE
+            and literals(m.sql) == literals(row["sql_code"]))
+
+
+def _written_for(m: Match) -> dict:
+    """The row *m*'s translation was written for, as ``move_spans`` takes it."""
+    return {**m._asdict(), "sql_code": m.sql}
+
+
+def _reuse(m: Match, row: dict, stats: Counter) -> str:
+    stats["similar_reused"] += 1
+    stats["similar_latency_saved"] += m.seconds
+    return move_spans(m.text, _written_for(m), row)
+
+
+def _sql_diff(m: Match, row: dict) -> str:
+    return "\n".join(difflib.unified_diff(m.sql.splitlines(), row["sql_code"].splitlines(),
+                                          "previous", "current", n=1, lineterm=""))
+
+
+def _update_prompt(row: dict, m: Match) -> str:
+    return (f"Absolute SQL line range: {row['line_spec']}\n\n"
+            "The SQL code changed since the translation below was written.  "
+            "Update the translation for these changes only and keep its format; "
+            "end each section with the absolute line range above.\n\n"
+            f"Previous translation:\n\"\"\"{move_spans(m.text, _written_for(m), row)}\"\"\"\n\n"
+            f"SQL changes (unified diff, previous -> current):\n{_sql_diff(m, row)}")
+
+
+def _update_params(row: dict, v: Variant, m: Match) -> dict:
+    """_translate_params() asking to update a similar SQL's translation instead."""
+    params = _translate_params(row, v)
+    params["messages"] = [{"role": "user",
+                           "content": [{"type": "text", "text": _update_prompt(row, m)}]}]
+    return params
+
+
+def _indexed(key: str, look: Lookup | None, m: Match | None, row: dict, text_out: str,
+             seconds: float, stats: Counter) -> None:
+    """Count an update's saving and index a freshly written translation."""
+    if m is not None:
+        stats["similar_updated"] += 1
+        stats["similar_latency_saved"] += m.seconds - seconds
+        seconds = m.seconds                      # what the SQL costs from scratch
+    if look is not None:
+        sql_index.add(key, look, row, text_out, seconds)
+
+
+def _message_text(msg) -> str:
+    """Text of an Anthropic reply; a tool call's input is kept as its JSON."""
+    for block in msg.content:
+        if block.type == "tool_use":
+            return json.dumps(block.input, ensure_ascii=False)
+    return msg.content[0].text.strip()
+
+
+def _eval_params(text_out: str) -> dict:
+    """chat.completions.create() arguments for one evaluation (shared with the batch path)."""
+    params = {"model": OA_MODEL, "temperature": 0, "max_tokens": OA_MAX_TOKENS,
+              "messages": [{"role": "system", "content": EVAL_SYSTEM},
+                           {"role": "user",   "content": _eval_prompt(text_out)}]}
+    if LLM_STRUCTURED:
+        params["response_format"] = EVAL_RESPONSE_FORMAT
+    return params
+
+
+def _eval_pack_params(prompt: str, n: int) -> dict:
+    # a longer request is refused; a pack cut short is split and retried (EvalPacker)
+    params = {"model": OA_MODEL, "temperature": 0,
+              "max_tokens": min(OA_MAX_TOKENS * n, OA_MAX_OUTPUT),
+              "messages": [{"role": "system", "content": EVAL_SYSTEM},
+                           {"role": "user",   "content": prompt}]}
+    if LLM_STRUCTURED:
+        params["response_format"] = EVAL_PACK_RESPONSE_FORMAT
+    return params
+
+
+def _eval_key(text_out: str) -> str:
+    system = [EVAL_SYSTEM, EVAL_RESPONSE_FORMAT] if LLM_STRUCTURED else EVAL_SYSTEM
+    return llm_cache.key(OA_MODEL, 0, system, _eval_prompt(text_out))
+
+
+def _merge_translations(texts: list) -> str:
+    """Join the per-part translations of a split row section by section."""
+    for t in texts:
+        if t.startswith("[Translation Error]"):
+            return t
+    parsed = [parse_translation(t) for t in texts]
+    fields = {h: "\n".join(filter(None, (p[h] for p in parsed))) for h in SECTIONS}
+    return translation_json(fields) if LLM_STRUCTURED else render_translation(fields)
+
+
+def _row_records(row: dict, v: Variant, text_out: str, raw_eval: str,
+                 stats: Counter | None = None, tagged: bool = False):
+    """(translation, evaluation) records; *tagged* adds the experiment's Variant column."""
+    t0     = time.perf_counter()
+    base   = {"SQL_Index": row["idx"] + 1, "Temperature": v.temperature, "prompt": row["prompt"]}
+    if tagged:
+        base["Variant"] = v.label
+    fields = parse_translation(text_out)
+    trans  = [{**base, "Type": h, "Content": fields[h]} for h in SECTIONS]
+    mets   = _parse_eval_block(raw_eval)
+    if stats is not None:
+        stats["parse_seconds"] += time.perf_counter() - t0
+    if stats is not None and not text_out.startswith("[Translation Error]"):
+        stats["parsed_outputs"] += 1
+        stats["parse_failures"] += parse_failed(fields, mets)
+    return trans, [{**t, **mets} for t in trans]
+
+
+async def _translate(client: AsyncAnthropic, row: dict, v: Variant, stats: Counter) -> str:
+    key = _translate_key(row, v)
+    if (hit := llm_cache.get(key)) is not None:
+        stats["cache_hits"] += 1
+        return hit
+    stats["cache_misses"] += 1
+    look, m = _nearest(row, v, stats)
+    if _reusable(m, row):
+        return _reuse(m, row, stats)
+    params = _update_params(row, v, m) if m else _translate_params(row, v)
+
+    async def send():
+        await ant_limit.acquire(estimate_tokens(TRANSLATE_SYSTEM, row["prompt"],
+                                                params["messages"][0]["content"][0]["text"]))
+        with metrics.call("anthropic", v.model, stats):
+            return await client.messages.create(**params)
+
+    t0       = time.perf_counter()
+    ant_msg  = await ant_guard.call(send, stats)
+    text_out = _message_text(ant_msg)
+    _record_usage(stats, getattr(ant_msg, "usage", None), model=v.model)
+    llm_cache.set(key, text_out)
+    _indexed(key, look, m, row, text_out, time.perf_counter() - t0, stats)
+    return text_out
+
+
+async def _send_eval(client: AsyncOpenAI, params: dict, stats: Counter) -> str:
+    async def send():
+        await oa_limit.acquire(estimate_tokens(params["messages"][-1]["content"])
+                               + params["max_tokens"])
+        with metrics.call("openai", OA_MODEL, stats):
+            return await client.chat.completions.create(**params)
+
+    eva = await oa_guard.call(send, stats)
+    _record_usage(stats, getattr(eva, "usage", None), "openai")
+    return eva.choices[0].message.content.strip()
+
+
+async def _evaluate(client: AsyncOpenAI, text_out: str, stats: Counter) -> str:
+    key = _eval_key(text_out)
+    if (hit := llm_cache.get(key)) is not None:
+        stats["cache_hits"] += 1
+        return hit
+    stats["cache_misses"] += 1
+    raw_eval = await _send_eval(client, _eval_params(text_out), stats)
+    llm_cache.set(key, raw_eval)
+    return raw_eval
+
+
+class EvalPacker:
+    """
+    Evaluations of concurrently finishing rows, sent *size* to a request:
+    a pack goes out when full or *wait* seconds after its first item.
+    Items the answer leaves out (or incomplete) are split off and asked
+    again, down to a single plain evaluation.  Each item's evaluation is
+    cached like an unpacked one.
+    """
+
+    def __init__(self, client: AsyncOpenAI, stats: Counter, size: int | None = None,
+                 wait: float | None = None):
+        self.client, self.stats = client, stats
+        self.size   = max(1, size or EVAL_PACK)
+        self.wait   = EVAL_PACK_WAIT if wait is None else wait
+        self._items, self._timer, self._tasks = [], None, set()
+
+    async def evaluate(self, text_out: str) -> str:
+        key = _eval_key(text_out)
+        if (hit := llm_cache.get(key)) is not None:
+            self.stats["cache_hits"] += 1
+            return hit
+        self.stats["cache_misses"] += 1
+        loop = asyncio.get_running_loop()
+        fut  = loop.create_future()
+        self._items.append((text_out, fut))
+        if len(self._items) >= self.size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if items:
+            task = asyncio.ensure_future(self._send(items))
+            self._tasks.add(task)                # keep a reference until it is done
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, items: list) -> None:
+        try:
+            raws = await self._pack([text_out for text_out, _ in items])
+        except Exception as e:                   # every row of the pack fails (and is re-queued)
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (text_out, fut), raw_eval in zip(items, raws):
+            llm_cache.set(_eval_key(text_out), raw_eval)
+            if not fut.done():
+                fut.set_result(raw_eval)
+
+    async def _pack(self, texts: list) -> list:
+        if len(texts) == 1:
+            return [await _send_eval(self.client, _eval_params(texts[0]), self.stats)]
+        ids  = [f"e{i}" for i in range(len(texts))]
+        text = await _send_eval(self.client,
+                                _eval_pack_params(_eval_pack_prompt(dict(zip(ids, texts))),
+                                                  len(texts)), self.stats)
+        self.stats["eval_packs"] += 1
+        raws, mets = split_evaluations(text), _parse_eval_block(text, packed=True)
+        out, missing = [], []
+        for k, i in enumerate(ids):
+            if i in mets and all(mets[i][name] is not None for _, name, _ in METRICS):
+                out.append(raws[i])
+            else:
+                out.append(None)
+                missing.append(k)
+        self.stats["packed_evals"] += len(texts) - len(missing)
+        if missing:
+            self.stats["eval_pack_splits"] += 1
+            half   = (len(missing) + 1) // 2
+            groups = [g for g in (missing[:half], missing[half:]) if g]
+            for group, retried in zip(groups, await asyncio.gather(
+                    *(self._pack([texts[k] for k in g]) for g in groups))):
+                for k, raw_eval in zip(group, retried):
+                    out[k] = raw_eval
+        return out
+
+
+def _parts(row: dict) -> list:
+    """[row], or its statement-level parts when the SQL is over ANT_CHUNK_TOKENS."""
+    if estimate_tokens(row["sql_code"]) <= ANT_CHUNK_TOKENS:
+        return [row]
+    return split_row(row, ANT_CHUNK_TOKENS)
+
+
+async def _translate_row(client: AsyncAnthropic, row: dict, v: Variant, stats: Counter) -> str:
+    parts = _parts(row)
+    if len(parts) == 1:
+        return await _translate(client, row, v, stats)
+    stats["chunked_rows"] += 1
+    stats["chunks"] += len(parts)
+    texts = await asyncio.gather(*(_translate(client, p, v, stats) for p in parts))
+    return _merge_translations(texts)
+
+
+async def _process_row(aant: AsyncAnthropic, aoa: AsyncOpenAI, row: dict, stats: Counter,
+                       grid: list | None = None, packer: EvalPacker | None = None):
+    """
+    Every variant of one row concurrently; identical translations are
+    evaluated once, through *packer* when evaluations are packed.
+    """
+    shared = {}
+
+    async def variant(v: Variant):
+        text_out = await _translate_row(aant, row, v, stats)
+        if text_out in shared:
+            stats["evals_shared"] += 1
+        else:
+            shared[text_out] = asyncio.ensure_future(
+                packer.evaluate(text_out) if packer else _evaluate(aoa, text_out, stats))
+        raw_eval = await shared[text_out]
+        return _row_records(row, v, text_out, raw_eval, stats, tagged=grid is not None)
+
+    trans_rows, eval_rows = [], []
+    for trans, evals in await asyncio.gather(*map(variant, grid or default_variants())):
+        trans_rows += trans
+        eval_rows  += evals
+    return trans_rows, eval_rows
+
+
+async def _run_rows(rows: list, max_in_flight: int, on_row, stats: Counter, sink, on_fail,
+                    grid=None):
+    results, done, pending = {}, 0, iter(enumerate(rows))
+
+    aant, aoa = _async_clients()            # the process pool, already warm after one job
+    packer = EvalPacker(aoa, stats) if EVAL_PACK > 1 else None
+
+    async def worker():
+        nonlocal done
+        for pos, row in pending:            # shared iterator: one row per pull
             try:
-                ant_msg = ant.messages.create(
-                    model=ANT_MODEL,
-                    max_tokens=ANT_MAX_TOKENS,
-                    temperature=temp,
-                    system=system_msg,
-                    messages=[{"role": "user",
-                               "content": [{"type": "text", "text": user_prompt}]}])
-                text_out = ant_msg.content[0].text.strip()
-            except Exception as e:
-                text_out = f"[Translation Error] {e}"
-
-            def grab(h):
-                m = re.search(rf"\{{\s*{h}\s*:(.+?)\}}", text_out, re.I | re.S)
-                return m.group(1).strip() if m else ""
-
-            base = {"SQL_Index": idx + 1, "Temperature": temp, "prompt": prompt}
-            trans_rows += [
-                {**base, "Type": "Objective",       "Content": grab("Objective")},
-                {**base, "Type": "Business Rules",  "Content": grab("Business Rules")},
-                {**base, "Type": "Execution Steps", "Content": grab("Execution Steps")},
-            ]
-
-            eval_prompt = (
-                "OUTPUT EXACTLY in this format:\n"
-                "{ACCURACY: 0/1; Accuracy Confidence: n%; Explanation: ...}\n"
-                "{CONCISENESS: 0/1; Conciseness Confidence: n%; Explanation: ...}\n"
-                "{COMPLETENESS: 0/1; Completeness Confidence: n%; Explanation: ...}\n\n"
-                f"Translation:\n\"\"\"{text_out}\"\"\""
-            )
-            try:
-                eva = oa.chat.completions.create(
-                    model=OA_MODEL,
-                    temperature=0,
-                    max_tokens=OA_MAX_TOKENS,
-                    messages=[{"role": "system", "content": "You are a helpful evaluator."},
-                              {"role": "user",   "content": eval_prompt}])
-                raw_eval = eva.choices[0].message.content.strip()
+                trans, evals = await _process_row(aant, aoa, row, stats, grid, packer)
             except Exception as e:
-                raw_eval = f"[Evaluation Error] {e}"
+                stats["failed_rows"] += 1
+                if on_fail:
+                    on_fail(row, f"{type(e).__name__}: {e}")
+            else:
+                if sink:
+                    sink(row, trans, evals)
+                else:
+                    results[pos] = (trans, evals)
+            done += 1
+            if on_row:
+                try:
+                    on_row(done, len(rows))
+                except Exception as e:           # progress must never fail the translation
+                    log.warning("progress callback failed: %s", e)
+
+    await asyncio.gather(*(worker() for _ in range(min(max_in_flight, len(rows)) or 1)))
+    return [results[pos] for pos in sorted(results)]
+
+
+def run_rows(rows, max_in_flight: int | None = None, on_row=None,
+             stats: Counter | None = None, sink=None, on_fail=None, grid: list | None = None):
+    """
+    Translate + evaluate every row, keeping up to *max_in_flight* rows in
+    flight (default ``LLM_MAX_IN_FLIGHT``; 1 is the old serial behaviour).
+    Provider calls are paced by ``ant_limit`` / ``oa_limit``.  Results come
+    back in input order regardless of completion order; ``on_row(done,
+    total)`` fires as each row finishes.  Call counters (cache hits/misses)
+    are added to *stats* when given.
 
-            mets = _parse_eval_block(raw_eval)
-            for off in range(3):
-                eval_rows.append({**trans_rows[-3 + off], **mets})
+    With a *sink*, each row is handed to ``sink(row, trans, evals)`` as soon
+    as it finishes and nothing is accumulated (the lists returned are empty).
 
-            time.sleep(0.5)
+    Provider calls are retried by ``ant_guard`` / ``oa_guard``; a row that
+    still fails is left out of the results, counted as ``failed_rows`` and
+    passed to ``on_fail(row, error)`` so it can be re-run later.
 
+    *grid* (``parse_grid``) runs every row under each variant at once and
+    tags the records with a ``Variant`` column; the default is ANT_MODEL at
+    each of ANT_TEMPS, untagged.
+
+    With EVAL_PACK > 1 the evaluations of rows finishing together share
+    requests (``EvalPacker``); that pays off with several rows in flight.
+
+    A translation the cache misses is looked up in ``sql_index`` first: a
+    near-duplicate's translation is reused (same literals, SIMILAR_REUSE) or
+    updated for the SQL diff (SIMILAR_UPDATE), counted as ``similar_reused`` /
+    ``similar_updated`` with the provider time saved.
+    """
+    rows  = list(rows)
+    stats = Counter() if stats is None else stats
+    results = _run(_run_rows(rows, max(1, max_in_flight or MAX_IN_FLIGHT),
+                                    on_row, stats, sink, on_fail, grid))
+
+    trans_rows, eval_rows = [], []
+    for trans, evals in results:
+        trans_rows += trans
+        eval_rows  += evals
+    return trans_rows, eval_rows
+
+
+def summarize(stats: Counter) -> dict:
+    """
+    Job summary derived from the run counters; ``<name>_seconds`` entries
+    (stages, summed provider latency, parsing) become the ``timings`` block.
+    """
+    timings = {k[:-len("_seconds")]: round(v, 3) for k, v in stats.items()
+               if k.endswith("_seconds")}
+    stats  = Counter({k: v for k, v in stats.items() if not k.endswith("_seconds")})
+    calls  = stats["cache_hits"] + stats["cache_misses"]
+    prompt = (stats["ant_input_tokens"] + stats["ant_cache_read_tokens"]
+              + stats["ant_cache_write_tokens"])
+    parsed = stats["parsed_outputs"]
+    if stats["eval_packs"]:                      # every packed answer replaced single calls
+        stats["eval_calls_saved"] = stats["packed_evals"] - stats["eval_packs"]
+    if looked := stats["similar_lookups"]:
+        stats["similar_match_rate"]    = round(
+            (stats["similar_reused"] + stats["similar_updated"]) / looked, 4)
+        stats["similar_latency_saved"] = round(stats["similar_latency_saved"], 3)
+    return {"cache_hits": 0, "cache_misses": 0, "parse_failures": 0, "failed_rows": 0, **stats,
+            "cache_hit_ratio": round(stats["cache_hits"] / calls, 4) if calls else 0.0,
+            "parse_failure_rate": round(stats["parse_failures"] / parsed, 4) if parsed else 0.0,
+            "prompt_cache_read_ratio":
+                round(stats["ant_cache_read_tokens"] / prompt, 4) if prompt else 0.0,
+            "timings": timings}
+
+
+def run_analysis(sql_path: str, prompt_path: str | None, out_dir: str,
+                 max_in_flight: int | None = None, fmt: str = "xlsx"):
+    """
+    *prompt_path* may be None when *sql_path* is a JSONL job payload.  Rows
+    are checkpointed in *out_dir* as they finish (a rerun resumes) and then
+    streamed into translation_results.<fmt> / analysis_results.<fmt>; rows
+    that failed are listed in failed.jsonl and picked up by the next run.
+    """
     os.makedirs(out_dir, exist_ok=True)
-    pd.DataFrame(trans_rows).to_excel(os.path.join(out_dir, "translation_results.xlsx"), index=False)
-    pd.DataFrame(eval_rows ).to_excel(os.path.join(out_dir, "analysis_results.xlsx"),    index=False)
+    ckpt  = Checkpoint(os.path.join(out_dir, "checkpoint.jsonl"))
+    done  = ckpt.done()
+    reps, folded = dedupe([r for r in iter_rows(*read_inputs(sql_path, prompt_path))
+                           if r["idx"] not in done])
+    stats = Counter(deduped_rows=folded, calls_saved=folded * 2 * len(ANT_TEMPS))
+    failed = FailedRows(os.path.join(out_dir, "failed.jsonl"))
+    failed.clear()
+    run_rows(reps, max_in_flight, stats=stats, sink=fan_out(ckpt.append), on_fail=failed.append)
+
+    ext = get_writer(fmt).ext
+    write_file(os.path.join(out_dir, f"translation_results.{ext}"),
+               (t for trans, _ in iter_results([ckpt]) for t in trans), fmt)
+    write_file(os.path.join(out_dir, f"analysis_results.{ext}"),
+               (e for _, evals in iter_results([ckpt]) for e in evals), fmt)
+    return summarize(stats)
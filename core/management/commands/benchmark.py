@@ -0,0 +1,255 @@
+# core/management/commands/benchmark.py
+"""
+Offline throughput benchmark against the local fake LLM server.
+
+    python manage.py benchmark --rows 10,100,1000 --latency-ms 200 --in-flight 8
+
+For every size a synthetic upload is generated and each target is run
+``--repeat`` times; the report gives rows/s (at the median), p50/p99 of the
+per-run latency and the peak RSS seen while the target ran.  Provider
+budgets, the response cache and the near-duplicate index are switched off
+unless asked for, so the numbers measure this code, not the limits.
+"""
+
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from django.test.utils import setup_databases, teardown_databases
+
+TARGETS = ("parse", "code", "table", "analysis", "task", "view", "download")
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _PeakRSS:
+    """Sample the resident set every few ms while the block runs."""
+
+    def __enter__(self):
+        self.peak, self._stop = _rss_kb(), threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, _rss_kb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_kb())
+
+
+def _sql(i: int) -> str:
+    return (f"SELECT c{i}, COUNT(*) AS n\nFROM t{i % 50}\n"
+            f"WHERE x > {i}\nGROUP BY c{i};")
+
+
+def _pct(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the translation pipeline offline against core.fake_llm."
+    # the URL check imports core.logic, which needs the stub's env first
+    requires_system_checks = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", default="10,100,1000",
+                            help="comma-separated upload sizes (10 to 10000)")
+        parser.add_argument("--targets", default=",".join(TARGETS),
+                            help=f"comma-separated subset of {', '.join(TARGETS)}")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--in-flight", type=int, default=8)
+        parser.add_argument("--mode", default="local", choices=("local", "bulk"),
+                            help="run_translation mode for the task/view targets")
+        parser.add_argument("--latency-ms", type=float, default=0.0)
+        parser.add_argument("--latency-sigma", type=float, default=0.0)
+        parser.add_argument("--rate-limit", type=float, default=0.0)
+        parser.add_argument("--eval-pack", type=int, default=1,
+                            help="translations per evaluation request (EVAL_PACK)")
+        parser.add_argument("--pack-drop", type=float, default=0.0,
+                            help="fraction of packed items the stub leaves out")
+        parser.add_argument("--keep-limits", action="store_true",
+                            help="keep the configured RPM/TPM budgets")
+        parser.add_argument("--cache", action="store_true",
+                            help="keep the LLM response cache enabled")
+        parser.add_argument("--similar", action="store_true",
+                            help="keep the near-duplicate SQL index enabled")
+        parser.add_argument("--json", help="also write the results to this file")
+
+    def handle(self, *args, **opts):
+        sizes   = [int(n) for n in opts["rows"].split(",") if n.strip()]
+        targets = [t.strip() for t in opts["targets"].split(",") if t.strip()]
+        if bad := set(targets) - set(TARGETS):
+            raise CommandError(f"unknown targets: {', '.join(sorted(bad))}")
+
+        from core import fake_llm
+
+        server, url = fake_llm.serve(latency_ms=opts["latency_ms"],
+                                     latency_sigma=opts["latency_sigma"],
+                                     rate_limit=opts["rate_limit"],
+                                     pack_drop=opts["pack_drop"])
+        os.environ.update(ANTHROPIC_BASE_URL=url, OPENAI_BASE_URL=f"{url}/v1")
+        os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+        from anthropic import Anthropic
+        from openai import OpenAI
+
+        from core import batch, logic
+        from core.ratelimit import ProviderLimiter
+        from sql_site.celery import app as celery_app
+
+        logic.ant = Anthropic(api_key="bench", base_url=url)
+        logic.oa  = OpenAI(api_key="bench", base_url=f"{url}/v1")
+        logic.llm_cache.enabled = opts["cache"]
+        logic.sql_index.enabled = opts["similar"]
+        logic.EVAL_PACK = opts["eval_pack"]
+        if not opts["keep_limits"]:
+            logic.ant_limit = ProviderLimiter(1e9, 1e12)
+            logic.oa_limit  = ProviderLimiter(1e9, 1e12)
+        batch.POLL_SECONDS = 0.05
+        celery_app.conf.task_always_eager = True  # no broker: tasks run in-process
+        for name in ("core.events", "core.metrics"):               # no Redis needed
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+        self.opts, results = opts, []
+        self.stdout.write(f"fake LLM at {url}; {opts['repeat']} run(s) per target")
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as work, override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                TRANSLATION_RERUN_ATTEMPTS=0, TRANSLATION_JOB_ROOT=Path(work) / "jobs",
+                TRANSLATION_BULK_MIN_ROWS=0, TRANSLATION_CHORD_MIN_ROWS=0,
+                SCHED_USER_DAILY_TOKENS=2**62, SCHED_JOB_MAX_TOKENS=2**62):
+            os.chdir(work)
+            dbs = setup_databases(verbosity=0, interactive=False)   # throwaway Job/ResultRow tables
+            try:
+                for n in sizes:
+                    fixture = self._fixture(Path(work) / f"n{n}", n)
+                    for target in targets:
+                        results.append(self._measure(target, n, fixture))
+            finally:
+                teardown_databases(dbs, verbosity=0)
+                os.chdir(cwd)
+                server.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} measurements"))
+        if opts["json"]:
+            Path(opts["json"]).write_text(json.dumps(results, indent=2))
+
+    # ── fixtures ───────────────────────────────────────────────────
+    def _fixture(self, root: Path, n: int) -> dict:
+        import pandas as pd
+
+        from core import fake_llm, logic
+        from core.payload import write_payload
+        from core.sourcefile import SourceWriter
+        from core.views import FIXED_PROMPT
+
+        root.mkdir(parents=True)
+        sql_codes = [_sql(i) for i in range(n)]
+        pd.DataFrame({"sql_code": sql_codes}).to_excel(root / "sql.xlsx", index=False)
+        write_payload(root / "job.jsonl", sql_codes, FIXED_PROMPT)
+        source = SourceWriter(root / "source.sql")
+        for sql in sql_codes:
+            source.write_row(sql)
+        source.commit()
+
+        trans = []
+        for row in logic.iter_rows(sql_codes, [FIXED_PROMPT] * n):
+            fields = logic.parse_translation(fake_llm.translation_text("", logic._user_prompt(row)))
+            trans += [{"SQL_Index": row["idx"] + 1, "Type": h, "Content": fields[h]}
+                      for h in logic.SECTIONS]
+        pd.DataFrame(trans).to_excel(root / "translation.xlsx", index=False)
+        return {"root": root,
+                "evals": [fake_llm.evaluation_text()] * n}
+
+    # ── targets ────────────────────────────────────────────────────
+    def _run(self, target: str, n: int, fx: dict, rep: int) -> None:
+        from core import logic, views
+        from core.sourcefile import SourceFile
+        from core.tasks import run_translation
+
+        out = fx["root"] / f"{target}-{rep}"
+        if target == "parse":
+            for text in fx["evals"]:
+                logic._parse_eval_block(text)
+        elif target == "code":
+            # page through the whole source the way the viewer scrolls it
+            with SourceFile(fx["root"] / "source.sql") as src:
+                for first in range(1, src.line_count + 1, 200):
+                    views._lines_html(src.lines(first, first + 199), first)
+        elif target == "table":
+            views._table_html(fx["root"] / "translation.xlsx")
+        elif target == "analysis":
+            logic.run_analysis(str(fx["root"] / "job.jsonl"), None, str(out),
+                               max_in_flight=self.opts["in_flight"])
+        elif target == "task":
+            run_translation.apply(args=(str(fx["root"] / "job.jsonl"), str(out)),
+                                  kwargs={"max_in_flight": self.opts["in_flight"],
+                                          "mode": self.opts["mode"]},
+                                  throw=True)
+        elif target == "view":
+            # the eager task runs inside the request: upload → finished job; the
+            # view passes no max_in_flight, so the task falls back to LLM_MAX_IN_FLIGHT
+            with open(fx["root"] / "sql.xlsx", "rb") as fh, \
+                 mock.patch.object(logic, "MAX_IN_FLIGHT", self.opts["in_flight"]), \
+                 override_settings(TRANSLATION_BULK_MIN_ROWS=n if self.opts["mode"] == "bulk" else 0):
+                request = RequestFactory().post("/api/translate/", {"sql_file": fh})
+                response = views.translate(request)
+            if response.status_code != 200:
+                raise CommandError(f"translate view returned {response.status_code}")
+        elif target == "download":
+            # the zip is generated from the stored rows while it is read
+            response = views.download(RequestFactory().get("/"), fx["job_id"])
+            for _ in response.streaming_content:
+                pass
+
+    def _stored_job(self, fx: dict) -> None:
+        """One finished job for the download target (not timed)."""
+        from core.tasks import run_translation
+
+        if "job_id" not in fx:
+            fx["job_id"] = run_translation.apply(
+                args=(str(fx["root"] / "job.jsonl"), str(fx["root"] / "stored")),
+                kwargs={"max_in_flight": self.opts["in_flight"]}, throw=True).id
+
+    def _measure(self, target: str, n: int, fx: dict) -> dict:
+        if target == "download":
+            self._stored_job(fx)
+        times = []
+        with _PeakRSS() as rss:
+            for rep in range(self.opts["repeat"]):
+                t0 = time.perf_counter()
+                self._run(target, n, fx, rep)
+                times.append(time.perf_counter() - t0)
+        p50 = statistics.median(times)
+        row = {"target": target, "rows": n, "rows_per_s": round(n / p50, 1) if p50 else None,
+               "p50_s": round(p50, 4), "p99_s": round(_pct(times, 0.99), 4),
+               "peak_rss_mb": round(rss.peak / 1024, 1)}
+        self.stdout.write(f"  {target:<9} {n:>6} rows  {row['rows_per_s']:>10} rows/s  "
+                          f"p50 {row['p50_s']:>8}s  p99 {row['p99_s']:>8}s  "
+                          f"rss {row['peak_rss_mb']:>7} MB")
+        return row
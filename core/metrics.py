@@ -0,0 +1,162 @@
+# core/metrics.py
+"""
+Process-shared Prometheus metrics without prometheus_client.
+
+Web and worker processes buffer counter/histogram increments in memory and
+flush them every few seconds (and at the end of a request or job) into one
+Redis hash with HINCRBYFLOAT, so ``views.metrics`` can render the totals
+of every process in the text exposition format.  Like progress events,
+metrics are best effort: a Redis outage never fails a request or a job.
+
+Job stages are also added to the job's stats Counter as ``<stage>_seconds``;
+``logic.summarize`` turns those into the per-job ``timings`` block.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+KEY           = "metrics:v1"
+FLUSH_SECONDS = 5.0
+
+CALL_BUCKETS  = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "sqlsite_stage_seconds":     ("histogram", "Duration of one request/job stage.", STAGE_BUCKETS),
+    "sqlsite_llm_call_seconds":  ("histogram", "Latency of one provider call.", CALL_BUCKETS),
+    "sqlsite_llm_tokens_total":  ("counter", "Provider tokens by kind.", None),
+    "sqlsite_llm_errors_total":  ("counter", "Failed provider calls by error type.", None),
+    "sqlsite_jobs_total":        ("counter", "Finished translation jobs by mode.", None),
+    "sqlsite_failed_rows_total": ("counter", "Rows left for a re-run after retries.", None),
+    "sqlsite_eval_calls_saved_total": ("counter", "Evaluator calls saved by packing.", None),
+    "sqlsite_similar_rows_total": ("counter", "Translations reused/updated from similar SQL.", None),
+    "sqlsite_similar_seconds_saved_total": ("counter", "Provider seconds saved that way.", None),
+}
+
+_pending, _lock, _last = {}, threading.Lock(), time.monotonic()
+_redis, _warned = None, False
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in labels.items())
+
+
+def _add(field: str, value: float) -> None:
+    with _lock:
+        _pending[field] = _pending.get(field, 0.0) + value
+    if time.monotonic() - _last > FLUSH_SECONDS:
+        flush()
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    if value:
+        _add(f"{name}||{_labels(labels)}", value)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    lab = _labels(labels)
+    for le in METRICS[name][2]:
+        if value <= le:
+            _add(f"{name}|bucket|{lab}|{le}", 1)
+    _add(f"{name}|bucket|{lab}|+Inf", 1)
+    _add(f"{name}|sum|{lab}", value)
+    _add(f"{name}|count|{lab}", 1)
+
+
+@contextmanager
+def stage(name: str, stats=None):
+    """Time a stage into ``sqlsite_stage_seconds`` (and ``stats[<name>_seconds]``)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        observe("sqlsite_stage_seconds", dt, stage=name)
+        if stats is not None:
+            stats[f"{name}_seconds"] += dt
+
+
+@contextmanager
+def call(provider: str, model: str, stats=None):
+    """Time one provider call; errors are counted by type and re-raised."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        inc("sqlsite_llm_errors_total", provider=provider, model=model,
+            type=getattr(e, "status_code", None) or type(e).__name__)
+        raise
+    dt = time.perf_counter() - t0
+    observe("sqlsite_llm_call_seconds", dt, provider=provider, model=model)
+    if stats is not None:
+        stats[f"{provider}_seconds"] += dt
+
+
+def _conn():
+    global _redis
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(getattr(settings, "METRICS_REDIS_URL",
+                                              settings.PROGRESS_REDIS_URL))
+    return _redis
+
+
+def flush() -> None:
+    global _last, _warned
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last = time.monotonic()
+    if not batch:
+        return
+    try:
+        pipe = _conn().pipeline(transaction=False)
+        for field, value in batch.items():
+            pipe.hincrbyfloat(KEY, field, value)
+        pipe.execute()
+        _warned = False
+    except Exception as e:                       # metrics must never fail a job
+        if not _warned:
+            log.warning("metrics flush failed: %s", e)
+            _warned = True
+
+
+_ORDER = {"": 0, "bucket": 0, "sum": 1, "count": 2}
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+def render() -> str:
+    """Current totals of every process, in the Prometheus text format."""
+    flush()
+    try:
+        fields = _conn().hgetall(KEY)
+    except Exception as e:                       # a scrape during an outage gets no samples
+        log.warning("metrics read failed: %s", e)
+        fields = {}
+    series = {}
+    for field, value in fields.items():
+        name, suffix, lab, *le = field.decode().split("|")
+        order = (lab, _ORDER[suffix], float(le[0]) if le else 0.0)   # "+Inf" sorts last
+        if le:
+            lab = ",".join(filter(None, (lab, f'le="{le[0]}"')))
+        sample = f"{name}_{suffix}" if suffix else name
+        labels = f"{{{lab}}}" if lab else ""
+        series.setdefault(name, []).append((order, f"{sample}{labels} {_num(float(value))}"))
+
+    out = []
+    for name, (kind, help_, _) in METRICS.items():
+        if name in series:
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+            out += [line for _, line in sorted(series[name])]
+    return "\n".join(out) + "\n" if out else ""
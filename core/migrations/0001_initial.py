@@ -0,0 +1,60 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                ("id", models.UUIDField(primary_key=True, serialize=False)),
+                ("status", models.CharField(choices=[("queued", "Queued"), ("running", "Running"),
+                                                     ("done", "Done")],
+                                            default="queued", max_length=16)),
+                ("mode", models.CharField(blank=True, max_length=16)),
+                ("total_rows", models.PositiveIntegerField(default=0)),
+                ("summary", models.JSONField(blank=True, null=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["status", "-created"], name="job_status_created")],
+            },
+        ),
+        migrations.CreateModel(
+            name="ResultRow",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False,
+                                           verbose_name="ID")),
+                ("sql_index", models.PositiveIntegerField()),
+                ("temperature", models.FloatField()),
+                ("type", models.CharField(max_length=32)),
+                ("content", models.TextField(blank=True)),
+                ("sql_hash", models.CharField(blank=True, max_length=64, null=True)),
+                ("accurate", models.SmallIntegerField(null=True)),
+                ("accurate_confidence", models.SmallIntegerField(null=True)),
+                ("accurate_explanation", models.TextField(null=True)),
+                ("concise", models.SmallIntegerField(null=True)),
+                ("concise_confidence", models.SmallIntegerField(null=True)),
+                ("concise_explanation", models.TextField(null=True)),
+                ("complete", models.SmallIntegerField(null=True)),
+                ("complete_confidence", models.SmallIntegerField(null=True)),
+                ("complete_explanation", models.TextField(null=True)),
+                ("job", models.ForeignKey(db_index=False,
+                                          on_delete=django.db.models.deletion.CASCADE,
+                                          related_name="rows", to="core.job")),
+            ],
+            options={
+                "ordering": ["sql_index", "temperature", "id"],
+                "indexes": [models.Index(fields=["sql_hash"], name="resultrow_sql_hash"),
+                            models.Index(fields=["job", "accurate"], name="resultrow_job_accurate")],
+                "constraints": [models.UniqueConstraint(fields=("job", "sql_index", "temperature", "type"),
+                                                        name="resultrow_unique_section")],
+            },
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("core", "0001_initial")]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="prompt",
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("core", "0002_job_prompt")]
+
+    operations = [
+        migrations.AlterField(
+            model_name="job",
+            name="status",
+            field=models.CharField(choices=[("queued", "Queued"), ("running", "Running"),
+                                            ("done", "Done"), ("failed", "Failed")],
+                                   default="queued", max_length=16),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("core", "0003_job_failed_status")]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="variants",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="resultrow",
+            name="variant",
+            field=models.CharField(blank=True, default="", max_length=128),
+        ),
+        migrations.RemoveConstraint(
+            model_name="resultrow",
+            name="resultrow_unique_section",
+        ),
+        migrations.AddConstraint(
+            model_name="resultrow",
+            constraint=models.UniqueConstraint(
+                fields=("job", "sql_index", "variant", "temperature", "type"),
+                name="resultrow_unique_section"),
+        ),
+    ]
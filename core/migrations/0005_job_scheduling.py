@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("core", "0004_experiment_variants")]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="owner",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="est_rows",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="est_tokens",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="queue",
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="priority",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="not_before",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(fields=["owner", "status"], name="job_owner_status"),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(fields=["queue", "status", "priority", "created"],
+                               name="job_queue_order"),
+        ),
+    ]
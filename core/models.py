@@ -1,3 +1,66 @@
 from django.db import models
 
-# Create your models here.
+
+class Job(models.Model):
+    """One upload; the primary key is the Celery task id of run_translation."""
+
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUSES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    id         = models.UUIDField(primary_key=True)
+    status     = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    mode       = models.CharField(max_length=16, blank=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    prompt     = models.TextField(blank=True)        # shared by every row of the upload
+    variants   = models.JSONField(null=True, blank=True)   # experiment grid (logic.Variant dicts)
+    # admission (core.scheduler): who asked, the estimate, where it was queued
+    owner      = models.CharField(max_length=64, blank=True)
+    est_rows   = models.PositiveIntegerField(default=0)
+    est_tokens = models.PositiveBigIntegerField(default=0)
+    queue      = models.CharField(max_length=16, blank=True)
+    priority   = models.PositiveSmallIntegerField(default=0)
+    not_before = models.DateTimeField(null=True, blank=True)
+    summary    = models.JSONField(null=True, blank=True)
+    created    = models.DateTimeField(auto_now_add=True)
+    updated    = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "-created"], name="job_status_created"),
+                   models.Index(fields=["owner", "status"], name="job_owner_status"),
+                   models.Index(fields=["queue", "status", "priority", "created"],
+                                name="job_queue_order")]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class ResultRow(models.Model):
+    """One section of one translated SQL row, with its evaluation metrics."""
+
+    # the unique constraint's index leads with job, so the FK needs none of its own
+    job         = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="rows",
+                                    db_index=False)
+    sql_index   = models.PositiveIntegerField()              # SQL_Index (1-based)
+    temperature = models.FloatField()
+    variant     = models.CharField(max_length=128, blank=True, default="")   # Variant.label
+    type        = models.CharField(max_length=32)            # Objective / Business Rules / ...
+    content     = models.TextField(blank=True)
+    sql_hash    = models.CharField(max_length=64, null=True, blank=True)
+
+    accurate             = models.SmallIntegerField(null=True)
+    accurate_confidence  = models.SmallIntegerField(null=True)
+    accurate_explanation = models.TextField(null=True)
+    concise              = models.SmallIntegerField(null=True)
+    concise_confidence   = models.SmallIntegerField(null=True)
+    concise_explanation  = models.TextField(null=True)
+    complete             = models.SmallIntegerField(null=True)
+    complete_confidence  = models.SmallIntegerField(null=True)
+    complete_explanation = models.TextField(null=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=["job", "sql_index", "variant", "temperature", "type"],
+            name="resultrow_unique_section")]
+        indexes = [models.Index(fields=["sql_hash"], name="resultrow_sql_hash"),
+                   models.Index(fields=["job", "accurate"], name="resultrow_job_accurate")]
+        ordering = ["sql_index", "temperature", "id"]
@@ -0,0 +1,170 @@
+# core/parsing.py
+"""
+Model output → typed fields.
+
+In structured mode (``LLM_STRUCTURED``) translations come back as the input
+of a forced Anthropic tool call and evaluations as an OpenAI JSON-schema
+response; both are stored as JSON and decoded directly.  Anything else goes
+through the legacy brace-format parsers, which make one pass over the text
+with precompiled patterns.
+
+A packed evaluation (several translations in one request) answers with
+``[ID: <id>]`` headed sections, or an ``items`` list in structured mode;
+``split_evaluations`` cuts it into one single-evaluation text per item.
+"""
+
+import json
+import re
+
+SECTIONS = ("Objective", "Business Rules", "Execution Steps")
+_FIELDS  = ("objective", "business_rules", "execution_steps")
+
+METRICS = (("accur",    "Accurate", "accuracy"),
+           ("concise",  "Concise",  "conciseness"),
+           ("complete", "Complete", "completeness"))
+MKEYS   = [f"{name}{suffix}" for _, name, _ in METRICS
+           for suffix in ("", " Confidence (%)", " Explanation")]
+
+# ── structured-output request shapes ───────────────────────────────
+TRANSLATION_TOOL = {
+    "name": "record_translation",
+    "description": "Record the business documentation for the SQL. End every "
+                   "field with the absolute SQL line range, written as (lines a-b).",
+    "input_schema": {
+        "type": "object",
+        "properties": {f: {"type": "string"} for f in _FIELDS},
+        "required": list(_FIELDS),
+    },
+}
+
+_METRIC_SCHEMA = {
+    "type": "object",
+    "properties": {"score":       {"type": "integer", "enum": [0, 1]},
+                   "confidence":  {"type": "integer"},
+                   "explanation": {"type": "string"}},
+    "required": ["score", "confidence", "explanation"],
+    "additionalProperties": False,
+}
+
+EVAL_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "evaluation",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {field: _METRIC_SCHEMA for _, _, field in METRICS},
+            "required": [field for _, _, field in METRICS],
+            "additionalProperties": False,
+        },
+    },
+}
+
+EVAL_PACK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "evaluations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"items": {"type": "array", "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"},
+                               **{field: _METRIC_SCHEMA for _, _, field in METRICS}},
+                "required": ["id"] + [field for _, _, field in METRICS],
+                "additionalProperties": False,
+            }}},
+            "required": ["items"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# ── legacy brace format ────────────────────────────────────────────
+_SECTION_RE = re.compile(r"\{\s*(Objective|Business Rules|Execution Steps)\s*:(.+?)\}",
+                         re.I | re.S)
+_BLOCK_RE   = re.compile(r"\{([^}]*)\}")
+_VAL_RE     = re.compile(r"\b([01])\b")
+_CONF_RE    = re.compile(r"(\d+)%")
+_EXPL_RE    = re.compile(r"Explanation\s*:\s*(.+)", re.I)
+_ITEM_RE    = re.compile(r"^\s*\[ID:\s*([\w-]+)\s*\]\s*$", re.I | re.M)
+_CANON      = {h.lower(): h for h in SECTIONS}
+
+
+def _json(text: str):
+    if not text.lstrip().startswith("{"):        # cheap gate: brace-format text fails fast below
+        return None
+    try:
+        obj = json.loads(text)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def parse_translation(text: str) -> dict:
+    """{section: content} for the three SECTIONS ("" where missing)."""
+    out = dict.fromkeys(SECTIONS, "")
+    if (obj := _json(text)) is not None:
+        for h, f in zip(SECTIONS, _FIELDS):
+            out[h] = str(obj.get(f) or "").strip()
+        return out
+    for m in _SECTION_RE.finditer(text):
+        h = _CANON[" ".join(m.group(1).lower().split())]
+        if not out[h]:
+            out[h] = m.group(2).strip()
+    return out
+
+
+def render_translation(fields: dict) -> str:
+    """Legacy brace text for *fields*."""
+    return "\n".join(f"{{{h}: {fields[h]}}}" for h in SECTIONS)
+
+
+def translation_json(fields: dict) -> str:
+    return json.dumps({f: fields[h] for h, f in zip(SECTIONS, _FIELDS)}, ensure_ascii=False)
+
+
+def parse_evaluation(text: str) -> dict:
+    """The nine metric cells (value, confidence, explanation per metric; None where missing)."""
+    out = dict.fromkeys(MKEYS)
+    if (obj := _json(text)) is not None:
+        for _, name, field in METRICS:
+            m = obj.get(field)
+            if isinstance(m, dict):
+                out[name] = _str(m.get("score"))
+                out[f"{name} Confidence (%)"] = _str(m.get("confidence"))
+                out[f"{name} Explanation"]    = _str(m.get("explanation"))
+        return out
+    for blk in _BLOCK_RE.findall(text):
+        key = blk.split(":", 1)[0].strip().lower()
+        for prefix, name, _ in METRICS:
+            if key.startswith(prefix):
+                val  = _VAL_RE.search(blk)
+                conf = _CONF_RE.search(blk)
+                expl = _EXPL_RE.search(blk)
+                out[name] = val.group(1) if val else None
+                out[f"{name} Confidence (%)"] = conf.group(1) if conf else None
+                out[f"{name} Explanation"]    = expl.group(1).strip() if expl else None
+                break
+    return out
+
+
+def split_evaluations(text: str) -> dict:
+    """{item id: evaluation text} of a packed answer; each value reads with parse_evaluation."""
+    if (obj := _json(text)) is not None:
+        items = obj.get("items")
+        return {str(it["id"]): json.dumps({f: it.get(f) for _, _, f in METRICS})
+                for it in (items if isinstance(items, list) else ())
+                if isinstance(it, dict) and "id" in it}
+    parts = _ITEM_RE.split(text)                 # [preamble, id, body, id, body, ...]
+    return {parts[i]: parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+
+
+def _str(v):
+    return None if v is None else str(v).strip()
+
+
+def parse_failed(fields: dict, metrics: dict) -> bool:
+    """True when a section came back empty or a metric value is missing."""
+    return (not all(fields.values())
+            or any(metrics[name] is None for _, name, _ in METRICS))
@@ -0,0 +1,38 @@
+# core/payload.py
+"""
+Compact job payload handed from the view to the worker.
+
+One JSONL file in the job directory: a header line carrying the shared
+prompt, then one JSON string per SQL snippet.  The rows are streamed in, so
+their count is not in the header; ``write_payload`` returns it.  Replaces
+the sql.xlsx / prompt.xlsx pair, so neither side has to parse Excel twice.
+"""
+
+import json
+from pathlib import Path
+
+
+def write_payload(path, sql_codes, prompt: str) -> int:
+    """Write *sql_codes* + the shared *prompt*; returns the row count."""
+    path, rows = Path(path), 0
+    with path.open("w", encoding="utf-8") as fh:
+        fh.write(json.dumps({"prompt": prompt}) + "\n")
+        for sql in sql_codes:
+            fh.write(json.dumps(str(sql), ensure_ascii=False) + "\n")
+            rows += 1
+    return rows
+
+
+def read_payload(path):
+    """Return (prompt, iterator of SQL strings); the rows are read lazily."""
+    path = Path(path)
+    with path.open(encoding="utf-8") as fh:
+        prompt = json.loads(fh.readline())["prompt"]
+
+    def sqls():                                  # opened on first use, so never leaked
+        with path.open(encoding="utf-8") as fh:
+            next(fh)                             # the header
+            for line in fh:
+                yield json.loads(line)
+
+    return prompt, sqls()
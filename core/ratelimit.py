@@ -0,0 +1,56 @@
+# core/ratelimit.py
+"""
+Per-provider token-bucket limiters (requests/min and tokens/min).
+
+Buckets hand out *reservations*: the balance may go negative and the caller
+sleeps until its share has been refilled.  No lock or loop-bound primitive is
+involved, so the same bucket works from a plain loop (``wait``) and from any
+asyncio event loop (``acquire``).
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: float | None = None):
+        self.rate     = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.tokens   = self.capacity
+        self.stamp    = time.monotonic()
+
+    def reserve(self, n: float = 1) -> float:
+        """Take *n* tokens, return seconds to wait before they are usable."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp  = now
+        self.tokens -= min(n, self.capacity)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait(self, n: float = 1) -> None:
+        time.sleep(self.reserve(n))
+
+    async def acquire(self, n: float = 1) -> None:
+        await asyncio.sleep(self.reserve(n))
+
+
+class ProviderLimiter:
+    """One RPM bucket + one TPM bucket for a single provider."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens   = TokenBucket(tpm)
+
+    def reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def wait(self, tokens: int) -> None:
+        time.sleep(self.reserve(tokens))
+
+    async def acquire(self, tokens: int) -> None:
+        await asyncio.sleep(self.reserve(tokens))
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Cheap ~4 chars/token estimate used for TPM accounting."""
+    return sum(len(t) for t in texts) // 4 + 1
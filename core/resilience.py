@@ -0,0 +1,188 @@
+# core/resilience.py
+"""
+Shared wrapper for provider calls: retries, circuit breaker and hedging.
+
+``ProviderGuard.call(make)`` runs ``await make()`` and
+
+* retries transient failures (connection errors, 408/409/429/5xx/529) with
+  full-jitter exponential backoff, or after the server's ``retry-after``;
+* keeps a per-provider circuit breaker: after *threshold* consecutive
+  transient failures every caller waits out *cooldown* before dispatching;
+  then a single probe goes out while the others hold back, and its outcome
+  closes the circuit or opens it for another cooldown;
+* optionally hedges: once a call has run past the provider's recent p95
+  latency, a duplicate is fired and whichever answers first wins.
+
+Like the rate limiter it holds no loop-bound primitive, so one guard serves
+every event loop in the process.
+"""
+
+import asyncio
+import functools
+import random
+import time
+from collections import deque
+
+_RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+@functools.cache
+def _conn_errors() -> tuple:
+    import anthropic                             # loaded with the clients, not at import
+    import openai
+
+    return (anthropic.APIConnectionError, openai.APIConnectionError,
+            asyncio.TimeoutError, ConnectionError)
+
+
+def retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None)
+    return status in _RETRY_STATUS or (status is None and isinstance(exc, _conn_errors()))
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """Seconds from a ``retry-after-ms`` / ``retry-after`` response header, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if ms := headers.get("retry-after-ms"):
+            return float(ms) / 1000
+        if s := headers.get("retry-after"):
+            return float(s)
+    except ValueError:                           # HTTP-date form: fall back to backoff
+        pass
+    return None
+
+
+class CircuitBreaker:
+    PROBE_POLL = 0.05   # seconds between looks at the probe of a half-open circuit
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown  = cooldown
+        self.failures  = 0
+        self.opened_at = None
+        self.probing   = False
+
+    def remaining(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    async def wait(self) -> bool:
+        """
+        Return once a call may go out; True when it is the probe of a
+        half-open circuit, which must end in ``success``, ``failure(probe=True)``
+        or ``release``.
+        """
+        while self.opened_at is not None:
+            if (left := self.remaining()) > 0:
+                await asyncio.sleep(left)
+            elif not self.probing:
+                self.probing = True
+                return True
+            else:
+                await asyncio.sleep(self.PROBE_POLL)
+        return False
+
+    def success(self) -> None:
+        self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self, probe: bool = False) -> bool:
+        """Count a transient failure; True when this one (re)opened the circuit."""
+        self.failures += 1
+        if probe or (self.opened_at is None and self.failures >= self.threshold):
+            self.opened_at, self.probing = time.monotonic(), False
+            return True
+        return False
+
+    def release(self) -> None:
+        """A probe ended without a verdict (not a transient error): let another one go."""
+        self.probing = False
+
+
+class LatencyWindow:
+    """Recent successful-call latencies; p95 once enough samples exist."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples     = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class ProviderGuard:
+    def __init__(self, name: str, retries: int, backoff: float, backoff_max: float,
+                 threshold: int, cooldown: float, hedge: bool = False):
+        self.name        = name
+        self.retries     = retries
+        self.backoff     = backoff
+        self.backoff_max = backoff_max
+        self.hedge       = hedge
+        self.breaker     = CircuitBreaker(threshold, cooldown)
+        self.latency     = LatencyWindow()
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        hinted = retry_after(exc)
+        if hinted is not None:
+            return min(hinted, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    async def _timed(self, make):
+        t0 = time.monotonic()
+        result = await make()
+        self.latency.add(time.monotonic() - t0)
+        return result
+
+    async def _hedged(self, make, stats):
+        after = self.latency.p95()
+        if after is None:
+            return await self._timed(make)
+        pending = {asyncio.ensure_future(self._timed(make))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=after)
+            if done:
+                return done.pop().result()
+
+            stats[f"{self.name}_hedges"] += 1
+            pending.add(asyncio.ensure_future(self._timed(make)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:                 # the loser, or both when we are cancelled
+                task.cancel()
+
+    async def call(self, make, stats):
+        """``await make()`` under retry/breaker/hedging; re-raises once retries are spent."""
+        for attempt in range(self.retries + 1):
+            probe = await self.breaker.wait()
+            try:
+                result = await (self._hedged(make, stats) if self.hedge else self._timed(make))
+                self.breaker.success()
+            except Exception as e:
+                if not retryable(e):
+                    raise
+                if self.breaker.failure(probe):
+                    stats[f"{self.name}_breaker_opens"] += 1
+                probe = False                    # failure() settled it
+                if attempt == self.retries:
+                    raise
+                stats[f"{self.name}_retries"] += 1
+                await asyncio.sleep(self.delay(attempt, e))
+                continue
+            finally:
+                if probe:
+                    self.breaker.release()
+            return result
@@ -0,0 +1,194 @@
+# core/scheduler.py
+"""
+Admission control and queue routing for uploads (``views.translate``).
+
+``estimate`` sizes a spooled upload without parsing it – statement
+separators or lines counted on a byte scan, an xlsx sheet's dimension and
+shared-string size – and turns that into provider tokens.  ``admit`` then
+decides where the job goes:
+
+    429   the client (user, else IP) already has SCHED_USER_MAX_JOBS jobs
+          queued or running (lost ones, without a heartbeat for
+          JOB_STALE_SECONDS, do not count), or its SCHED_USER_DAILY_TOKENS
+          are spent
+    413   the job alone is over SCHED_JOB_MAX_TOKENS
+    later interactive (non-bulk) work already queued or running plus this
+          job needs more than SCHED_HORIZON seconds of the provider TPM
+          budgets: the job starts once that backlog has drained – unless
+          that is over SCHED_MAX_DEFER away (429, the countdown must stay
+          below the broker's visibility timeout)
+    queue "interactive" up to SCHED_INTERACTIVE_TOKENS, else "bulk"; the
+          priority (0 first) grows with the size and with the client's
+          active jobs, so one big upload cannot starve everyone else
+
+``queue_state`` is what ``views.progress`` reports while a job waits.
+"""
+
+import math
+import re
+from datetime import timedelta
+from typing import NamedTuple
+from zipfile import BadZipFile, ZipFile
+
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import ingest, logic
+from .models import Job
+from .ratelimit import estimate_tokens
+
+INTERACTIVE, BULK = "interactive", "bulk"
+
+ROW_OUTPUT_TOKENS = 300       # a translation's length; it is also the evaluation's input
+_SCAN_CHUNK       = 2**20
+_DIMENSION_RE     = re.compile(rb'<dimension ref="[A-Z]+\d+:[A-Z]+(\d+)"')
+_SHEET_RE         = re.compile(r"xl/worksheets/sheet(\d+)\.xml")
+
+
+class Rejected(Exception):
+    """The job is not admitted; *status* is the HTTP answer, *retry_after* seconds or None."""
+
+    def __init__(self, message: str, status: int = 429, retry_after: int | None = None):
+        super().__init__(message)
+        self.status, self.retry_after = status, retry_after
+
+
+class Ticket(NamedTuple):
+    queue: str
+    priority: int
+    countdown: int            # seconds before the job may start (0 = now)
+    rows: int
+    tokens: int
+
+
+def client_key(request) -> str:
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def _scan(fh, sep: bytes) -> tuple:
+    """(bytes, occurrences of *sep*) of a binary stream."""
+    size = count = 0
+    while chunk := fh.read(_SCAN_CHUNK):
+        size  += len(chunk)
+        count += chunk.count(sep)
+    return size, count
+
+
+def _xlsx(zf: ZipFile) -> tuple:
+    names = zf.namelist()
+    text  = sum(zf.getinfo(n).file_size for n in names if n == "xl/sharedStrings.xml")
+    # the first sheet, as ingest reads it – not sheet10 before sheet2, nor _rels/
+    sheets = {int(m.group(1)): n for n in names if (m := _SHEET_RE.fullmatch(n))}
+    sheet  = sheets[min(sheets)] if sheets else None
+    rows  = 0
+    if sheet:
+        with zf.open(sheet) as fh:
+            if m := _DIMENSION_RE.search(fh.read(4096)):
+                rows = int(m.group(1)) - 1       # the header row
+    return text, rows
+
+
+def _size(path, split: str) -> tuple:
+    """(SQL bytes, rows) of an upload, roughly; (0, 0) when unreadable (ingest reports it)."""
+    fmt = ingest.upload_format(str(path))
+    try:
+        if fmt in ("xlsx", "xlsm"):
+            with ZipFile(path) as zf:
+                return _xlsx(zf)
+        if fmt == "zip":
+            size = rows = 0
+            with ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(".sql"):
+                        continue
+                    with zf.open(info) as fh:
+                        n, stmts = _scan(fh, b";")
+                    size += n
+                    rows += 1 if split == "file" else max(1, stmts)
+            return size, rows
+        with open(path, "rb") as fh:
+            if fmt == "csv":
+                size, lines = _scan(fh, b"\n")
+                return size, max(0, lines - 1)
+            size, stmts = _scan(fh, b";")
+        return size, 1 if split == "file" else max(1, stmts)
+    except (BadZipFile, OSError):
+        return 0, 0
+
+
+def estimate(path, split: str, prompt: str, variants: int = 1) -> tuple:
+    """(rows, tokens) a job will cost: translation + evaluation calls of every variant."""
+    size, rows = _size(path, split)
+    if not rows and size:
+        rows = 1
+    per_row = (estimate_tokens(logic.TRANSLATE_SYSTEM, prompt) + 2 * ROW_OUTPUT_TOKENS
+               + logic.OA_MAX_TOKENS)
+    return rows, variants * (size // 4 + rows * per_row)
+
+
+def _batched(rows: int) -> bool:
+    """True when the job will run through the provider batch APIs (not TPM-paced)."""
+    bulk_min = getattr(settings, "TRANSLATION_BULK_MIN_ROWS", 0)
+    return bool(bulk_min) and rows >= bulk_min
+
+
+def _active():
+    """Jobs queued or running; one running but silent past JOB_STALE_SECONDS is lost, not active."""
+    stale = timezone.now() - timedelta(seconds=getattr(settings, "JOB_STALE_SECONDS", 3600))
+    return (Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING))
+            .exclude(status=Job.RUNNING, updated__lt=stale))
+
+
+def admit(owner: str, rows: int, tokens: int) -> Ticket:
+    """Route a job or raise Rejected (see the module docstring)."""
+    if tokens > getattr(settings, "SCHED_JOB_MAX_TOKENS", 200_000_000):
+        raise Rejected(f"upload too large (~{tokens:,} tokens)", status=413)
+
+    mine   = Job.objects.filter(owner=owner)
+    active = _active().filter(owner=owner).count()
+    if active >= getattr(settings, "SCHED_USER_MAX_JOBS", 3):
+        raise Rejected(f"{active} jobs already queued or running; wait for one to finish",
+                       retry_after=60)
+    day    = timezone.now() - timedelta(days=1)
+    spent  = mine.filter(created__gte=day).aggregate(n=Sum("est_tokens"))["n"] or 0
+    budget = getattr(settings, "SCHED_USER_DAILY_TOKENS", 20_000_000)
+    if spent + tokens > budget:
+        raise Rejected(f"daily token budget spent ({spent:,} of {budget:,} used)",
+                       retry_after=3600)
+
+    countdown = 0
+    if not _batched(rows):
+        paced = _active()
+        if bulk_min := getattr(settings, "TRANSLATION_BULK_MIN_ROWS", 0):
+            paced = paced.filter(est_rows__lt=bulk_min)
+        backlog = paced.aggregate(n=Sum("est_tokens"))["n"] or 0
+        rate    = (logic.ANT_TPM + logic.OA_TPM) / 60     # tokens a second, both providers
+        if (backlog + tokens) / rate > getattr(settings, "SCHED_HORIZON", 3600):
+            countdown = int(backlog / rate)
+        # an ETA past the broker's visibility timeout is delivered twice
+        if countdown > (limit := getattr(settings, "SCHED_MAX_DEFER", 3 * 3600)):
+            raise Rejected(f"provider budgets are booked for the next {countdown // 60} min",
+                           retry_after=countdown - limit)
+
+    big      = tokens > getattr(settings, "SCHED_INTERACTIVE_TOKENS", 200_000)
+    size     = max(0, round(math.log2(max(tokens, 1) / 1000)) // 2)
+    priority = min(9, size + active)
+    return Ticket(BULK if big else INTERACTIVE, priority, countdown, rows, tokens)
+
+
+def queue_state(job_id) -> dict | None:
+    """{"queue", "queue_position", "deferred_until"?} of a job still waiting, else None."""
+    job = (Job.objects.filter(id=job_id, status=Job.QUEUED)
+           .only("queue", "priority", "created", "not_before").first())
+    if job is None or not job.queue:
+        return None
+    ahead = Job.objects.filter(status=Job.QUEUED, queue=job.queue).filter(
+        Q(priority__lt=job.priority) | Q(priority=job.priority, created__lt=job.created))
+    state = {"queue": job.queue, "queue_position": ahead.count() + 1}
+    if job.not_before and job.not_before > timezone.now():
+        state["deferred_until"] = job.not_before.isoformat()
+    return state
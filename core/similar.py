@@ -0,0 +1,198 @@
+# core/similar.py
+"""
+Persistent near-duplicate index of translated SQL (MinHash / LSH).
+
+The response cache (``llm_cache``) only serves exact repeats.  Templates
+that differ in a date, a campaign id or a table suffix miss it, although
+their documentation is almost the same.  Every fresh translation is
+therefore indexed under its *scope* – model, temperature, instructions and
+job prompt, whatever makes two translations interchangeable – with a
+MinHash signature of the canonical SQL's token 3-shingles.
+
+``lookup`` cuts a new row's signature into LSH bands and reads the entries
+sharing a band with it.  The entries sharing the most bands are the
+candidates, and it returns the one with the highest estimated Jaccard
+similarity.  ``logic`` then reuses that translation, or asks the model
+only to update it for the SQL diff.
+
+Entries live in a small SQLite file, like the cache, with the same TTL.  A
+cap on their number drops the least recently matched entries first.
+"""
+
+import functools
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+from .sqlnorm import canonical
+
+PERMS      = 128
+BANDS      = 32           # of 4 rows: pairs ~0.5 similar collide in a band half the time
+SHINGLE    = 3            # tokens per shingle
+CANDIDATES = 16           # entries scored per lookup
+_PRIME     = (1 << 31) - 1
+_BLOCK     = 4096         # shingles hashed per numpy pass
+_TOKEN     = re.compile(r"\w+|[^\w\s]")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sim_entries (
+    key       TEXT PRIMARY KEY,
+    scope     TEXT    NOT NULL,
+    sig       BLOB    NOT NULL,
+    sql       TEXT    NOT NULL,
+    text      TEXT    NOT NULL,
+    ln_start  INTEGER NOT NULL,
+    line_spec TEXT    NOT NULL,
+    seconds   REAL    NOT NULL,
+    created   REAL    NOT NULL,
+    used      REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sim_entries_used ON sim_entries(used);
+CREATE TABLE IF NOT EXISTS sim_bands (
+    bucket INTEGER NOT NULL,
+    entry  TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sim_bands_bucket ON sim_bands(bucket);
+CREATE INDEX IF NOT EXISTS sim_bands_entry  ON sim_bands(entry);
+"""
+
+
+class Match(NamedTuple):
+    similarity: float
+    sql: str
+    text: str                 # the translation, ranges as written for its own row
+    ln_start: int
+    line_spec: str
+    seconds: float            # what translating it from scratch took
+
+
+class Lookup(NamedTuple):
+    scope: str
+    sig: bytes
+    match: Match | None
+
+
+@functools.cache
+def _perms():
+    import numpy as np
+
+    rng = np.random.default_rng(0x5157)
+    return (rng.integers(1, _PRIME, PERMS, dtype=np.uint64)[:, None],
+            rng.integers(0, _PRIME, PERMS, dtype=np.uint64)[:, None])
+
+
+def _shingles(sql: str) -> set:
+    toks = _TOKEN.findall(canonical(sql))
+    return {" ".join(toks[i:i + SHINGLE]) for i in range(max(1, len(toks) - SHINGLE + 1))}
+
+
+def signature(sql: str) -> bytes:
+    """MinHash of the SQL's shingles: PERMS little-endian uint32 values."""
+    import numpy as np
+
+    x = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(),
+                                    "little") % _PRIME for s in _shingles(sql)),
+                    dtype=np.uint64)
+    a, b = _perms()
+    sig = np.full(PERMS, _PRIME, dtype=np.uint64)
+    for i in range(0, len(x), _BLOCK):
+        np.minimum(sig, ((a * x[i:i + _BLOCK] + b) % _PRIME).min(axis=1), out=sig)
+    return sig.astype("<u4").tobytes()
+
+
+def similarity(sig1: bytes, sig2: bytes) -> float:
+    """Estimated Jaccard similarity: the share of equal MinHash values."""
+    import numpy as np
+
+    return float(np.count_nonzero(np.frombuffer(sig1, "<u4") == np.frombuffer(sig2, "<u4"))
+                 / PERMS)
+
+
+def _buckets(scope: str, sig: bytes) -> list:
+    step = len(sig) // BANDS
+    return [int.from_bytes(hashlib.blake2b(f"{scope}:{b}".encode() + sig[b * step:(b + 1) * step],
+                                           digest_size=8).digest(), "little", signed=True)
+            for b in range(BANDS)]
+
+
+class SimilarIndex:
+    EVICT_EVERY = 64          # run eviction once per N writes
+
+    def __init__(self, path: str, ttl: float, max_entries: int, enabled: bool = True):
+        self.path        = path
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self.enabled     = enabled
+        self._conn       = None
+        self._lock       = threading.Lock()
+        self._writes     = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def lookup(self, scope: str, sql: str) -> Lookup:
+        """The most similar live entry of *scope* (match None when no band is shared)."""
+        sig, now = signature(sql), time.time()
+        buckets  = _buckets(scope, sig)
+        with self._lock:
+            # live entries of the scope only compete for the CANDIDATES slots
+            rows = self._db().execute(
+                "SELECT e.key, e.sig, e.sql, e.text, e.ln_start, e.line_spec, e.seconds "
+                "FROM sim_bands b JOIN sim_entries e ON e.key = b.entry "
+                f"WHERE b.bucket IN ({','.join('?' * len(buckets))}) "
+                "AND e.scope = ? AND e.created >= ? "
+                "GROUP BY e.key ORDER BY COUNT(*) DESC LIMIT ?",
+                (*buckets, scope, now - self.ttl, CANDIDATES)).fetchall()
+        best, key = None, None
+        for r in rows:
+            sim = similarity(sig, r[1])
+            if best is None or sim > best.similarity:
+                best, key = Match(sim, *r[2:]), r[0]
+        if key is not None:
+            with self._lock:
+                self._db().execute("UPDATE sim_entries SET used = ? WHERE key = ?", (now, key))
+        return Lookup(scope, sig, best)
+
+    def add(self, key: str, look: Lookup, row: dict, text: str, seconds: float) -> None:
+        """Index *row*'s translation *text* (*key*: its response-cache key)."""
+        if text.startswith("[Translation Error]"):
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                db.execute("DELETE FROM sim_bands WHERE entry = ?", (key,))
+                db.execute("INSERT OR REPLACE INTO sim_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (key, look.scope, look.sig, row["sql_code"], text, row["ln_start"],
+                            row["line_spec"], seconds, now, now))
+                db.executemany("INSERT INTO sim_bands VALUES (?, ?)",
+                               [(b, key) for b in _buckets(look.scope, look.sig)])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        db    = self._db()
+        count = db.execute("SELECT COUNT(*) FROM sim_entries").fetchone()[0]
+        keys  = db.execute(
+            "SELECT key FROM sim_entries WHERE created < ? UNION SELECT key FROM "
+            "(SELECT key FROM sim_entries ORDER BY used LIMIT ?)",
+            (now - self.ttl, max(0, count - self.max_entries))).fetchall()
+        if keys:
+            db.execute("BEGIN")
+            db.executemany("DELETE FROM sim_bands WHERE entry = ?", keys)
+            db.executemany("DELETE FROM sim_entries WHERE key = ?", keys)
+            db.execute("COMMIT")
@@ -0,0 +1,111 @@
+# core/sourcefile.py
+"""
+The uploaded SQL, stored once per job with a line-offset index.
+
+``source.sql`` holds the rows joined by newlines (the numbering behind the
+``(lines a-b)`` ranges); ``source.idx`` is the byte offset of every line
+start as native uint64s.  ``SourceFile`` memory-maps both, so fetching a
+window of lines costs two slices however large the upload is.
+"""
+
+import mmap
+import os
+from array import array
+from pathlib import Path
+
+IDX_SUFFIX = ".idx"
+
+
+class SourceWriter:
+    """Append rows to ``<path>.part`` and record line starts; ``commit()`` publishes both files."""
+
+    def __init__(self, path):
+        self.path   = Path(path)
+        self.fh     = self._part(self.path).open("wb")
+        self.starts = array("Q", [0])
+        self.pos    = 0
+        self.rows   = 0
+
+    @staticmethod
+    def _part(path: Path) -> Path:
+        return path.with_name(path.name + ".part")
+
+    def write_row(self, sql: str) -> None:
+        data = (b"\n" if self.rows else b"") + sql.encode("utf-8")
+        nl = data.find(b"\n")
+        while nl != -1:
+            self.starts.append(self.pos + nl + 1)
+            nl = data.find(b"\n", nl + 1)
+        self.fh.write(data)
+        self.pos  += len(data)
+        self.rows += 1
+
+    def commit(self) -> None:
+        self.fh.close()
+        idx = self.path.with_suffix(IDX_SUFFIX)
+        with self._part(idx).open("wb") as fh:
+            self.starts.tofile(fh)
+        # the index goes first: a visible source.sql always has its index
+        os.replace(self._part(idx), idx)
+        os.replace(self._part(self.path), self.path)
+
+    def discard(self) -> None:
+        self.fh.close()
+        self._part(self.path).unlink(missing_ok=True)
+
+
+def build_index(path) -> None:
+    """Write the index of an existing source file (jobs ingested before it existed)."""
+    path, starts = Path(path), array("Q", [0])
+    with path.open("rb") as fh:
+        pos = 0
+        for line in fh:
+            pos += len(line)
+            if line.endswith(b"\n"):
+                starts.append(pos)
+    tmp = path.with_suffix(IDX_SUFFIX + ".part")
+    with tmp.open("wb") as fh:
+        starts.tofile(fh)
+    os.replace(tmp, path.with_suffix(IDX_SUFFIX))
+
+
+def _map(path: Path):
+    with path.open("rb") as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if path.stat().st_size else b""
+
+
+class SourceFile:
+    def __init__(self, path):
+        self.path = Path(path)
+        idx = self.path.with_suffix(IDX_SUFFIX)
+        if not idx.exists():
+            build_index(self.path)
+        self._data   = _map(self.path)
+        self._idx    = _map(idx)
+        self._starts = memoryview(self._idx).cast("Q") if self._idx else ()
+
+    @property
+    def line_count(self) -> int:
+        return len(self._starts) if len(self._data) else 0
+
+    def lines(self, first: int, last: int) -> list:
+        """Lines *first*..*last* (1-based, inclusive, clipped to the file)."""
+        first, last = max(first, 1), min(last, self.line_count)
+        if first > last:
+            return []
+        lo = self._starts[first - 1]
+        hi = self._starts[last] - 1 if last < self.line_count else len(self._data)
+        return self._data[lo:hi].decode("utf-8", errors="replace").split("\n")
+
+    def close(self) -> None:
+        if isinstance(self._starts, memoryview):
+            self._starts.release()
+        for m in (self._data, self._idx):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,124 @@
+# core/sqlnorm.py
+"""
+Pre-dispatch de-duplication of SQL rows.
+
+Rows whose SQL differs only in comments, whitespace or keyword/identifier
+casing share one canonical form.  Only the first row of each group is sent
+to the models; the others ride along in its ``copies`` list and receive the
+same results, re-keyed to their own SQL_Index and with the absolute
+``(lines a-b)`` range swapped for their own.
+"""
+
+import hashlib
+import re
+
+import sqlparse
+
+_SPAN = re.compile(r"\(lines (\d+)-(\d+)\)")
+
+
+def canonical(sql: str) -> str:
+    text = sqlparse.format(sql, strip_comments=True, keyword_case="upper",
+                           identifier_case="lower", strip_whitespace=True)
+    return " ".join(text.split()).rstrip(";").strip()
+
+
+def literals(sql: str) -> list:
+    """The string and number literals of *sql* (dates, ids, thresholds), in order."""
+    return [t.value for stmt in sqlparse.parse(sql) for t in stmt.flatten()
+            if t.ttype in sqlparse.tokens.Literal]
+
+
+def sql_hash(sql: str, canon: str | None = None) -> str:
+    """SHA-256 of the canonical form (stored with results; equal for equivalent SQL)."""
+    return hashlib.sha256((canonical(sql) if canon is None else canon).encode()).hexdigest()
+
+
+def dedupe(rows: list):
+    """
+    Return (representative rows, number of rows folded into a representative).
+    Every row gets its ``sql_hash`` on the way, since the canonical form is at hand.
+    """
+    reps, seen, folded = [], {}, 0
+    for row in rows:
+        canon = canonical(row["sql_code"])
+        row["sql_hash"] = sql_hash(row["sql_code"], canon)
+        key = (row["prompt"], canon)
+        if key in seen:
+            seen[key].setdefault("copies", []).append(row)
+            folded += 1
+        else:
+            seen[key] = row
+            reps.append(row)
+    return reps, folded
+
+
+def _stmt_lines(sql: str) -> list:
+    """(first, last) line offset of each statement of *sql*, trimmed as chunking cuts parts."""
+    spans, line = [], 0
+    for stmt in sqlparse.parse(sql):
+        text = str(stmt)
+        body = text.lstrip()
+        if any(not t.is_whitespace and t.ttype not in sqlparse.tokens.Comment
+               for t in stmt.flatten()):
+            first = line + text[:len(text) - len(body)].count("\n")
+            spans.append((first, first + body.rstrip().count("\n")))
+        line += text.count("\n")
+    return spans
+
+
+def _mover(src: dict, dst: dict):
+    """``move_spans`` for one pair of rows; the statement layouts are read once, if needed."""
+    shift, pairs = dst["ln_start"] - src["ln_start"], []
+
+    def place(n: int, end: bool) -> int:
+        if not pairs:
+            a, b = _stmt_lines(src["sql_code"]), _stmt_lines(dst["sql_code"])
+            pairs.append(list(zip(a, b)) if len(a) == len(b) and a != b else ())
+        off = n - src["ln_start"]
+        for (s0, s1), (d0, d1) in pairs[0]:
+            if s0 <= off <= s1:
+                at = d1 - (s1 - off) if end else d0 + (off - s0)
+                return dst["ln_start"] + min(max(at, d0), d1)
+        return n + shift
+
+    def move(m):
+        if m.group(0) == src["line_spec"]:
+            return dst["line_spec"]
+        return f"(lines {place(int(m.group(1)), False)}-{place(int(m.group(2)), True)})"
+
+    return lambda text: _SPAN.sub(move, text)
+
+
+def move_spans(text: str, src: dict, dst: dict) -> str:
+    """
+    *text* written for row *src*, with its ``(lines a-b)`` ranges moved to
+    row *dst*: the whole-row range becomes *dst*'s, and a part range of a
+    split row goes to the same statements in *dst* – which may be laid out
+    on other lines – or, when the statements do not pair up, is shifted by
+    the offset between the two rows.
+    """
+    return _mover(src, dst)(text)
+
+
+def rebase(records: list, src: dict, dst: dict) -> list:
+    """Copy *src*'s result records over to row *dst* (ranges as in ``move_spans``)."""
+    move, out = _mover(src, dst), []
+    for rec in records:
+        rec = {k: move(v) if isinstance(v, str) else v for k, v in rec.items()}
+        rec["SQL_Index"] = dst["idx"] + 1
+        out.append(rec)
+    return out
+
+
+def fan_out(sink):
+    """
+    Wrap a row sink so each representative's results also land on its copies.
+    The copies are written first: a resumed job skips a checkpointed
+    representative, so it must not be there before its copies are.
+    """
+    def wrapped(row: dict, trans: list, evals: list) -> None:
+        for copy in row.get("copies", ()):
+            sink(copy, rebase(trans, row, copy), rebase(evals, row, copy))
+        sink(row, trans, evals)
+    return wrapped
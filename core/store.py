@@ -0,0 +1,131 @@
+# core/store.py
+"""
+Database copy of the job results (``Job`` / ``ResultRow``).
+
+Rows finish inside the asyncio loop of ``logic.run_rows``, where the ORM
+must not be called, so ``ResultStore`` is a plain sink that queues them for
+a writer thread; the thread bulk-inserts whatever has piled up (up to
+``BATCH`` rows per INSERT).  The checkpoints stay the source of truth:
+``backfill`` inserts any checkpointed row the database missed (a crash
+between the two writes, a failed insert), and duplicates are ignored
+through the unique (job, sql_index, variant, temperature, type) constraint.
+"""
+
+import logging
+import queue
+import threading
+
+from django.db import connection
+
+from .models import ResultRow
+from .sqlnorm import sql_hash
+
+log = logging.getLogger(__name__)
+
+BATCH = 500
+_STOP = object()
+
+METRIC_FIELDS = {
+    "accurate": "Accurate",
+    "accurate_confidence": "Accurate Confidence (%)",
+    "accurate_explanation": "Accurate Explanation",
+    "concise": "Concise",
+    "concise_confidence": "Concise Confidence (%)",
+    "concise_explanation": "Concise Explanation",
+    "complete": "Complete",
+    "complete_confidence": "Complete Confidence (%)",
+    "complete_explanation": "Complete Explanation",
+}
+
+
+def _int(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def result_rows(job_id, evals: list, digest: str | None) -> list:
+    """Unsaved ResultRow objects for one row's evaluation records."""
+    out = []
+    for rec in evals:
+        row = ResultRow(job_id=job_id, sql_index=rec["SQL_Index"],
+                        temperature=rec["Temperature"], variant=rec.get("Variant") or "",
+                        type=rec["Type"],
+                        content=rec.get("Content") or "", sql_hash=digest)
+        for field, key in METRIC_FIELDS.items():
+            v = rec.get(key)
+            setattr(row, field, v if field.endswith("explanation") else _int(v))
+        out.append(row)
+    return out
+
+
+class ResultStore:
+    """Row sink (``store.add(row, trans, evals)``) backed by a writer thread."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.failed = False
+        self._queue  = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, row: dict, trans: list, evals: list) -> None:
+        if not self.failed:
+            self._queue.put((row, evals))
+
+    def _run(self) -> None:
+        try:
+            stop = False
+            while not stop:
+                objs, item = [], self._queue.get()
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    row, evals = item
+                    objs += result_rows(self.job_id, evals,
+                                        row.get("sql_hash") or sql_hash(row["sql_code"]))
+                    if len(objs) >= BATCH:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if objs:
+                    ResultRow.objects.bulk_create(objs, ignore_conflicts=True)
+        except Exception as e:                   # backfill() fills the gap later
+            self.failed = True
+            log.warning("result store for %s stopped: %s", self.job_id, e)
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def backfill(job_id, checkpoints) -> int:
+    """Insert checkpointed rows missing from the database; returns rows added."""
+    have = set(ResultRow.objects.filter(job_id=job_id)
+               .values_list("sql_index", flat=True).distinct())
+    objs, added = [], 0
+    for ck in checkpoints:
+        for rec in ck.records():
+            if rec["idx"] + 1 in have or not rec["eval"]:
+                continue
+            have.add(rec["idx"] + 1)
+            objs += result_rows(job_id, rec["eval"], rec.get("sql_hash"))
+            added += 1
+            if len(objs) >= BATCH:
+                ResultRow.objects.bulk_create(objs, ignore_conflicts=True)
+                objs = []
+    if objs:
+        ResultRow.objects.bulk_create(objs, ignore_conflicts=True)
+    return added
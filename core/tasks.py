@@ -1,110 +1,376 @@
 # core/tasks.py
+import json
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
 from pathlib import Path
-from zipfile import ZipFile, ZIP_DEFLATED
 
-import pandas as pd
-from celery import shared_task
+from celery import Task, chord, shared_task
+from celery.signals import worker_process_init
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
 
-from . import logic
+from . import artifacts, batch, events, ingest, logic, metrics, sqlnorm
+from .checkpoint import Checkpoint, FailedRows
+from .models import Job
+from .store import ResultStore, backfill
 
+log = logging.getLogger(__name__)
 
-@shared_task(bind=True)
-def run_translation(self, sql_xlsx: str, prm_xlsx: str, out_dir: str) -> None:
+
+@worker_process_init.connect
+def _warm_up(**kwargs) -> None:
+    """Each (forked) worker process builds its LLM clients and pool before the first job."""
+    logic.warm_up()
+
+
+def _progress(job_id: str, done: int, total: int) -> None:
+    # 100 is reserved for "zip ready"; views.progress treats it as done
+    pct = min(99, int(done / total * 100))
+    cache.set(job_id, pct, 3600)
+    events.publish(job_id, events.job_status(job_id, pct))
+    # heartbeat, at most once a minute: sweep_artifacts fails jobs gone silent
+    if cache.add(f"{job_id}:beat", 1, 60):
+        # on_row runs in run_rows' event loop, where the ORM must not be called
+        threading.Thread(target=_beat, args=(job_id,), daemon=True).start()
+
+
+def _beat(job_id: str) -> None:
+    try:
+        Job.objects.filter(id=job_id, status=Job.RUNNING).update(updated=timezone.now())
+    except Exception as e:                       # like progress, never fatal
+        log.warning("heartbeat of %s failed: %s", job_id, e)
+    finally:
+        connection.close()
+
+
+def _tee(*sinks):
+    """One row sink feeding several (checkpoint first, then the database)."""
+    def sink(row: dict, trans: list, evals: list) -> None:
+        for s in sinks:
+            s(row, trans, evals)
+    return sink
+
+
+def _write_outputs(job_id: str, out: Path, summary: dict) -> None:
+    """summary.json for a later re-run, then announce the job as done."""
+    out.mkdir(parents=True, exist_ok=True)
+    (out / "summary.json").write_text(json.dumps(summary, indent=2))
+
+    cache.set(f"{job_id}:summary", summary, 3600)
+    cache.set(job_id, 100, 3600)
+    events.publish(job_id, events.job_status(job_id, 100, summary))
+
+
+def _fail(job_id: str, error: str) -> None:
+    """Stop a job for good (bad upload, task out of retries): mark it failed and tell the client."""
+    summary = {"error": error}
+    Job.objects.filter(id=job_id).update(status=Job.FAILED, summary=summary,
+                                         updated=timezone.now())
+    cache.set(f"{job_id}:summary", summary, 3600)
+    cache.set(job_id, events.FAILED, 3600)
+    events.publish(job_id, events.job_status(job_id, events.FAILED, summary))
+
+
+def _variants(grid: list | None) -> list | None:
+    """Variants back from their task-argument form (``Variant._asdict()`` dicts)."""
+    return [logic.Variant(**v) for v in grid] if grid else None
+
+
+def _route(job) -> dict:
+    """Follow-up tasks of a job stay on the queue the scheduler picked for it."""
+    return {"queue": job.queue} if job is not None and job.queue else {}
+
+
+def _finish(job_id: str, out: Path, checkpoints: list, summary: dict,
+            max_in_flight=None, attempt: int = 0) -> None:
+    """
+    Complete the stored results and mark the job done (the zip is built on
+    download), then queue ``rerun_failed`` if rows failed and attempts remain.
+    """
+    summary["rerun_scheduled"] = bool(
+        summary.get("failed_rows")
+        and attempt < getattr(settings, "TRANSLATION_RERUN_ATTEMPTS", 2))
+    backfill(job_id, checkpoints)
+    job = Job.objects.filter(id=job_id).only("id", "variants", "queue").first()
+    if job and job.variants:
+        summary["comparison"] = artifacts.comparison(job)
+    Job.objects.filter(id=job_id).update(status=Job.DONE, mode=summary.get("mode", ""),
+                                         summary=summary, updated=timezone.now())
+    _write_outputs(job_id, out, summary)
+    metrics.inc("sqlsite_jobs_total", mode=summary.get("mode", "unknown"))
+    metrics.inc("sqlsite_failed_rows_total", summary.get("failed_rows", 0))
+    metrics.inc("sqlsite_eval_calls_saved_total", summary.get("eval_calls_saved", 0))
+    for kind in ("reused", "updated"):
+        metrics.inc("sqlsite_similar_rows_total", summary.get(f"similar_{kind}", 0), kind=kind)
+    metrics.inc("sqlsite_similar_seconds_saved_total",
+                max(0, summary.get("similar_latency_saved", 0)))
+    metrics.observe("sqlsite_stage_seconds", summary["timings"].get("parse", 0), stage="parse")
+    metrics.flush()
+    if summary["rerun_scheduled"]:
+        rerun_failed.apply_async((job_id, str(out), max_in_flight, attempt + 1),
+                                 countdown=getattr(settings, "TRANSLATION_RERUN_DELAY", 300),
+                                 **_route(job))
+
+
+class JobTask(Task):
+    """Base of ``run_translation``: once its retries are spent, the job is marked failed."""
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        _fail(task_id, f"{type(exc).__name__}: {exc}")
+
+
+# Every finished row is checkpointed in the job directory before the task
+# moves on, so redelivery (acks_late) and retries resume instead of
+# re-paying for completed rows.
+@shared_task(bind=True, base=JobTask, acks_late=True, reject_on_worker_lost=True,
+             autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def run_translation(self, payload: str, out_dir: str,
+                    max_in_flight: int | None = None, mode: str | None = None,
+                    timings: dict | None = None, upload: dict | None = None,
+                    grid: list | None = None, polls: int = 0) -> None:
+    """
+    *payload* is the JSONL job file (see core.payload).  With *upload*
+    (``{"path", "prompt", "split"}``, the file spooled by the view) it is
+    first streamed out of that file here, off the web request; an upload
+    that cannot be read fails the job instead of being retried.
+
+    mode "local" runs every row in this task; "chord" fans the rows out as
+    chunked subtasks and assembles the results in ``assemble_results``;
+    "bulk" sends everything through the provider batch APIs.  Left as None,
+    uploads of at least TRANSLATION_BULK_MIN_ROWS rows go bulk and those of
+    at least TRANSLATION_CHORD_MIN_ROWS rows fan out.  The result zip is
+    built from the stored rows on download (see core.artifacts).  *timings*
+    are the upload stages measured by the view (seconds by stage); they open
+    the job's ``timings`` summary.
+
+    *grid* makes the job an experiment: a list of variant dicts
+    (``logic.parse_grid``), each run on every row, kept on ``Job.variants``
+    and compared side by side in the summary and the zip.
+
+    A bulk job waits for its provider batches in later runs of this task,
+    *polls* counting them; they are new runs, not retries, so waiting does
+    not use up the retries that transient errors get.
+    """
     job_id = self.request.id
     out = Path(out_dir)
-    sql_df = pd.read_excel(sql_xlsx)
-    prm_df = pd.read_excel(prm_xlsx)
-    total = len(sql_df)
-
-    trans_rows, eval_rows = [], []
-    cum_line = 1
-
-    for idx in range(total):
-        sql_code = str(sql_df.at[idx, "sql_code"]).rstrip()
-        prompt = str(prm_df.at[idx, "prompt"]).rstrip()
-
-        ln_start = cum_line
-        ln_total = len(sql_code.splitlines())
-        cum_line += ln_total
-        line_spec = f"(lines {ln_start}-{ln_start + ln_total - 1})"
-
-        for temp in logic.ANT_TEMPS:
-            user_prompt = f"{prompt}\n\nSQL Code:\n{sql_code}"
-            system_msg = (
-                "You are a helpful assistant that translates SQL into business "
-                "documentation in plain English.\n"
-                "{Objective: ...}\n{Business Rules: ...}\n{Execution Steps: ...}\n"
-                f"Append the absolute SQL line range {line_spec} at the end of each brace."
-            )
+    out.mkdir(parents=True, exist_ok=True)
+    stats = Counter({f"{k}_seconds": v for k, v in (timings or {}).items()})
+    # out of the queue (core.scheduler) from here on, ingest included
+    Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.RUNNING,
+                                                            updated=timezone.now())
+    events.publish(job_id, events.job_status(job_id, 0))
+    if upload and not Path(payload).exists():
+        try:
+            with metrics.stage("ingest", stats):
+                ingest.to_payload(upload["path"], payload, upload["prompt"],
+                                  upload.get("split", "statement"))
+        except ingest.IngestError as e:
+            _fail(job_id, str(e))
+            return
+    with metrics.stage("read_inputs", stats):
+        rows = list(logic.iter_rows(*logic.read_inputs(payload)))
 
+    # only one row per canonical SQL goes to the models; copies get its results
+    with metrics.stage("dedupe", stats):
+        reps, folded = (sqlnorm.dedupe(rows) if getattr(settings, "TRANSLATION_DEDUPE", True)
+                        else (rows, 0))
+    variants = _variants(grid)
+    base = {"deduped_rows": folded,
+            "calls_saved": folded * 2 * len(variants or logic.default_variants())}
+
+    if mode is None:
+        bulk_rows = getattr(settings, "TRANSLATION_BULK_MIN_ROWS", 0)
+        chord_rows = getattr(settings, "TRANSLATION_CHORD_MIN_ROWS", 0)
+        if bulk_rows and len(reps) >= bulk_rows:
+            mode = "bulk"
+        elif chord_rows and len(reps) >= chord_rows:
+            mode = "chord"
+        else:
+            mode = "local"
+    job, _ = Job.objects.update_or_create(id=job_id, defaults={"status": Job.RUNNING, "mode": mode,
+                                                      "total_rows": len(rows),
+                                                      "prompt": rows[0]["prompt"] if rows else "",
+                                                      "variants": grid or None})
+
+    if mode == "chord":
+        size = getattr(settings, "TRANSLATION_CHUNK_ROWS", 25)
+        chunks = [reps[i:i + size] for i in range(0, len(reps), size)]
+        # chunk files persist across retries; count their rows as done already
+        cache.set(f"{job_id}:rows_done",
+                  sum(len(Checkpoint(out / f"checkpoint-{c[0]['idx']}.jsonl").done()
+                          & {r["idx"] for r in c})
+                      for c in chunks), 3600)
+        # a chunk or the assembly failing for good fails the job (job_failed)
+        body = (assemble_results.s(job_id, out_dir, base, max_in_flight, dict(stats))
+                .set(**_route(job)).on_error(job_failed.s(job_id)))
+        chord(
+            translate_chunk.s(job_id, chunk, len(reps), out_dir, max_in_flight, grid)
+            .set(**_route(job))
+            for chunk in chunks
+        )(body)
+        return
+
+    ckpt  = Checkpoint(out / "checkpoint.jsonl")
+    done  = ckpt.done()
+    todo  = [r for r in reps if r["idx"] not in done]
+    store = ResultStore(job_id)
+    sink  = sqlnorm.fan_out(_tee(ckpt.append, store.add))
+    # every unfinished row is attempted again below, so start a fresh queue
+    failed = FailedRows(out / "failed.jsonl")
+    failed.clear()
+
+    def on_row(n: int, total: int) -> None:
+        _progress(job_id, len(reps) - len(todo) + n, len(reps))
+
+    pending = None
+    with metrics.stage("translate", stats), store:
+        if mode == "bulk":
+            # the provider batches run for hours: poll them from re-scheduled
+            # runs of this task (their ids are in batch.json), never by sleeping
             try:
-                ant_msg = logic.ant.messages.create(
-                    model=logic.ANT_MODEL,
-                    max_tokens=logic.ANT_MAX_TOKENS,
-                    temperature=temp,
-                    system=system_msg,
-                    messages=[
-                        {"role": "user",
-                         "content": [{"type": "text", "text": user_prompt}]}
-                    ],
-                )
-                text_out = ant_msg.content[0].text.strip()
-            except Exception as e:
-                text_out = f"[Translation Error] {e}"
-
-            def grab(header: str) -> str:
-                import re
-
-                m = re.search(rf"\{{\s*{header}\s*:(.+?)\}}",
-                              text_out, re.I | re.S)
-                return m.group(1).strip() if m else ""
-
-            base = {"SQL_Index": idx + 1, "Temperature": temp, "prompt": prompt}
-            trans_rows.extend(
-                [
-                    {**base, "Type": "Objective", "Content": grab("Objective")},
-                    {**base, "Type": "Business Rules", "Content": grab("Business Rules")},
-                    {**base, "Type": "Execution Steps", "Content": grab("Execution Steps")},
-                ]
-            )
-
-            eval_prompt = (
-                "OUTPUT EXACTLY in this format:\n"
-                "{ACCURACY: 0/1; Accuracy Confidence: n%; Explanation: ...}\n"
-                "{CONCISENESS: 0/1; Conciseness Confidence: n%; Explanation: ...}\n"
-                "{COMPLETENESS: 0/1; Completeness Confidence: n%; Explanation: ...}\n\n"
-                f"Translation:\n\"\"\"{text_out}\"\"\""
-            )
-            try:
-                eva = logic.oa.chat.completions.create(
-                    model=logic.OA_MODEL,
-                    temperature=0,
-                    max_tokens=logic.OA_MAX_TOKENS,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful evaluator."},
-                        {"role": "user", "content": eval_prompt},
-                    ],
-                )
-                raw_eval = eva.choices[0].message.content.strip()
-            except Exception as e:
-                raw_eval = f"[Evaluation Error] {e}"
-
-            mets = logic._parse_eval_block(raw_eval)
-            for off in range(3):
-                eval_rows.append({**trans_rows[-3 + off], **mets})
-
-        cache.set(job_id, int((idx + 1) / total * 100), 3600)
+                batch.run_rows_batch(todo, out / "batch.json",
+                                     on_progress=lambda n, total: _progress(job_id, n, total),
+                                     stats=stats, sink=sink, on_fail=failed.append,
+                                     grid=variants)
+            except batch.Pending as p:
+                pending = p
+        else:
+            # rows run concurrently when max_in_flight > 1; output order is unchanged
+            logic.run_rows(todo, max_in_flight=max_in_flight, on_row=on_row,
+                           stats=stats, sink=sink, on_fail=failed.append, grid=variants)
 
-    out.mkdir(parents=True, exist_ok=True)
-    pd.DataFrame(trans_rows).to_excel(out / "translation_results.xlsx", index=False)
-    pd.DataFrame(eval_rows).to_excel(out / "analysis_results.xlsx", index=False)
+    if pending is not None:
+        if polls >= batch.MAX_POLLS:
+            _fail(job_id, f"provider batches unfinished after {polls} polls")
+        else:
+            run_translation.apply_async(
+                (payload, out_dir),
+                {"max_in_flight": max_in_flight, "mode": mode, "timings": timings,
+                 "grid": grid, "polls": polls + 1},
+                task_id=job_id, countdown=pending.countdown, **_route(job))
+        return
 
-    media_tmp = Path("media/tmp")
-    media_tmp.mkdir(parents=True, exist_ok=True)
-    zip_path = media_tmp / f"{job_id}.zip"
-    with ZipFile(zip_path, "w", ZIP_DEFLATED) as zf:
-        zf.write(out / "translation_results.xlsx", "translation.xlsx")
-        zf.write(out / "analysis_results.xlsx", "analysis.xlsx")
+    _finish(job_id, out, [ckpt],
+            {**logic.summarize(stats), **base, "mode": mode, "resumed_rows": len(done)},
+            max_in_flight)
 
-    cache.set(job_id, 100, 3600)
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def translate_chunk(job_id: str, rows: list, total: int, out_dir: str,
+                    max_in_flight: int | None = None, grid: list | None = None) -> dict:
+    """One slice of a fanned-out job; re-delivered if its worker dies."""
+    ckpt = Checkpoint(Path(out_dir) / f"checkpoint-{rows[0]['idx']}.jsonl")
+    done = ckpt.done()
+    failed = FailedRows(Path(out_dir) / f"failed-{rows[0]['idx']}.jsonl")
+    failed.clear()
+
+    def on_row(n: int, chunk_total: int) -> None:
+        key = f"{job_id}:rows_done"
+        cache.add(key, 0, 3600)                  # expired in a long job: count on from 0
+        _progress(job_id, cache.incr(key), total)
+        cache.touch(key, 3600)
+
+    stats = Counter()
+    with metrics.stage("translate", stats), ResultStore(job_id) as store:
+        logic.run_rows([r for r in rows if r["idx"] not in done], max_in_flight,
+                       on_row=on_row, stats=stats,
+                       sink=sqlnorm.fan_out(_tee(ckpt.append, store.add)),
+                       on_fail=failed.append, grid=_variants(grid))
+    metrics.flush()
+    return {"checkpoint": str(ckpt.path), "stats": dict(stats), "resumed_rows": len(done)}
+
+
+@shared_task
+def assemble_results(chunks: list, job_id: str, out_dir: str,
+                     base: dict | None = None, max_in_flight: int | None = None,
+                     stats: dict | None = None) -> None:
+    """
+    Chord callback: complete the stored rows from the chunk checkpoints.
+    *stats* are the parent task's counters (read/dedupe timings); the chunks'
+    translate time is summed across workers, not wall-clock.
+    """
+    stats = Counter(stats or {})
+    for part in chunks:
+        stats.update(part["stats"])
+    _finish(job_id, Path(out_dir), [Checkpoint(p["checkpoint"]) for p in chunks],
+            {**logic.summarize(stats), **(base or {}), "mode": "chord",
+             "chunks": len(chunks),
+             "resumed_rows": sum(p["resumed_rows"] for p in chunks)},
+            max_in_flight)
+
+
+@shared_task
+def job_failed(request, exc, traceback, job_id: str) -> None:
+    """Errback of a fanned-out job's chord: a chunk or the assembly failed for good."""
+    _fail(job_id, f"{type(exc).__name__}: {exc}")
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def rerun_failed(job_id: str, out_dir: str, max_in_flight: int | None = None,
+                 attempt: int = 1) -> None:
+    """
+    Targeted re-run of the rows queued in failed*.jsonl.  Recovered rows go
+    to checkpoint-rerun.jsonl (and the database), rows that fail again are
+    re-queued; a bumped ``Job.updated`` gives the download a new ETag.
+    """
+    out = Path(out_dir)
+    if not out.is_dir():                         # swept by the janitor meanwhile
+        return
+    queues = sorted(out.glob("failed*.jsonl"))
+    done   = set().union(*(Checkpoint(p).done() for p in out.glob("checkpoint*.jsonl")))
+    rows   = {r["idx"]: r for q in queues for r in FailedRows(q).rows() if r["idx"] not in done}
+    job    = Job.objects.filter(id=job_id).only("id", "variants").first()
+
+    ckpt, still, stats = Checkpoint(out / "checkpoint-rerun.jsonl"), [], Counter()
+    with metrics.stage("rerun", stats), ResultStore(job_id) as store:
+        logic.run_rows(list(rows.values()), max_in_flight, stats=stats,
+                       sink=sqlnorm.fan_out(_tee(ckpt.append, store.add)),
+                       on_fail=lambda row, error: still.append((row, error)),
+                       grid=_variants(job and job.variants))
+
+    # the old queues are only dropped once the survivors are known
+    for q in queues:
+        q.unlink()
+    queue = FailedRows(out / "failed.jsonl")
+    for row, error in still:
+        queue.append(row, error)
+
+    summary_path = out / "summary.json"
+    summary = json.loads(summary_path.read_text()) if summary_path.exists() else {}
+    summary.update({"failed_rows": len(still), "rerun_attempt": attempt,
+                    "rerun_rows": len(rows)})
+    timings = summary.setdefault("timings", {})
+    for k, v in logic.summarize(stats)["timings"].items():
+        timings[k] = round(timings.get(k, 0) + v, 3)
+    _finish(job_id, out, [Checkpoint(p) for p in sorted(out.glob("checkpoint*.jsonl"))],
+            summary, max_in_flight, attempt)
+
+
+@shared_task
+def sweep_artifacts() -> dict:
+    """
+    Janitor (celery beat, every ARTIFACT_SWEEP_SECONDS): fail running jobs
+    without a heartbeat for JOB_STALE_SECONDS (a lost worker), then enforce
+    ARTIFACT_TTL and ARTIFACT_QUOTA_MB on MEDIA_ROOT/tmp and the job
+    directories.  Running jobs and those waiting for a re-run keep their
+    directory.
+    """
+    stale_after = getattr(settings, "JOB_STALE_SECONDS", 3600)
+    stale = Job.objects.filter(status=Job.RUNNING,
+                               updated__lt=timezone.now() - timedelta(seconds=stale_after))
+    stale_ids = [str(i) for i in stale.values_list("id", flat=True)]
+    for job_id in stale_ids:
+        _fail(job_id, f"no progress for {stale_after} s; the worker was lost")
+
+    keep = Job.objects.filter(Q(status__in=(Job.QUEUED, Job.RUNNING))
+                              | Q(summary__rerun_scheduled=True))
+    return {"stale_jobs": len(stale_ids), **artifacts.sweep(
+        [Path(settings.MEDIA_ROOT) / "tmp", artifacts.job_root()],
+        getattr(settings, "ARTIFACT_TTL", 24 * 3600),
+        getattr(settings, "ARTIFACT_QUOTA_MB", 2048) * 2**20,
+        keep={str(i) for i in keep.values_list("id", flat=True)})}
@@ -0,0 +1,8 @@
+# core/tests/__init__.py
+"""
+Behaviour tests, one module per feature; ``support`` runs them against
+``core.fake_llm`` with eager Celery and an in-process cache, so no broker,
+Redis or API key is needed:
+
+    python manage.py test core
+"""
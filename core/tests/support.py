@@ -0,0 +1,97 @@
+# core/tests/support.py
+"""
+Shared set-up of the test modules: the model calls go to ``core.fake_llm``
+on a local port, Celery runs eagerly and the provider budgets, response
+cache and similarity index are out of the way.  A module opts in with
+
+    setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+
+from django.test import override_settings
+
+from .. import fake_llm, logic
+from ..models import Job
+from ..payload import write_payload
+from ..ratelimit import ProviderLimiter
+
+TMP = Path(tempfile.gettempdir()) / f"sqlsite-tests-{os.getpid()}"
+PROMPT = "Explain it."
+
+_saved = {}
+
+
+def setUpModule():
+    from sql_site.celery import app
+
+    TMP.mkdir(parents=True, exist_ok=True)
+    server, url = fake_llm.serve()
+    _saved["server"] = server
+    env = {"ANTHROPIC_BASE_URL": url, "OPENAI_BASE_URL": f"{url}/v1",
+           "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY") or "test",
+           "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "test"}
+    _saved["env"] = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    logic._proc.clear()                          # clients are built again, on the stub
+    _saved.update(limits=(logic.ant_limit, logic.oa_limit),
+                  indexes=(logic.llm_cache.enabled, logic.sql_index.enabled),
+                  eager=app.conf.task_always_eager)
+    logic.ant_limit = ProviderLimiter(1e9, 1e12)
+    logic.oa_limit  = ProviderLimiter(1e9, 1e12)
+    logic.llm_cache.enabled = logic.sql_index.enabled = False
+    app.conf.task_always_eager = True
+    for name in ("core.events", "core.metrics"):   # no Redis here
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+
+def tearDownModule():
+    from sql_site.celery import app
+
+    app.conf.task_always_eager = _saved.pop("eager")
+    logic.ant_limit, logic.oa_limit = _saved.pop("limits")
+    logic.llm_cache.enabled, logic.sql_index.enabled = _saved.pop("indexes")
+    for k, v in _saved.pop("env").items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    logic._proc.clear()
+    _saved.pop("server").shutdown()
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def job_rows(sqls, prompt=PROMPT):
+    return list(logic.iter_rows(sqls, [prompt] * len(sqls)))
+
+
+def isolated(**extra):
+    """Settings of a test: in-process cache, a scratch job root, plain http."""
+    return override_settings(
+        SECURE_SSL_REDIRECT=False,
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        TRANSLATION_JOB_ROOT=TMP / "jobs", MEDIA_ROOT=TMP / "media", **extra)
+
+
+def scratch() -> Path:
+    """A fresh directory under TMP."""
+    TMP.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(dir=TMP))
+
+
+def run_job(out: Path, sqls=(), job_id=None, **kwargs) -> Job:
+    """``run_translation`` (eagerly) on *sqls* in job directory *out*; the Job afterwards."""
+    from ..tasks import run_translation
+
+    out.mkdir(parents=True, exist_ok=True)
+    if not (out / "job.jsonl").exists():
+        write_payload(out / "job.jsonl", sqls, PROMPT)
+    job_id = job_id or str(uuid.uuid4())
+    Job.objects.get_or_create(id=job_id)
+    run_translation.apply((str(out / "job.jsonl"), str(out)), kwargs, task_id=job_id)
+    return Job.objects.get(id=job_id)
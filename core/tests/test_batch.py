@@ -0,0 +1,68 @@
+# core/tests/test_batch.py
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from .. import batch, fake_llm
+from ..models import Job, ResultRow
+from . import support
+from .support import isolated, run_job, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+SQLS = [f"SELECT c{i} FROM t{i} WHERE d = {i}" for i in range(5)] + ["select c0 from t0 where d = 0"]
+
+
+@isolated(TRANSLATION_RERUN_ATTEMPTS=0)
+class BulkModeTests(TransactionTestCase):
+    """Bulk jobs poll their provider batches from re-scheduled task runs."""
+
+    def setUp(self):
+        handler = fake_llm.FakeLLMHandler
+        self.addCleanup(setattr, handler, "batch_polls", handler.batch_polls)
+        self.batches = len(handler.ant_batches), len(handler.oa_batches)
+        self.calls   = 0
+        self.real    = batch.run_rows_batch
+
+    def _counted(self, fail_on=None):
+        def run_rows_batch(*args, **kwargs):
+            self.calls += 1
+            if self.calls == fail_on:
+                raise ConnectionError("transient")
+            return self.real(*args, **kwargs)
+        return mock.patch.object(batch, "run_rows_batch", run_rows_batch)
+
+    def _new_batches(self):
+        handler = fake_llm.FakeLLMHandler
+        return (len(handler.ant_batches) - self.batches[0],
+                len(handler.oa_batches) - self.batches[1])
+
+    def test_bulk_job_sends_one_batch_per_provider(self):
+        out = scratch()
+        with self._counted():
+            job = run_job(out, SQLS, mode="bulk")
+        self.assertEqual((job.status, job.mode), (Job.DONE, "bulk"))
+        self.assertEqual(self._new_batches(), (1, 1))
+        self.assertEqual(self.calls, 1)          # the stub's batches end on the first read
+        self.assertEqual(job.summary["deduped_rows"], 1)
+        self.assertEqual(ResultRow.objects.filter(job=job).values("sql_index").distinct().count(),
+                         len(SQLS))
+        self.assertFalse((out / "batch.json").exists())
+
+    def test_an_error_after_many_polls_is_retried_not_fatal(self):
+        # the error comes after 4 polls: had the polls been retries, the
+        # error's own retry would be past the task's max_retries
+        fake_llm.FakeLLMHandler.batch_polls = 4
+        with self._counted(fail_on=5), mock.patch.object(batch, "MAX_POLLS", 6):
+            job = run_job(scratch(), SQLS, mode="bulk")
+        self.assertEqual(self.calls, 8)
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(self._new_batches(), (1, 1))   # the retry resumed the same batches
+
+    def test_batches_that_never_finish_fail_the_job(self):
+        fake_llm.FakeLLMHandler.batch_polls = 50
+        with self._counted(), mock.patch.object(batch, "MAX_POLLS", 3):
+            job = run_job(scratch(), SQLS, mode="bulk")
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("unfinished after 3 polls", job.summary["error"])
+        self.assertEqual(self.calls, 4)
@@ -0,0 +1,54 @@
+# core/tests/test_checkpoint.py
+from django.test import TestCase, TransactionTestCase
+
+from ..checkpoint import Checkpoint, iter_results
+from ..models import ResultRow
+from . import support
+from .support import isolated, job_rows, run_job, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class CheckpointTests(TestCase):
+    def setUp(self):
+        self.path = scratch() / "checkpoint.jsonl"
+
+    def test_done_cuts_a_torn_tail(self):
+        ck = Checkpoint(self.path)
+        for row in job_rows(["SELECT 1", "SELECT 2"]):
+            ck.append(row, [{"Content": row["sql_code"]}], [])
+        with self.path.open("a") as fh:
+            fh.write('{"idx": 2, "trans": [')       # crashed mid-line
+        self.assertEqual(ck.done(), {0, 1})
+        self.assertTrue(self.path.read_bytes().endswith(b"\n"))
+        ck.append(job_rows(["a", "b", "SELECT 3"])[2], [{"Content": "SELECT 3"}], [])
+        self.assertEqual(ck.done(), {0, 1, 2})
+
+    def test_results_come_back_in_idx_order(self):
+        a, b = Checkpoint(self.path), Checkpoint(self.path.with_name("checkpoint-2.jsonl"))
+        rows = job_rows(["q0", "q1", "q2", "q3"])
+        for ck, row in ((b, rows[3]), (a, rows[1]), (b, rows[2]), (a, rows[0])):
+            ck.append(row, [{"Content": row["sql_code"]}], [])
+        self.assertEqual([t[0]["Content"] for t, _ in iter_results([a, b])],
+                         ["q0", "q1", "q2", "q3"])
+        recs, off = a.read_from(0, 1)
+        self.assertEqual([r["idx"] for r in recs], [1])
+        self.assertEqual([r["idx"] for r in a.read_from(off, 10)[0]], [0])
+
+
+@isolated(TRANSLATION_CHORD_MIN_ROWS=0, TRANSLATION_BULK_MIN_ROWS=0,
+          TRANSLATION_RERUN_ATTEMPTS=0)
+class ResumeTests(TransactionTestCase):
+    def test_rerun_resumes_from_the_checkpoint(self):
+        out = scratch()
+        sqls = [f"SELECT {i} FROM t{i}" for i in range(4)]
+        first = run_job(out, sqls)
+        ck = out / "checkpoint.jsonl"
+        lines = ck.read_bytes().splitlines(keepends=True)
+        ck.write_bytes(b"".join(lines[:2]) + lines[2][:20])   # two rows, then a torn one
+        again = run_job(out, sqls)
+        self.assertEqual(first.summary["resumed_rows"], 0)
+        self.assertEqual(again.summary["resumed_rows"], 2)
+        self.assertEqual(again.summary["cache_misses"], first.summary["cache_misses"] // 2)
+        self.assertEqual(ResultRow.objects.filter(job=again).values("sql_index").distinct().count(), 4)
+        self.assertEqual(len(Checkpoint(ck).done()), 4)
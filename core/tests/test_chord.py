@@ -0,0 +1,53 @@
+# core/tests/test_chord.py
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from .. import logic
+from ..checkpoint import Checkpoint
+from ..models import Job, ResultRow
+from . import support
+from .support import isolated, run_job, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+SQLS = [f"SELECT c{i} FROM t{i}" for i in range(5)] + ["select c4 from t4"]
+
+
+@isolated(TRANSLATION_CHORD_MIN_ROWS=2, TRANSLATION_BULK_MIN_ROWS=0, TRANSLATION_CHUNK_ROWS=2,
+          TRANSLATION_RERUN_ATTEMPTS=0)
+class ChordTests(TransactionTestCase):
+    """Jobs fanned out to ``translate_chunk`` subtasks and put together by ``assemble_results``."""
+
+    def test_chunks_are_assembled_into_one_job(self):
+        out = scratch()
+        job = run_job(out, SQLS)
+        self.assertEqual((job.status, job.mode), (Job.DONE, "chord"))
+        self.assertEqual((job.summary["chunks"], job.summary["deduped_rows"]), (3, 1))
+        self.assertEqual(sorted(p.name for p in out.glob("checkpoint*.jsonl")),
+                         ["checkpoint-0.jsonl", "checkpoint-2.jsonl", "checkpoint-4.jsonl"])
+        self.assertEqual(len(Checkpoint(out / "checkpoint-4.jsonl").done()), 2)   # with the copy
+        self.assertEqual(sorted(set(ResultRow.objects.filter(job=job)
+                                    .values_list("sql_index", flat=True))), list(range(1, 7)))
+
+    def test_a_rerun_resumes_the_finished_chunks(self):
+        out = scratch()
+        first = run_job(out, SQLS)
+        (out / "checkpoint-2.jsonl").unlink()
+        again = run_job(out, SQLS, job_id=str(first.id))
+        self.assertEqual(again.status, Job.DONE)
+        self.assertEqual(again.summary["resumed_rows"], 4)          # copies included
+        self.assertEqual(again.summary["cache_misses"], 2 * first.summary["cache_misses"] // 5)
+
+    def test_a_failing_chunk_fails_the_job(self):
+        real = logic.run_rows
+
+        def run_rows(rows, *args, **kwargs):
+            if any(r["idx"] == 2 for r in rows):
+                raise RuntimeError("worker blew up")
+            return real(rows, *args, **kwargs)
+
+        with mock.patch.object(logic, "run_rows", run_rows):
+            job = run_job(scratch(), SQLS)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("worker blew up", job.summary["error"])
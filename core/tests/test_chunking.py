@@ -0,0 +1,52 @@
+# core/tests/test_chunking.py
+from collections import Counter
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import logic
+from ..chunking import split_row
+from ..ratelimit import estimate_tokens
+from . import support
+from .support import job_rows
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class ChunkingTests(TestCase):
+    def test_small_row_is_kept_whole(self):
+        row = job_rows(["SELECT 1;\nSELECT 2;"])[0]
+        self.assertEqual(split_row(row, 1000), [row])
+
+    def test_parts_cover_the_row_with_absolute_ranges(self):
+        stmts = [f"SELECT col_{i}, other_{i}\nFROM table_{i}\nWHERE id = {i};" for i in range(40)]
+        row = job_rows(["-- header", "\n".join(stmts)])[1]
+        parts = split_row(row, 60)
+        self.assertGreater(len(parts), 1)
+        self.assertEqual([p["part"] for p in parts], list(range(len(parts))))
+        for p in parts:
+            self.assertLessEqual(estimate_tokens(p["sql_code"]), 60)
+            first, last = map(int, p["line_spec"][len("(lines "):-1].split("-"))
+            lines = row["sql_code"].splitlines()[first - row["ln_start"]:last - row["ln_start"] + 1]
+            self.assertEqual("\n".join(lines), p["sql_code"])
+        self.assertEqual("\n".join(p["sql_code"] for p in parts), row["sql_code"])
+
+    def test_an_oversized_statement_is_cut_between_lines(self):
+        sql = "SELECT\n" + ",\n".join(f"  column_number_{i}" for i in range(200)) + "\nFROM t"
+        parts = split_row(job_rows([sql])[0], 50)
+        self.assertGreater(len(parts), 1)
+        lines = [ln.strip() for p in parts for ln in p["sql_code"].splitlines()]
+        self.assertEqual(lines, [ln.strip() for ln in sql.splitlines()])
+        self.assertEqual(parts[-1]["line_spec"], f"(lines {len(lines) - 1}-{len(lines)})")
+
+    def test_a_split_row_is_translated_part_by_part(self):
+        stmts = [f"SELECT col_{i}, other_{i}\nFROM table_{i}\nWHERE id = {i};" for i in range(10)]
+        row   = job_rows(["\n".join(stmts)])[0]
+        stats = Counter()
+        with mock.patch.object(logic, "ANT_CHUNK_TOKENS", 60):
+            parts = logic._parts(row)
+            trans, _ = logic.run_rows([row], stats=stats)
+        self.assertEqual((stats["chunked_rows"], stats["chunks"]), (1, len(parts)))
+        objective = next(r["Content"] for r in trans if r["Type"] == "Objective")
+        for p in parts:                              # every part answered with its own range
+            self.assertIn(p["line_spec"], objective)
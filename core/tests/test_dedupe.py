@@ -0,0 +1,70 @@
+# core/tests/test_dedupe.py
+from django.test import TestCase, TransactionTestCase
+
+from .. import sqlnorm
+from ..chunking import split_row
+from ..models import Job, ResultRow
+from . import support
+from .support import isolated, job_rows, run_job, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class DedupeTests(TestCase):
+    def test_equivalent_sql_is_translated_once(self):
+        rows = job_rows(["select a from t", "SELECT a\n  FROM t -- again", "select b from t"])
+        reps, folded = sqlnorm.dedupe(rows)
+        self.assertEqual((len(reps), folded), (2, 1))
+        self.assertEqual(reps[0]["copies"], [rows[1]])
+        self.assertEqual(rows[0]["sql_hash"], rows[1]["sql_hash"])
+
+    def test_fan_out_rebases_line_ranges(self):
+        rows = job_rows(["select a from t", "x\ny", "SELECT a\n  FROM t"])
+        reps, _ = sqlnorm.dedupe(rows)
+        seen = {}
+        sink = sqlnorm.fan_out(lambda row, trans, evals: seen.setdefault(row["idx"], trans))
+        rep = reps[0]
+        sink(rep, [{"SQL_Index": 1, "Content": f"{{Objective: reads a {rep['line_spec']}}}"}], [])
+        self.assertEqual(seen[0][0]["Content"], "{Objective: reads a (lines 1-1)}")
+        self.assertEqual(seen[2][0]["Content"], "{Objective: reads a (lines 4-5)}")
+        self.assertEqual(seen[2][0]["SQL_Index"], 3)
+
+    def test_copies_are_written_before_their_representative(self):
+        reps, _ = sqlnorm.dedupe(job_rows(["select 1", "SELECT 1", "select  1"]))
+        order = []
+        sqlnorm.fan_out(lambda row, trans, evals: order.append(row["idx"]))(reps[0], [], [])
+        self.assertEqual(order, [1, 2, 0])
+
+    def test_part_ranges_shift_with_the_copy(self):
+        sql = "\n".join(f"select {i};" for i in range(11))
+        src = {"sql_code": sql, "ln_start": 10, "line_spec": "(lines 10-20)"}
+        dst = {"sql_code": sql, "ln_start": 30, "line_spec": "(lines 30-40)"}
+        self.assertEqual(sqlnorm.move_spans("all (lines 10-20), part (lines 12-14)", src, dst),
+                         "all (lines 30-40), part (lines 32-34)")
+
+    def test_part_ranges_follow_the_statements_of_a_reformatted_copy(self):
+        rep_sql  = "select a from t;\nselect b from t where x = 1;\nselect c from t;"
+        copy_sql = "SELECT a\n  FROM t;\n\n-- b\nSELECT b\n  FROM t\n WHERE x = 1;\nselect c from t;"
+        rows = job_rows([rep_sql, copy_sql])
+        (rep,), _ = sqlnorm.dedupe(rows)
+        parts = split_row(rep, 8)
+        self.assertEqual(len(parts), 3)
+        text  = " ".join(p["line_spec"] for p in parts)
+        moved = sqlnorm.move_spans(text, rep, rows[1])
+        lines = copy_sql.splitlines()
+        got   = [sqlnorm.canonical("\n".join(lines[int(a) - rows[1]["ln_start"]:
+                                                   int(b) - rows[1]["ln_start"] + 1]))
+                 for a, b in sqlnorm._SPAN.findall(moved)]
+        self.assertEqual(got, [sqlnorm.canonical(p["sql_code"]) for p in parts])
+
+
+@isolated(TRANSLATION_CHORD_MIN_ROWS=0, TRANSLATION_BULK_MIN_ROWS=0,
+          TRANSLATION_RERUN_ATTEMPTS=0)
+class DedupeJobTests(TransactionTestCase):
+    def test_job_runs_and_copies_get_their_own_ranges(self):
+        job = run_job(scratch(), ["SELECT a FROM t", "SELECT b\nFROM t", "select a from t"])
+        self.assertEqual((job.status, job.summary["deduped_rows"]), (Job.DONE, 1))
+        rows = ResultRow.objects.filter(job=job)
+        self.assertEqual(sorted(set(rows.values_list("sql_index", flat=True))), [1, 2, 3])
+        copy = rows.filter(sql_index=3).exclude(content="").first()
+        self.assertIn("(lines 4-4)", copy.content)
@@ -0,0 +1,85 @@
+# core/tests/test_download.py
+import csv
+import io
+import os
+import uuid
+from zipfile import ZipFile
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import artifacts
+from ..models import Job, ResultRow
+from .support import isolated, scratch
+
+
+@isolated()
+class DownloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.job = Job.objects.create(id=uuid.uuid4(), status=Job.DONE, total_rows=30,
+                                      prompt="Explain it.", summary={"rows": 30})
+        ResultRow.objects.bulk_create(
+            ResultRow(job=self.job, sql_index=i, temperature=0.2, type=t,
+                      content=f"row {i} {t} " * 20, accurate=1, accurate_confidence=90)
+            for i in range(1, 31) for t in ("Objective", "Business Rules"))
+        self.url  = f"/api/jobs/{self.job.id}/download/?format=csv"
+        self.full = self.client.get(self.url)
+        self.body = b"".join(self.full.streaming_content)
+
+    def test_full_download_is_a_zip_of_the_rows(self):
+        self.assertEqual(self.full.status_code, 200)
+        self.assertEqual(self.full["Accept-Ranges"], "bytes")
+        with ZipFile(io.BytesIO(self.body)) as zf:
+            self.assertEqual(sorted(zf.namelist()),
+                             ["analysis.csv", "summary.json", "translation.csv"])
+            rows = list(csv.DictReader(io.StringIO(zf.read("translation.csv").decode("utf-8-sig"))))
+        self.assertEqual(len(rows), 60)
+        self.assertEqual([(r["SQL_Index"], r["Type"]) for r in rows[:2]],
+                         [("1", "Objective"), ("1", "Business Rules")])   # as stored
+
+    def test_range_resumes_the_same_bytes(self):
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], f"bytes 100-199/{len(self.body)}")
+        self.assertEqual(b"".join(resp.streaming_content), self.body[100:200])
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=-50")
+        self.assertEqual(b"".join(resp.streaming_content), self.body[-50:])
+
+    def test_unsatisfiable_range_is_416(self):
+        resp = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.body)}-")
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp["Content-Range"], f"bytes */{len(self.body)}")
+
+    def test_etag_and_if_range(self):
+        tag = self.full["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=tag).status_code, 304)
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(resp.status_code, 200)     # stale copy: the whole zip again
+        self.assertEqual(b"".join(resp.streaming_content), self.body)
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=tag)
+        self.assertEqual(resp.status_code, 206)
+
+    def test_unfinished_job_is_409(self):
+        job = Job.objects.create(id=uuid.uuid4(), status=Job.RUNNING)
+        self.assertEqual(self.client.get(f"/api/jobs/{job.id}/download/").status_code, 409)
+
+
+class SweepTests(TestCase):
+    def _entry(self, root, name, size, age, now):
+        path = root / name
+        path.mkdir()
+        (path / "data").write_bytes(b"x" * size)
+        for p in (path / "data", path):
+            os.utime(p, (now - age, now - age))
+
+    def test_expired_then_oldest_entries_go_and_running_jobs_stay(self):
+        root, now = scratch(), 1_000_000.0
+        self._entry(root, "expired", 10, 7200, now)
+        self._entry(root, "running", 300, 9000, now)
+        self._entry(root, "old", 100, 600, now)
+        self._entry(root, "new", 100, 60, now)
+        out = artifacts.sweep([root, root / "missing"], ttl=3600, quota=450,
+                              keep={"running"}, now=now)
+        self.assertEqual(sorted(p.name for p in root.iterdir()), ["new", "running"])
+        self.assertEqual(out, {"removed": 2, "freed_bytes": 110, "used_bytes": 400})
@@ -0,0 +1,39 @@
+# core/tests/test_evalpack.py
+from collections import Counter
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import fake_llm, logic
+from . import support
+from .support import job_rows
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class EvalPackTests(TestCase):
+    def test_a_large_pack_stays_under_the_output_limit(self):
+        self.assertEqual(logic._eval_pack_params("x", 4)["max_tokens"], 4 * logic.OA_MAX_TOKENS)
+        self.assertEqual(logic._eval_pack_params("x", 1000)["max_tokens"], logic.OA_MAX_OUTPUT)
+
+    def _run(self, sqls):
+        stats = Counter()
+        with mock.patch.object(logic, "EVAL_PACK", 4):
+            _, evals = logic.run_rows(job_rows(sqls), max_in_flight=len(sqls), stats=stats)
+        return evals, stats
+
+    def test_rows_finishing_together_share_evaluation_requests(self):
+        sqls = [f"SELECT c{i} FROM t{i}" for i in range(8)]
+        evals, stats = self._run(sqls)
+        self.assertEqual(sorted({r["SQL_Index"] for r in evals}), list(range(1, 9)))
+        self.assertTrue(all(r["Accurate"] == "1" for r in evals))
+        self.assertGreater(stats["eval_packs"], 0)
+        self.assertLess(stats["eval_packs"], len(sqls))
+
+    def test_items_left_out_of_an_answer_are_asked_again(self):
+        handler = fake_llm.FakeLLMHandler
+        self.addCleanup(setattr, handler, "pack_drop", handler.pack_drop)
+        handler.pack_drop = 0.5
+        evals, stats = self._run([f"SELECT d{i} FROM u{i}" for i in range(8)])
+        self.assertEqual(sorted({r["SQL_Index"] for r in evals}), list(range(1, 9)))
+        self.assertEqual(stats["failed_rows"], 0)
@@ -0,0 +1,47 @@
+# core/tests/test_grid.py
+from collections import Counter
+
+from django.test import TestCase
+
+from .. import logic
+from ..models import Job
+from . import support
+from .support import isolated, job_rows
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class GridTests(TestCase):
+    def test_grid_expands_and_drops_duplicates(self):
+        grid = logic.parse_grid({"temperatures": [0, 0.5, 0], "max_tokens": [1000, 2000]})
+        self.assertEqual(len(grid), 4)
+        self.assertEqual({v.model for v in grid}, {logic.ANT_MODEL})
+
+    def test_grid_limits(self):
+        for spec, kw in (([{"model": "some-other-model"}], {}),
+                         ([{"max_tokens": 64000}], {"max_tokens": 8192}),
+                         ({"temperatures": [i / 100 for i in range(101)]}, {"max_variants": 6}),
+                         ({"models": "all"}, {}),
+                         ([{"temperature": 2}], {}),
+                         (["not-a-dict"], {})):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                logic.parse_grid(spec, **kw)
+        self.assertEqual(logic.parse_grid([{"model": "m2"}], models=["m2"])[0].model, "m2")
+
+    @isolated(GRID_MODELS=[], GRID_MAX_TOKENS=8192)
+    def test_view_rejects_a_grid_out_of_bounds(self):
+        resp = self.client.post("/api/translate/", {"sql_code": "SELECT 1",
+                                                    "grid": '[{"max_tokens": 64000}]'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_every_row_runs_under_every_variant(self):
+        grid  = logic.parse_grid({"temperatures": [0, 0.7]})
+        stats = Counter()
+        trans, evals = logic.run_rows(job_rows(["SELECT a FROM t", "SELECT b FROM t"]),
+                                      stats=stats, grid=grid)
+        labels = {v.label for v in grid}
+        self.assertEqual(len(labels), 2)
+        for recs in (trans, evals):
+            self.assertEqual({(r["SQL_Index"], r["Variant"]) for r in recs},
+                             {(i, label) for i in (1, 2) for label in labels})
@@ -0,0 +1,97 @@
+# core/tests/test_ingest.py
+import csv
+import uuid
+from zipfile import ZipFile
+
+from django.test import TestCase, TransactionTestCase
+from openpyxl import Workbook
+
+from .. import ingest
+from ..models import Job
+from ..payload import read_payload
+from ..tasks import run_translation
+from . import support
+from .support import isolated, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+SCRIPT = ("-- nightly load\nSELECT 'a;b' AS x;\n/* step; two */\n"
+          "UPDATE t\n   SET y = 1\n WHERE z = ';';\n-- trailing note\n")
+
+
+class IngestTests(TestCase):
+    def _upload(self, name, data):
+        path = scratch() / name
+        (path.write_bytes if isinstance(data, bytes) else path.write_text)(data)
+        return path
+
+    def test_statements_split_outside_strings_and_comments(self):
+        rows = list(ingest.read_upload(self._upload("job.sql", SCRIPT)))
+        self.assertEqual(rows, ["-- nightly load\nSELECT 'a;b' AS x;",
+                                "/* step; two */\nUPDATE t\n   SET y = 1\n WHERE z = ';';"])
+        self.assertEqual(list(ingest.read_upload(self._upload("job.txt", SCRIPT), "file")),
+                         [SCRIPT.rstrip()])
+
+    def test_statements_are_read_a_few_lines_at_a_time(self):
+        read = []
+
+        def lines():
+            for i in range(10_000):
+                read.append(i)
+                yield f"SELECT {i};\n"
+
+        stmts = ingest._statements(lines())
+        self.assertEqual([next(stmts), next(stmts)], ["SELECT 0;", "SELECT 1;"])
+        self.assertEqual(len(read), 2)
+
+    def test_tables_use_the_sql_code_column(self):
+        path = scratch() / "job.csv"
+        with path.open("w", newline="") as fh:
+            csv.writer(fh).writerows([["id", "SQL_Code"], [1, "SELECT 1"], [2, " "], [3, "SELECT\n3"]])
+        self.assertEqual(list(ingest.read_upload(path)), ["SELECT 1", "SELECT\n3"])
+        wb = Workbook()
+        for row in (["SELECT x"], ["SELECT y"], [None]):   # no sql_code header: the first column
+            wb.active.append(row)
+        wb.save(path := scratch() / "job.xlsx")
+        self.assertEqual(list(ingest.read_upload(path)), ["SELECT y"])
+
+    def test_zip_members_in_name_order(self):
+        path = scratch() / "job.zip"
+        with ZipFile(path, "w") as zf:
+            zf.writestr("b.sql", "SELECT 2;\nSELECT 3;")
+            zf.writestr("a.SQL", "SELECT 1;")
+            zf.writestr("notes.txt", "SELECT 0;")
+            zf.writestr("__MACOSX/._a.sql", "junk")
+        self.assertEqual(list(ingest.read_upload(path)), ["SELECT 1;", "SELECT 2;", "SELECT 3;"])
+        self.assertEqual(list(ingest.read_upload(path, "file")), ["SELECT 1;", "SELECT 2;\nSELECT 3;"])
+
+    def test_to_payload_writes_payload_and_source(self):
+        out = scratch()
+        self.assertEqual(ingest.to_payload(self._upload("job.sql", SCRIPT), out / "job.jsonl",
+                                           "Explain it."), 2)
+        prompt, sqls = read_payload(out / "job.jsonl")
+        self.assertEqual((prompt, len(list(sqls))), ("Explain it.", 2))
+        self.assertTrue((out / "source.sql").exists())
+
+    def test_unusable_uploads_are_rejected_without_leftovers(self):
+        out = scratch()
+        for name, data in (("empty.sql", "-- nothing here\n"), ("job.exe", "SELECT 1"),
+                           ("job.zip", b"not a zip")):
+            with self.subTest(name=name), self.assertRaises(ingest.IngestError):
+                ingest.to_payload(self._upload(name, data), out / "job.jsonl", "Explain it.")
+        self.assertEqual(list(out.iterdir()), [])
+
+
+@isolated(TRANSLATION_CHORD_MIN_ROWS=0, TRANSLATION_BULK_MIN_ROWS=0,
+          TRANSLATION_RERUN_ATTEMPTS=0)
+class IngestJobTests(TransactionTestCase):
+    def test_unreadable_upload_fails_the_job(self):
+        out = scratch()
+        (out / "upload.xlsx").write_bytes(b"not a workbook")
+        job_id = str(uuid.uuid4())
+        Job.objects.create(id=job_id)
+        run_translation.apply((str(out / "job.jsonl"), str(out)),
+                              {"upload": {"path": str(out / "upload.xlsx"),
+                                          "prompt": "Explain it.", "split": "file"}},
+                              task_id=job_id)
+        self.assertEqual(Job.objects.get(id=job_id).status, Job.FAILED)
@@ -0,0 +1,60 @@
+# core/tests/test_llm_cache.py
+from collections import Counter
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import logic
+from ..llm_cache import LLMCache
+from . import support
+from .support import job_rows, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class LLMCacheTests(SimpleTestCase):
+    def _cache(self, **kwargs) -> LLMCache:
+        opts = {"ttl": 3600, "max_bytes": 2**20}
+        return LLMCache(str(scratch() / "llm.sqlite3"), **{**opts, **kwargs})
+
+    def test_key_covers_every_input(self):
+        key = LLMCache.key("m", 0.1, "system", "prompt")
+        self.assertEqual(key, LLMCache.key("m", 0.1, "system", "prompt"))
+        self.assertEqual(len({key, LLMCache.key("m2", 0.1, "system", "prompt"),
+                              LLMCache.key("m", 0.2, "system", "prompt"),
+                              LLMCache.key("m", 0.1, [{"text": "system"}], "prompt"),
+                              LLMCache.key("m", 0.1, "system", "prompt.")}), 5)
+
+    def test_get_set_and_expiry(self):
+        cache = self._cache()
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", "answer")
+        self.assertEqual(cache.get("k"), "answer")
+        cache.ttl = -1
+        self.assertIsNone(cache.get("k"))
+        cache.ttl = 3600
+        self.assertIsNone(cache.get("k"))                 # the expired row is gone
+
+    def test_eviction_drops_the_least_recently_used(self):
+        cache = self._cache(max_bytes=300)
+        with mock.patch.object(LLMCache, "EVICT_EVERY", 1):
+            for i in range(3):
+                cache.set(f"k{i}", "x" * 100)
+            cache.get("k0")                               # k1 is now the oldest read
+            cache.set("k3", "x" * 100)
+        self.assertEqual([k for k in ("k0", "k1", "k2", "k3") if cache.get(k)], ["k0", "k2", "k3"])
+
+    def test_disabled_cache_keeps_nothing(self):
+        cache = self._cache(enabled=False)
+        cache.set("k", "answer")
+        self.assertIsNone(cache.get("k"))
+
+    def test_a_rerun_is_answered_from_the_cache(self):
+        with mock.patch.object(logic, "llm_cache", self._cache()):
+            first, again = Counter(), Counter()
+            sqls = ["SELECT a FROM t", "SELECT b FROM t"]
+            out  = logic.run_rows(job_rows(sqls), stats=first)
+            self.assertEqual(logic.run_rows(job_rows(sqls), stats=again), out)
+        self.assertGreater(first["cache_misses"], 0)
+        self.assertEqual((again["cache_hits"], again["cache_misses"]),
+                         (first["cache_misses"], 0))
@@ -0,0 +1,38 @@
+# core/tests/test_metrics.py
+from collections import Counter
+
+from django.test import TestCase
+
+from .. import logic, metrics
+from . import support
+from .support import isolated
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+@isolated(METRICS_ALLOWED_IPS=["10.0.0.0/8"], METRICS_TOKEN="s3cret",
+           METRICS_REDIS_URL="redis://127.0.0.1:1/0")
+class MetricsTests(TestCase):
+    def test_scrape_needs_an_allowed_address_or_the_token(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="8.8.8.8").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="8.8.8.8",
+                                         HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="8.8.8.8",
+                                         HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    def test_redis_outage_gives_an_empty_exposition(self):
+        metrics._redis = None                    # reconnect to the dead URL above
+        try:
+            resp = self.client.get("/metrics", REMOTE_ADDR="10.1.2.3")
+        finally:
+            metrics._redis = None
+        self.assertEqual((resp.status_code, resp.content), (200, b""))
+
+    def test_stages_become_the_job_timings(self):
+        stats = Counter(cache_hits=1, cache_misses=3)
+        with metrics.stage("translate", stats):
+            pass
+        summary = logic.summarize(stats)
+        self.assertIn("translate", summary["timings"])
+        self.assertNotIn("translate_seconds", summary)
+        self.assertEqual(summary["cache_hit_ratio"], 0.25)
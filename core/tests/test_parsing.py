@@ -0,0 +1,47 @@
+# core/tests/test_parsing.py
+import json
+
+from django.test import SimpleTestCase
+
+from .. import parsing
+
+FIELDS = {"objective": "Reads a (lines 1-2)", "business_rules": "None (lines 1-2)",
+          "execution_steps": "One scan (lines 1-2)"}
+METRIC = {"score": 1, "confidence": 90, "explanation": "fine"}
+
+
+class ParsingTests(SimpleTestCase):
+    def test_structured_translation_in_any_json_layout(self):
+        for text in (json.dumps(FIELDS), "\n  " + json.dumps(FIELDS, indent=2),
+                     "{ " + json.dumps(FIELDS)[1:]):
+            out = parsing.parse_translation(text)
+            self.assertEqual(out["Objective"], "Reads a (lines 1-2)")
+            self.assertEqual(out["Execution Steps"], "One scan (lines 1-2)")
+
+    def test_brace_format_translation(self):
+        out = parsing.parse_translation("{Objective: Reads a (lines 1-2)}\n"
+                                        "{business rules: None}\n{Objective: again}")
+        self.assertEqual(out, {"Objective": "Reads a (lines 1-2)", "Business Rules": "None",
+                               "Execution Steps": ""})
+        self.assertEqual(parsing.parse_translation(parsing.render_translation(out)), out)
+
+    def test_structured_and_brace_evaluations_read_alike(self):
+        structured = parsing.parse_evaluation(
+            " " + json.dumps({"accuracy": METRIC, "conciseness": METRIC, "completeness": METRIC}))
+        braces = parsing.parse_evaluation(
+            "{Accurate: 1, 90%, Explanation: fine}\n{Concise: 1, 90%, Explanation: fine}\n"
+            "{Complete: 1, 90%, Explanation: fine}")
+        self.assertEqual(structured, braces)
+        self.assertEqual(structured["Accurate Confidence (%)"], "90")
+        self.assertFalse(parsing.parse_failed({"Objective": "x"}, structured))
+        self.assertTrue(parsing.parse_failed({"Objective": "x"}, parsing.parse_evaluation("")))
+
+    def test_packed_evaluations_split_per_item(self):
+        items = [{"id": i, "accuracy": METRIC, "conciseness": METRIC, "completeness": METRIC}
+                 for i in ("a", "b")]
+        split = parsing.split_evaluations("\n" + json.dumps({"items": items}))
+        self.assertEqual(sorted(split), ["a", "b"])
+        self.assertEqual(parsing.parse_evaluation(split["b"])["Concise"], "1")
+        split = parsing.split_evaluations("[ID: a]\n{Accurate: 0, 10%}\n[ID: b]\n{Accurate: 1}")
+        self.assertEqual({k: parsing.parse_evaluation(v)["Accurate"] for k, v in split.items()},
+                         {"a": "0", "b": "1"})
@@ -0,0 +1,108 @@
+# core/tests/test_progress.py
+import json
+import threading
+import uuid
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import events, views
+from ..artifacts import job_dir
+from ..checkpoint import Checkpoint
+from ..models import Job
+from . import support
+from .support import isolated, job_rows
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class FakePubSub:
+    """Hands out the queued *messages*, then nothing, like a quiet channel."""
+
+    def __init__(self, messages):
+        self.messages = [{"type": "message", "data": json.dumps(m)} for m in messages]
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0):
+        return self.messages.pop(0) if self.messages else None
+
+
+@isolated()
+class StreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.job_id = uuid.uuid4()
+        self.url    = f"/api/progress/{self.job_id}/stream/"
+
+    def _stream(self, *messages):
+        @contextmanager
+        def subscribe(job_id):
+            yield FakePubSub(messages)
+
+        with mock.patch.object(events, "subscribe", subscribe):
+            resp = self.client.get(self.url)
+            body = b"".join(resp.streaming_content).decode() if resp.streaming else ""
+        return resp, body
+
+    def _events(self, body):
+        self.assertTrue(body.endswith("\n\n"))
+        return [json.loads(frame[len("data: "):]) if frame.startswith("data: ") else frame
+                for frame in body[:-2].split("\n\n")]
+
+    def test_stream_relays_events_until_done(self):
+        cache.set(self.job_id, 40)
+        resp, body = self._stream(events.job_status(self.job_id, 70),
+                                  events.job_status(self.job_id, 100, {"rows": 2}),
+                                  events.job_status(self.job_id, 100))  # never read
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        self.assertEqual(resp["Cache-Control"], "no-cache")
+        sent = self._events(body)
+        self.assertEqual([e["status"] for e in sent], ["running", "running", "done"])
+        self.assertEqual([e["progress"] for e in sent], [40, 70, 100])
+        self.assertEqual(sent[-1]["summary"], {"rows": 2})
+
+    def test_stream_ends_when_the_job_fails(self):
+        cache.set(self.job_id, 10)
+        _, body = self._stream({"status": "failed", "error": "boom"})
+        self.assertEqual(self._events(body)[-1], {"status": "failed", "error": "boom"})
+
+    def test_a_quiet_stream_pings_and_ends_once_the_job_expires(self):
+        cache.set(self.job_id, 10)
+        ticks = iter([True, False])
+
+        def get_message(*args, **kwargs):        # no message; the 2nd time the job is gone
+            if not next(ticks):
+                cache.delete(self.job_id)
+
+        with mock.patch.object(FakePubSub, "get_message", get_message):
+            _, body = self._stream()
+        self.assertEqual(self._events(body)[1:], [": ping", {"status": "unknown"}])
+
+    def test_streams_past_the_cap_are_204_and_give_their_slot_back(self):
+        cache.set(self.job_id, 100)
+        with mock.patch.object(views, "_streams", threading.BoundedSemaphore(1)) as slots:
+            resp, _ = self._stream()
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(slots.acquire(blocking=False))     # the finished stream let go
+            resp, _ = self._stream()
+            self.assertEqual(resp.status_code, 204)
+
+
+@isolated()
+class ProgressTests(TestCase):
+    def test_cursor_reads_new_rows_without_the_cache(self):
+        job = Job.objects.create(id=uuid.uuid4(), status=Job.RUNNING, total_rows=3)
+        job_dir(job.id).mkdir(parents=True)
+        ck = Checkpoint(job_dir(job.id) / "checkpoint.jsonl")
+        rows = job_rows(["q0", "q1", "q2"])
+        for row in rows[:2]:
+            ck.append(row, [{"Content": row["sql_code"]}], [])
+        cache.clear()                                # long job: the cache keys are gone
+        url  = f"/api/progress/{job.id}/"
+        data = self.client.get(url, {"cursor": ""}).json()
+        self.assertEqual([r["idx"] for r in data["rows"]], [0, 1])
+        ck.append(rows[2], [], [])
+        data = self.client.get(url, {"cursor": data["cursor"]}).json()
+        self.assertEqual([r["idx"] for r in data["rows"]], [2])
+        self.assertEqual(self.client.get(url, {"cursor": "x:-1"}).status_code, 400)
@@ -0,0 +1,70 @@
+# core/tests/test_ratelimit.py
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import fake_llm, logic
+from ..ratelimit import ProviderLimiter, TokenBucket, estimate_tokens
+from . import support
+from .support import job_rows
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(per_minute=60, burst=5)
+        self.assertEqual([bucket.reserve() for _ in range(5)], [0.0] * 5)
+        self.assertAlmostEqual(bucket.reserve(), 1.0, places=1)
+        self.assertAlmostEqual(bucket.reserve(), 2.0, places=1)    # reservations queue up
+
+    def test_a_reservation_over_the_burst_waits_one_refill(self):
+        bucket = TokenBucket(per_minute=600)
+        self.assertEqual(bucket.reserve(10_000), 0.0)               # clamped to the capacity
+        self.assertAlmostEqual(bucket.reserve(600), 60.0, places=0)
+
+    def test_limiter_waits_for_the_scarcer_budget(self):
+        limiter = ProviderLimiter(rpm=6000, tpm=600)
+        self.assertEqual(limiter.reserve(600), 0.0)
+        self.assertAlmostEqual(limiter.reserve(60), 6.0, places=1)
+        self.assertEqual(estimate_tokens("abcd" * 10, "ab"), 11)
+
+
+class ConcurrentRowsTests(SimpleTestCase):
+    SQLS = tuple(f"SELECT c{i} FROM t{i}" for i in range(8))
+
+    def _run(self, max_in_flight):
+        """(SQL_Index of the records in order, peak concurrent provider calls)."""
+        lock, state = threading.Lock(), {"now": 0, "peak": 0}
+        real = fake_llm.FakeLLMHandler._interactive
+
+        def interactive(handler, answer):
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            try:
+                time.sleep(0.02)
+                return real(handler, answer)
+            finally:
+                with lock:
+                    state["now"] -= 1
+
+        done = []
+        with mock.patch.object(fake_llm.FakeLLMHandler, "_interactive", interactive):
+            trans, _ = logic.run_rows(job_rows(self.SQLS), max_in_flight=max_in_flight,
+                                      on_row=lambda n, total: done.append((n, total)))
+        self.assertEqual(done[-1], (len(self.SQLS), len(self.SQLS)))
+        return list(dict.fromkeys(r["SQL_Index"] for r in trans)), state["peak"]
+
+    def test_rows_run_concurrently_and_come_back_in_order(self):
+        order, peak = self._run(4)
+        self.assertEqual(order, list(range(1, len(self.SQLS) + 1)))
+        self.assertGreater(peak, 1)
+        self.assertLessEqual(peak, 4)
+
+    def test_one_in_flight_is_serial(self):
+        order, peak = self._run(1)
+        self.assertEqual(order, list(range(1, len(self.SQLS) + 1)))
+        self.assertEqual(peak, 1)
@@ -0,0 +1,133 @@
+# core/tests/test_resilience.py
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from ..resilience import CircuitBreaker, ProviderGuard
+
+
+def guard(**kwargs) -> ProviderGuard:
+    opts = {"retries": 3, "backoff": 0.001, "backoff_max": 0.01, "threshold": 100, "cooldown": 1}
+    return ProviderGuard("ant", **{**opts, **kwargs})
+
+
+class Flaky:
+    """``make`` for a guard: raises *errors* in turn, then answers "ok" after *delay*."""
+
+    def __init__(self, *errors, delay=0.0):
+        self.errors  = list(errors)
+        self.delay   = delay
+        self.calls   = 0
+        self.running = self.peak = 0
+
+    async def __call__(self):
+        self.calls += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return "ok"
+        finally:
+            self.running -= 1
+
+
+class RetryTests(SimpleTestCase):
+    def test_transient_errors_are_retried(self):
+        stats, make = Counter(), Flaky(ConnectionError(), ConnectionError())
+        self.assertEqual(asyncio.run(guard().call(make, stats)), "ok")
+        self.assertEqual((make.calls, stats["ant_retries"]), (3, 2))
+
+    def test_other_errors_and_spent_retries_are_raised(self):
+        make = Flaky(ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            asyncio.run(guard().call(make, Counter()))
+        self.assertEqual(make.calls, 1)
+        make = Flaky(*[ConnectionError()] * 3)
+        with self.assertRaises(ConnectionError):
+            asyncio.run(guard(retries=2).call(make, Counter()))
+        self.assertEqual(make.calls, 3)
+
+    def test_retry_after_header_sets_the_delay(self):
+        exc = SimpleNamespace(response=SimpleNamespace(headers={"retry-after-ms": "5"}))
+        self.assertEqual(guard().delay(0, exc), 0.005)
+        exc.response.headers = {"retry-after": "60"}
+        self.assertEqual(guard().delay(0, exc), 0.01)          # capped at backoff_max
+
+
+class BreakerTests(SimpleTestCase):
+    def _open(self, g: ProviderGuard, stats: Counter) -> None:
+        with self.assertRaises(ConnectionError):
+            asyncio.run(g.call(Flaky(*[ConnectionError()] * 2), stats))
+        self.assertEqual(stats["ant_breaker_opens"], 1)
+        self.assertGreater(g.breaker.remaining(), 0)
+
+    def test_half_open_circuit_lets_one_probe_through(self):
+        stats, g = Counter(), guard(retries=1, threshold=2, cooldown=0.05)
+        self._open(g, stats)
+        make = Flaky(delay=0.05)
+
+        async def burst():
+            return await asyncio.gather(*(g.call(make, stats) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(burst()), ["ok"] * 5)
+        self.assertEqual(make.calls, 5)
+        self.assertEqual(make.peak, 4)                          # the probe went out alone
+        self.assertIsNone(g.breaker.opened_at)
+
+    def test_a_failed_probe_reopens_the_circuit(self):
+        stats, g = Counter(), guard(retries=1, threshold=2, cooldown=0.05)
+        self._open(g, stats)
+        make = Flaky(ConnectionError(), delay=0.01)
+        self.assertEqual(asyncio.run(g.call(make, stats)), "ok")
+        self.assertEqual((make.calls, stats["ant_breaker_opens"]), (2, 2))
+
+    def test_a_probe_without_verdict_hands_over(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.failure()
+        self.assertTrue(asyncio.run(breaker.wait()))
+        breaker.release()
+        self.assertTrue(asyncio.run(breaker.wait()))
+        breaker.success()
+        self.assertFalse(asyncio.run(breaker.wait()))
+
+
+class HedgeTests(SimpleTestCase):
+    def setUp(self):
+        self.guard = guard(hedge=True)
+        for _ in range(20):
+            self.guard.latency.add(0.01)
+        self.cancelled = []
+
+    def make(self, *delays):
+        delays = list(delays)
+
+        async def make():
+            delay = delays.pop(0)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(delay)
+                raise
+            return delay
+        return make
+
+    def test_slow_call_is_hedged_and_the_loser_cancelled(self):
+        stats = Counter()
+        self.assertEqual(asyncio.run(self.guard.call(self.make(5, 0.01), stats)), 0.01)
+        self.assertEqual((stats["ant_hedges"], self.cancelled), (1, [5]))
+
+    def test_cancelling_the_caller_cancels_both_calls(self):
+        async def main():
+            call = asyncio.ensure_future(self.guard.call(self.make(5, 6), Counter()))
+            await asyncio.sleep(0.05)
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+            await asyncio.sleep(0.01)
+            self.assertEqual(sorted(self.cancelled), [5, 6])   # not left to asyncio.run
+
+        asyncio.run(main())
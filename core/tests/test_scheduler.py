@@ -0,0 +1,71 @@
+# core/tests/test_scheduler.py
+import uuid
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .. import scheduler
+from ..models import Job
+from . import support
+from .support import isolated, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+@isolated(SCHED_JOB_MAX_TOKENS=10_000, SCHED_USER_MAX_JOBS=2,
+           SCHED_USER_DAILY_TOKENS=50_000, JOB_STALE_SECONDS=600)
+class SchedulerTests(TestCase):
+    def _job(self, status=Job.QUEUED, tokens=100, **kw):
+        return Job.objects.create(id=uuid.uuid4(), owner="ip:1.2.3.4", status=status,
+                                  est_tokens=tokens, **kw)
+
+    def test_oversized_job_is_413(self):
+        with self.assertRaises(scheduler.Rejected) as e:
+            scheduler.admit("ip:1.2.3.4", 1, 10_001)
+        self.assertEqual(e.exception.status, 413)
+
+    def test_too_many_active_jobs_is_429(self):
+        self._job()
+        self._job(Job.RUNNING)
+        with self.assertRaises(scheduler.Rejected) as e:
+            scheduler.admit("ip:1.2.3.4", 1, 100)
+        self.assertEqual((e.exception.status, e.exception.retry_after), (429, 60))
+        self.assertEqual(scheduler.admit("ip:5.6.7.8", 1, 100).queue, scheduler.INTERACTIVE)
+
+    def test_a_lost_running_job_does_not_count(self):
+        self._job()
+        lost = self._job(Job.RUNNING)
+        Job.objects.filter(id=lost.id).update(updated=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(scheduler.admit("ip:1.2.3.4", 1, 100).countdown, 0)
+
+    def test_spent_daily_budget_is_429(self):
+        self._job(Job.DONE, tokens=45_000)
+        with self.assertRaises(scheduler.Rejected) as e:
+            scheduler.admit("ip:1.2.3.4", 1, 6_000)
+        self.assertEqual((e.exception.status, e.exception.retry_after), (429, 3600))
+
+    def test_view_answers_with_status_and_retry_after(self):
+        self._job()
+        self._job()
+        resp = self.client.post("/api/translate/", {"sql_code": "SELECT 1"},
+                                REMOTE_ADDR="1.2.3.4")
+        self.assertEqual((resp.status_code, resp["Retry-After"]), (429, "60"))
+        resp = self.client.post("/api/translate/", {"sql_code": "SELECT 1 " * 20_000},
+                                REMOTE_ADDR="9.9.9.9")
+        self.assertEqual(resp.status_code, 413)
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_xlsx_rows_come_from_the_first_sheet(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["sql_code"])
+        for i in range(3):
+            ws.append([f"SELECT {i}"])
+        ws["A2"].hyperlink = "https://example.com/q0"      # adds xl/worksheets/_rels/
+        for i in range(12):                                  # sheet10.xml sorts before sheet2.xml
+            wb.create_sheet().append(["sql_code"])
+        path = scratch() / "book.xlsx"
+        wb.save(path)
+        self.assertEqual(scheduler.estimate(path, "statement", "Explain it.")[0], 3)
@@ -0,0 +1,50 @@
+# core/tests/test_similar.py
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from django.test import TestCase
+
+from .. import logic, similar
+from ..similar import SimilarIndex
+from . import support
+from .support import TMP, job_rows
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+
+class SimilarTests(TestCase):
+    SQL = ("SELECT c.customer_id, SUM(o.amount) AS spend\nFROM orders o\n"
+           "JOIN customers c ON c.id = o.customer_id\nWHERE o.order_date >= '2024-01-01'\n"
+           "  AND o.store_id IN (1, 2, 3, 4, 5, 6, 7, 8)\nGROUP BY c.customer_id\n"
+           "HAVING SUM(o.amount) > 100\nORDER BY spend DESC;")
+
+    def setUp(self):
+        self.saved = logic.sql_index
+        logic.sql_index = SimilarIndex(str(Path(tempfile.mkdtemp(dir=TMP)) / "sim.sqlite3"),
+                                       3600, 1000)
+        self.addCleanup(setattr, logic, "sql_index", self.saved)
+
+    def _stats(self, sql):
+        stats = Counter()
+        logic.run_rows(job_rows([sql]), stats=stats, sink=lambda *a: None)
+        return stats
+
+    def test_only_the_same_literals_are_reused_as_is(self):
+        self._stats(self.SQL)
+        same = self._stats(self.SQL.replace("\nFROM", "  -- last year\nFROM"))
+        self.assertEqual((same["similar_reused"], same["similar_updated"]), (1, 0))
+        moved = self._stats(self.SQL.replace("2024-01-01", "2025-01-01"))
+        self.assertEqual((moved["similar_reused"], moved["similar_updated"]), (0, 1))
+
+    def test_expired_entries_do_not_take_the_candidate_slots(self):
+        index = logic.sql_index
+        near  = self.SQL.replace("spend DESC", "spend DESC, c.customer_id")
+        index.add("live", index.lookup("s", near), job_rows([near])[0], "{Objective: x}", 1.0)
+        for i in range(similar.CANDIDATES + 1):     # closer to SQL than the live entry
+            index.add(f"old{i}", index.lookup("s", self.SQL), job_rows([self.SQL])[0],
+                      "{Objective: x}", 1.0)
+        index._db().execute("UPDATE sim_entries SET created = 0 WHERE key LIKE 'old%'")
+        match = index.lookup("s", self.SQL).match
+        self.assertIsNotNone(match)
+        self.assertEqual(match.sql, near)
@@ -0,0 +1,70 @@
+# core/tests/test_source.py
+import uuid
+
+from django.test import TestCase
+
+from ..artifacts import job_dir
+from ..models import Job
+from ..sourcefile import IDX_SUFFIX, SourceFile, SourceWriter
+from . import support
+from .support import isolated, scratch
+
+setUpModule, tearDownModule = support.setUpModule, support.tearDownModule
+
+ROWS = ["SELECT 1", "SELECT ü\nFROM t", "", "-- last\nSELECT 3"]
+LINES = "\n".join(ROWS).split("\n")
+
+
+def write_source(path, rows=ROWS):
+    writer = SourceWriter(path)
+    for sql in rows:
+        writer.write_row(sql)
+    writer.commit()
+    return path
+
+
+class SourceFileTests(TestCase):
+    def test_windows_match_the_joined_rows(self):
+        path = write_source(scratch() / "source.sql")
+        self.assertEqual(path.read_text(), "\n".join(ROWS))
+        with SourceFile(path) as src:
+            self.assertEqual(src.line_count, len(LINES))
+            self.assertEqual(src.lines(1, len(LINES)), LINES)
+            self.assertEqual(src.lines(2, 3), ["SELECT ü", "FROM t"])
+            self.assertEqual(src.lines(0, 1), ["SELECT 1"])           # clipped
+            self.assertEqual(src.lines(6, 99), LINES[5:])
+            self.assertEqual(src.lines(99, 100), [])
+
+    def test_a_missing_index_is_rebuilt_alike(self):
+        path = write_source(scratch() / "source.sql")
+        index = path.with_suffix(IDX_SUFFIX).read_bytes()
+        path.with_suffix(IDX_SUFFIX).unlink()
+        with SourceFile(path) as src:
+            self.assertEqual(src.lines(1, len(LINES)), LINES)
+        self.assertEqual(path.with_suffix(IDX_SUFFIX).read_bytes(), index)
+
+    def test_an_empty_source_has_no_lines(self):
+        with SourceFile(write_source(scratch() / "source.sql", [])) as src:
+            self.assertEqual((src.line_count, src.lines(1, 10)), (0, []))
+
+    def test_discarded_writer_leaves_nothing(self):
+        out    = scratch()
+        writer = SourceWriter(out / "source.sql")
+        writer.write_row("SELECT 1")
+        writer.discard()
+        self.assertEqual(list(out.iterdir()), [])
+
+
+@isolated()
+class SourceViewTests(TestCase):
+    def test_view_pages_through_the_source(self):
+        job = Job.objects.create(id=uuid.uuid4(), status=Job.RUNNING)
+        url = f"/api/jobs/{job.id}/source/"
+        self.assertEqual(self.client.get(url).status_code, 409)       # still ingesting
+        job_dir(job.id).mkdir(parents=True)
+        write_source(job_dir(job.id) / "source.sql")
+        data = self.client.get(url, {"start": 2, "count": 2}).json()
+        self.assertEqual((data["total_lines"], data["start"], data["end"]), (6, 2, 3))
+        self.assertIn("FROM t", data["html"])
+        self.assertEqual(self.client.get(url, {"start": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(f"/api/jobs/{uuid.uuid4()}/source/").status_code, 404)
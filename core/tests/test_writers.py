@@ -0,0 +1,43 @@
+# core/tests/test_writers.py
+import csv
+import io
+import json
+from datetime import UTC, datetime
+from zipfile import ZipFile
+
+from django.test import TestCase
+from openpyxl import load_workbook
+
+from ..writers import iter_zip
+
+
+class WriterTests(TestCase):
+    RECORDS = tuple({"SQL_Index": i, "Type": "Objective", "Content": f"ünïcode {i}"}
+                    for i in range(1, 6))
+
+    def _zip(self, fmt, stamp=None, chunk_size=64 * 1024):
+        return b"".join(iter_zip({"translation": iter(self.RECORDS)}, fmt,
+                                 extra={"summary.json": lambda: json.dumps({"rows": 5})},
+                                 stamp=stamp, chunk_size=chunk_size))
+
+    def test_every_format_holds_the_records(self):
+        for fmt, read in (("csv", lambda b: list(csv.DictReader(io.StringIO(b.decode("utf-8-sig"))))),
+                          ("jsonl", lambda b: [json.loads(line) for line in b.splitlines()])):
+            with self.subTest(fmt=fmt), ZipFile(io.BytesIO(self._zip(fmt))) as zf:
+                recs = read(zf.read(f"translation.{fmt}"))
+                self.assertEqual([r["Content"] for r in recs],
+                                 [r["Content"] for r in self.RECORDS])
+                self.assertEqual(json.loads(zf.read("summary.json")), {"rows": 5})
+
+    def test_xlsx_opens_in_openpyxl(self):
+        with ZipFile(io.BytesIO(self._zip("xlsx"))) as zf:
+            ws = load_workbook(io.BytesIO(zf.read("translation.xlsx")), read_only=True).active
+            values = list(ws.values)
+        self.assertEqual(values[0], ("SQL_Index", "Type", "Content"))
+        self.assertEqual(values[5], (5, "Objective", "ünïcode 5"))
+
+    def test_stamped_zip_is_reproducible(self):
+        stamp = datetime(2024, 5, 1, 12, 0, tzinfo=UTC)
+        for fmt in ("xlsx", "csv"):
+            with self.subTest(fmt=fmt):
+                self.assertEqual(self._zip(fmt, stamp), self._zip(fmt, stamp, chunk_size=16))
@@ -8,4 +8,9 @@ urlpatterns = [
 
     path("api/translate/", views.translate, name="translate"),
     path("api/progress/<uuid:job_id>/", views.progress, name="progress"),
+    path("api/progress/<uuid:job_id>/stream/", views.progress_stream, name="progress_stream"),
+    path("api/jobs/<uuid:job_id>/results/", views.results, name="results"),
+    path("api/jobs/<uuid:job_id>/download/", views.download, name="download"),
+    path("api/jobs/<uuid:job_id>/source/", views.source, name="source"),
+    path("metrics", views.metrics_view, name="metrics"),
 ]
@@ -1,16 +1,28 @@
 # core/views.py
-import io, zipfile, tempfile
+import hmac, ipaddress, json, re, shutil, threading, time, uuid
+from collections import Counter
+from datetime import timedelta
 from pathlib import Path
 
-import pandas as pd
 from django.conf import settings
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.core.paginator import EmptyPage, Paginator
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, require_safe
 from django.core.cache import cache
+from django.core.files.move import file_move_safe
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
 
+from . import artifacts, events, ingest, metrics, scheduler
+from .checkpoint import Checkpoint
+from .logic import parse_grid
+from .models import Job, ResultRow
+from .sourcefile import SourceFile
 from .tasks import run_translation
+from .writers import WRITERS
 
 # choose demo or real logic
 if getattr(settings, "DEMO_MODE", False):
@@ -35,6 +47,8 @@ FIXED_PROMPT = (
 
 def _table_html(xlsx: Path) -> str:
     """Render preview table if translation columns exist; otherwise placeholder."""
+    import pandas as pd                          # the only pandas use in the web process
+
     df = pd.read_excel(xlsx)
     if not {"SQL_Index", "Type", "Content"}.issubset(df.columns):
         return '<p class="hint">Processing…</p>'
@@ -50,14 +64,14 @@ def _table_html(xlsx: Path) -> str:
     return df.to_html(index=False, border=1, classes="tbl", escape=False)
 
 
-def _code_html(sql: str) -> str:
-    lines = sql.rstrip().splitlines()
-    pad   = len(str(len(lines)))
+def _lines_html(lines: list, first: int = 1, pad: int | None = None) -> str:
+    """Numbered, escaped ``<pre>`` of *lines*, the first one being line *first*."""
+    pad = pad or len(str(first + len(lines) - 1))
 
     def esc(s: str) -> str:
         return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-    body = "\n".join(f"{str(i+1).rjust(pad)}  {esc(l)}" for i, l in enumerate(lines))
+    body = "\n".join(f"{str(first + i).rjust(pad)}  {esc(l)}" for i, l in enumerate(lines))
     return f'<pre class="code-block">{body}</pre>'
 
 
@@ -74,44 +88,359 @@ def translate(request):
     sql_file = request.FILES.get("sql_file")
     if not sql_text and not sql_file:
         return HttpResponseBadRequest("sql_code or sql_file required")
+    split = request.POST.get("split", "statement")
+    if split not in ingest.SPLITS:
+        return HttpResponseBadRequest(f"split must be one of {', '.join(ingest.SPLITS)}")
+    if sql_file and not (fmt := ingest.upload_format(sql_file.name)):
+        return HttpResponseBadRequest(f"unsupported file; use one of {', '.join(ingest.FORMATS)}")
+    grid = None
+    if request.POST.get("grid", "").strip():     # an experiment (see logic.parse_grid)
+        try:
+            grid = [v._asdict() for v in parse_grid(
+                request.POST["grid"], getattr(settings, "GRID_MODELS", ()),
+                getattr(settings, "GRID_MAX_TOKENS", 8192),
+                getattr(settings, "GRID_MAX_VARIANTS", 6))]
+        except ValueError as e:
+            return HttpResponseBadRequest(f"bad grid: {e}")
 
-    tmp_dir  = Path(tempfile.mkdtemp())
-    sql_xlsx = tmp_dir / "sql.xlsx"
-    prm_xlsx = tmp_dir / "prompt.xlsx"
+    # the Job row exists before the task can start; its id is the task id
+    job_id  = str(uuid.uuid4())
+    tmp_dir = artifacts.job_dir(job_id)          # swept by tasks.sweep_artifacts
+    tmp_dir.mkdir(parents=True)
+    timings = Counter()
 
-    if sql_file:
-        raw = sql_file.read()
-        sql_xlsx.write_bytes(raw)
-        df_in   = pd.read_excel(io.BytesIO(raw))
-        sql_src = "\n".join(str(x) for x in df_in.iloc[:, 0])
-    else:
-        sql_src = sql_text
-        pd.DataFrame([{"sql_code": sql_text}]).to_excel(sql_xlsx, index=False)
+    # only spool the upload here; the worker parses it (core.ingest)
+    with metrics.stage("spool_upload", timings):
+        if sql_file:
+            upload = tmp_dir / f"upload.{fmt}"
+            if hasattr(sql_file, "temporary_file_path"):      # already on disk: just move it
+                file_move_safe(sql_file.temporary_file_path(), upload)
+            else:
+                with upload.open("wb") as fh:
+                    for chunk in sql_file.chunks():
+                        fh.write(chunk)
+        else:
+            upload, split = tmp_dir / "upload.sql", "file"    # pasted SQL stays one row
+            upload.write_text(sql_text, encoding="utf-8")
 
-    rows = len(pd.read_excel(sql_xlsx))
-    pd.DataFrame([{"prompt": FIXED_PROMPT}] * rows).to_excel(prm_xlsx, index=False)
+    # size the job, then admit it to a queue or turn it away (core.scheduler)
+    owner = scheduler.client_key(request)
+    try:
+        with metrics.stage("admit", timings):
+            rows, tokens = scheduler.estimate(upload, split, FIXED_PROMPT, len(grid or [None]))
+            ticket = scheduler.admit(owner, rows, tokens)
+    except scheduler.Rejected as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        resp = HttpResponse(str(e), status=e.status, content_type="text/plain")
+        if e.retry_after:
+            resp["Retry-After"] = str(e.retry_after)
+        return resp
 
-    # enqueue async translation
-    job = run_translation.delay(str(sql_xlsx), str(prm_xlsx), str(tmp_dir))
-    cache.set(job.id, 0, 3600)
+    not_before = timezone.now() + timedelta(seconds=ticket.countdown) if ticket.countdown else None
+    Job.objects.create(id=job_id, owner=owner, est_rows=ticket.rows, est_tokens=ticket.tokens,
+                       queue=ticket.queue, priority=ticket.priority, not_before=not_before)
+    cache.set(job_id, 0, 3600)
+
+    # enqueue async translation; the upload stages open the job's timings
+    with metrics.stage("enqueue"):
+        run_translation.apply_async(
+            (str(tmp_dir / "job.jsonl"), str(tmp_dir)),
+            {"timings": {k[:-len("_seconds")]: v for k, v in timings.items()},
+             "upload": {"path": str(upload), "prompt": FIXED_PROMPT, "split": split},
+             "grid": grid},
+            task_id=job_id, queue=ticket.queue, priority=ticket.priority,
+            countdown=ticket.countdown or None)
+    metrics.flush()
 
     return JsonResponse(
         {
-            "job_id":     job.id,
-            "code_html":  _code_html(sql_src),
+            "job_id":     job_id,
+            "queue":      ticket.queue,
+            "estimate":   {"rows": ticket.rows, "tokens": ticket.tokens},
+            "code_html":  '<p class="hint">Reading upload…</p>',  # see views.source
             "html_trans": '<p class="hint">Processing…</p>',  # placeholder
         }
     )
 
 
+SOURCE_MAX_LINES = 2000  # lines per source window at most
+
+
+@require_GET
+def source(request, job_id):
+    """
+    A window of the uploaded SQL as numbered HTML, once the worker has
+    ingested it: ``?start=<line>&count=<lines>`` (1-based; default the
+    first 200).  ``total_lines`` lets the page size its scroll area.
+    """
+    path = artifacts.job_dir(job_id) / "source.sql"
+    if not path.exists():
+        job = Job.objects.filter(id=job_id).only("status").first()
+        if job is None or job.status not in (Job.QUEUED, Job.RUNNING):
+            return JsonResponse({"status": "unknown"}, status=404)    # or swept since
+        return JsonResponse({"status": "ingesting"}, status=409)
+    try:
+        start = max(1, int(request.GET.get("start", 1)))
+        count = min(SOURCE_MAX_LINES, max(1, int(request.GET.get("count", 200))))
+    except ValueError:
+        return HttpResponseBadRequest("bad start or count")
+
+    with SourceFile(path) as src:
+        total = src.line_count
+        lines = src.lines(start, start + count - 1)
+    return JsonResponse({"total_lines": total, "start": start,
+                         "end": start + len(lines) - 1,
+                         "html": _lines_html(lines, start, len(str(total)))})
+
+
+DELTA_MAX_ROWS = 200  # rows returned per progress poll at most
+
+
+def _result_delta(job_id, cursor: str):
+    """
+    Rows checkpointed since *cursor* (``name:offset,…`` per checkpoint file).
+    Each poll only reads the bytes appended since the previous one.
+    """
+    offsets = {}
+    for part in filter(None, cursor.split(",")):
+        name, _, off = part.rpartition(":")
+        offsets[name] = int(off)
+        if offsets[name] < 0:
+            raise ValueError(part)
+
+    rows = []
+    for path in sorted(artifacts.job_dir(job_id).glob("checkpoint*.jsonl")):
+        recs, offsets[path.name] = Checkpoint(path).read_from(
+            offsets.get(path.name, 0), DELTA_MAX_ROWS - len(rows))
+        rows += recs
+    return rows, ",".join(f"{k}:{v}" for k, v in offsets.items())
+
+
+def _stored_status(job_id):
+    """(pct, summary) from the Job row once the cache entry has expired."""
+    job = Job.objects.filter(id=job_id).only("status", "summary").first()
+    if job is None:
+        return None, None
+    if job.status == Job.FAILED:
+        return events.FAILED, job.summary
+    return (100, job.summary) if job.status == Job.DONE else (0, None)
+
+
 @require_GET
 def progress(request, job_id):
     pct = cache.get(job_id)
+    summary = cache.get(f"{job_id}:summary") if pct in (100, events.FAILED) else None
+    if pct is None:
+        pct, summary = _stored_status(job_id)
     if pct is None:
         return JsonResponse({"status": "unknown"}, status=404)
 
-    if pct == 100:
-        zip_url = f"/media/tmp/{job_id}.zip"
-        return JsonResponse({"status": "done", "progress": 100, "zip_url": zip_url})
+    data = events.job_status(job_id, pct, summary,
+                             scheduler.queue_state(job_id) if pct == 0 else None)
+
+    # ?cursor=… adds the rows finished since that cursor (start with an empty one)
+    if "cursor" in request.GET:
+        try:
+            data["rows"], data["cursor"] = _result_delta(job_id, request.GET["cursor"])
+        except ValueError:
+            return HttpResponseBadRequest("bad cursor")
+    return JsonResponse(data)
+
+
+SSE_HEARTBEAT   = 15   # seconds between keep-alive comments
+SSE_MAX_SECONDS = 300  # a stream holds a worker thread; the page polls once it ends
+
+_streams = threading.BoundedSemaphore(getattr(settings, "SSE_MAX_STREAMS", 4))
+
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class _Slot:
+    """Streams *gen*, giving its slot in ``_streams`` back when the response closes."""
+
+    def __init__(self, gen):
+        self.gen = gen
+
+    def __iter__(self):
+        return self.gen
+
+    def close(self):
+        self.gen.close()
+        _streams.release()
+
 
-    return JsonResponse({"status": "running", "progress": pct})
+@require_GET
+def progress_stream(request, job_id):
+    """
+    Server-Sent Events twin of ``progress``: pushes worker events as they
+    happen.  A plain generator, so it streams under WSGI (gunicorn,
+    runserver); since it holds a worker thread it ends after
+    SSE_MAX_SECONDS, and at most SSE_MAX_STREAMS run at once – past that
+    the answer is 204, which EventSource takes as "don't reconnect", and
+    the page polls ``progress`` instead.
+    """
+    if not _streams.acquire(blocking=False):
+        return HttpResponse(status=204)
+
+    def stream():
+        # subscribe before reading the current state so no event slips in between
+        with events.subscribe(job_id) as pubsub:
+            pct = cache.get(job_id)
+            summary = cache.get(f"{job_id}:summary") if pct in (100, events.FAILED) else None
+            if pct is None:
+                pct, summary = _stored_status(job_id)
+            queue = scheduler.queue_state(job_id) if pct == 0 else None
+            state = events.job_status(job_id, pct, summary, queue)
+            yield _sse(state)
+
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while state["status"] in ("queued", "running") and time.monotonic() < deadline:
+                msg = pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_HEARTBEAT)
+                if msg is None:
+                    if cache.get(job_id) is None:                 # job expired
+                        yield _sse(events.job_status(job_id, None))
+                        return
+                    if state["status"] == "queued":               # others started: move up
+                        queue = scheduler.queue_state(job_id)
+                        if queue:
+                            state = events.job_status(job_id, 0, None, queue)
+                            yield _sse(state)
+                            continue
+                    yield ": ping\n\n"
+                    continue
+                state = json.loads(msg["data"])
+                yield _sse(state)
+
+    resp = StreamingHttpResponse(_Slot(stream()), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"     # don't let nginx buffer the stream
+    return resp
+
+
+RESULT_FIELDS = ("sql_index", "temperature", "variant", "type", "content",
+                 "accurate", "accurate_confidence", "accurate_explanation",
+                 "concise", "concise_confidence", "concise_explanation",
+                 "complete", "complete_confidence", "complete_explanation")
+RESULT_FILTERS = {"sql_index": int, "type": str, "temperature": float, "variant": str,
+                  "accurate": int, "concise": int, "complete": int}
+RESULTS_MAX_PAGE = 500
+
+
+@require_GET
+def results(request, job_id):
+    """
+    Stored result rows of a job, ``?page=&page_size=`` paginated.  Any of
+    RESULT_FILTERS narrows the rows (``?accurate=0&type=Objective``);
+    ``min_confidence``/``max_confidence`` apply to all three confidences.
+    """
+    if not Job.objects.filter(id=job_id).exists():
+        return JsonResponse({"status": "unknown"}, status=404)
+
+    qs = ResultRow.objects.filter(job_id=job_id)
+    try:
+        qs = qs.filter(**{k: cast(request.GET[k]) for k, cast in RESULT_FILTERS.items()
+                          if k in request.GET})
+        if "min_confidence" in request.GET:
+            lo = int(request.GET["min_confidence"])
+            qs = qs.filter(accurate_confidence__gte=lo, concise_confidence__gte=lo,
+                           complete_confidence__gte=lo)
+        if "max_confidence" in request.GET:
+            hi = int(request.GET["max_confidence"])
+            qs = qs.filter(accurate_confidence__lte=hi, concise_confidence__lte=hi,
+                           complete_confidence__lte=hi)
+        size = min(RESULTS_MAX_PAGE, max(1, int(request.GET.get("page_size", 100))))
+        page = Paginator(qs.values(*RESULT_FIELDS), size).page(int(request.GET.get("page", 1)))
+    except (ValueError, EmptyPage):
+        return HttpResponseBadRequest("bad filter or page")
+
+    return JsonResponse({"count": page.paginator.count, "page": page.number,
+                         "pages": page.paginator.num_pages, "results": list(page)})
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _byte_range(header: str, size: int):
+    """(start, end) of a single ``bytes=`` range; None to send everything, () if unsatisfiable."""
+    m = _RANGE_RE.match(header.replace(" ", ""))
+    if not m or m.groups() == ("", ""):          # multiple or malformed ranges
+        return None
+    first, last = m.groups()
+    if not first:                                # suffix: the last N bytes
+        return (max(0, size - int(last)), size - 1) if int(last) else ()
+    start, end = int(first), min(int(last) if last else size - 1, size - 1)
+    return (start, end) if start <= end else ()
+
+
+@require_safe
+def download(request, job_id):
+    """
+    The result zip of a finished job, generated from the stored rows while
+    it is sent (``?format=`` xlsx/csv/jsonl/parquet, default RESULT_FORMAT).
+    Supports If-None-Match / If-Modified-Since and a single Range (with
+    If-Range), so interrupted downloads resume without a file on disk.
+    """
+    job = Job.objects.filter(id=job_id).first()
+    if job is None:
+        return JsonResponse({"status": "unknown"}, status=404)
+    if job.status != Job.DONE:
+        return JsonResponse({"status": "running"}, status=409)
+    fmt = request.GET.get("format") or getattr(settings, "RESULT_FORMAT", "xlsx")
+    if fmt not in WRITERS:
+        return HttpResponseBadRequest(f"format must be one of {sorted(WRITERS)}")
+
+    tag, modified = artifacts.etag(job, fmt), int(job.updated.timestamp())
+    if (resp := get_conditional_response(request, etag=tag, last_modified=modified)) is not None:
+        return resp
+
+    rng, if_range = request.headers.get("Range"), request.headers.get("If-Range")
+    if rng and if_range and if_range != tag and parse_http_date_safe(if_range) != modified:
+        rng = None                               # the client's copy is stale: send it all
+    # a plain GET starts streaming at once; the size is sent only if known
+    size = artifacts.size(job, fmt, compute=bool(rng) or request.method == "HEAD")
+    span = _byte_range(rng, size) if rng else None
+    if span == ():
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = f"bytes */{size}"
+        return resp
+
+    if request.method == "HEAD":
+        resp = HttpResponse(content_type="application/zip")
+    elif span:
+        resp = StreamingHttpResponse(artifacts.byte_slice(artifacts.stream(job, fmt), *span),
+                                     status=206, content_type="application/zip")
+        resp["Content-Range"] = f"bytes {span[0]}-{span[1]}/{size}"
+    else:
+        resp = StreamingHttpResponse(artifacts.stream(job, fmt), content_type="application/zip")
+    if span:
+        resp["Content-Length"] = span[1] - span[0] + 1
+    elif size is not None:
+        resp["Content-Length"] = size
+    resp["ETag"], resp["Last-Modified"] = tag, http_date(modified)
+    resp["Accept-Ranges"] = "bytes"
+    resp["Content-Disposition"] = f'attachment; filename="{job_id}.zip"'
+    return resp
+
+
+def _may_scrape(request) -> bool:
+    """METRICS_TOKEN as a bearer token, or a client in METRICS_ALLOWED_IPS."""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    auth  = request.headers.get("Authorization", "")
+    if token and hmac.compare_digest(auth.encode(), f"Bearer {token}".encode()):
+        return True
+    try:
+        addr = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(addr in ipaddress.ip_network(net, strict=False)
+               for net in getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1")))
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint (totals of every web/worker process)."""
+    if not _may_scrape(request):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
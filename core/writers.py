@@ -0,0 +1,234 @@
+# core/writers.py
+"""
+Streaming result writers.
+
+Each writer takes a binary file handle (a plain file or an entry opened with
+``ZipFile.open(name, "w")``) and receives records one at a time, so results
+go straight from the job checkpoint into the archive without a DataFrame or
+an intermediate file.  The column order comes from the first record.
+
+    xlsx     openpyxl write-only workbook
+    csv      UTF-8 with BOM so Excel opens it cleanly
+    jsonl    one JSON object per line
+    parquet  row groups of PARQUET_ROW_GROUP records (needs pyarrow)
+
+Given a *stamp* (datetime) the archive bytes depend only on the records:
+zip member times and the workbook properties are pinned to it, so a zip
+rebuilt later for a Range request matches the one first sent.
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import time
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+PARQUET_ROW_GROUP = 5000
+STREAM_CHUNK      = 64 * 1024    # bytes buffered before iter_zip yields
+
+
+def _member(name: str, stamp=None) -> ZipInfo:
+    info = ZipInfo(name, stamp.timetuple()[:6] if stamp else time.localtime()[:6])
+    info.compress_type = ZIP_DEFLATED
+    info.external_attr = 0o600 << 16
+    return info
+
+
+class _StampedZip(ZipFile):
+    """ZipFile whose members all carry one timestamp (openpyxl's archive)."""
+
+    def __init__(self, fh, stamp):
+        super().__init__(fh, "w", ZIP_DEFLATED, allowZip64=True)
+        self.stamp = stamp
+
+    def writestr(self, zinfo_or_arcname, data, *args, **kwargs):
+        if not isinstance(zinfo_or_arcname, ZipInfo):
+            zinfo_or_arcname = _member(zinfo_or_arcname, self.stamp)
+        super().writestr(zinfo_or_arcname, data)
+
+    def write(self, filename, arcname=None, *args, **kwargs):
+        # a write-only worksheet arrives as a temp file: copy it, never read it whole
+        info = _member(arcname or str(filename), self.stamp)
+        info.file_size = os.path.getsize(filename)       # picks zip64 up front if needed
+        with open(filename, "rb") as src, self.open(info, "w") as dst:
+            shutil.copyfileobj(src, dst, STREAM_CHUNK)
+
+
+class ResultWriter:
+    ext = ""
+
+    def __init__(self, fh, stamp=None):
+        self.fh      = fh
+        self.stamp   = stamp
+        self.columns = None
+
+    def write(self, record: dict) -> None:
+        if self.columns is None:
+            self.columns = list(record)
+            self._start()
+        self._write([record.get(c) for c in self.columns])
+
+    def close(self) -> None:
+        if self.columns is None:          # no rows at all: still emit a valid file
+            self.columns = []
+            self._start()
+        self._finish()
+
+    def _start(self) -> None:
+        pass
+
+    def _write(self, values: list) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        pass
+
+
+class XlsxWriter(ResultWriter):
+    ext = "xlsx"
+
+    def _start(self):
+        from openpyxl import Workbook
+
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+        self.ws.append(self.columns)
+
+    def _write(self, values):
+        self.ws.append(values)
+
+    def _finish(self):
+        if self.stamp is None:
+            self.wb.save(self.fh)
+            return
+        # Workbook.save would stamp "modified" (and every member) with now()
+        from openpyxl.writer.excel import ExcelWriter
+
+        stamp = self.stamp.replace(tzinfo=None, microsecond=0)
+        self.wb.properties.created = self.wb.properties.modified = stamp
+        ExcelWriter(self.wb, _StampedZip(self.fh, stamp)).save()
+
+
+class CsvWriter(ResultWriter):
+    ext = "csv"
+
+    def _start(self):
+        self.text = io.TextIOWrapper(self.fh, encoding="utf-8-sig", newline="")
+        self.csv  = csv.writer(self.text)
+        self.csv.writerow(self.columns)
+
+    def _write(self, values):
+        self.csv.writerow(values)
+
+    def _finish(self):
+        self.text.flush()
+        self.text.detach()
+
+
+class JsonlWriter(ResultWriter):
+    ext = "jsonl"
+
+    def _write(self, values):
+        rec = dict(zip(self.columns, values))
+        self.fh.write((json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+
+
+class ParquetWriter(ResultWriter):
+    ext = "parquet"
+
+    def _start(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("parquet results need pyarrow (pip install pyarrow)") from exc
+        self.pa, self.buf = pa, []
+        self.schema = pa.schema([(c, pa.string()) for c in self.columns])
+        self.pq = pq.ParquetWriter(self.fh, self.schema)
+
+    def _write(self, values):
+        self.buf.append(values)
+        if len(self.buf) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        cols = list(zip(*self.buf)) if self.buf else [()] * len(self.columns)
+        arrays = [self.pa.array([None if v is None else str(v) for v in col], self.pa.string())
+                  for col in cols]
+        self.pq.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.buf = []
+
+    def _finish(self):
+        if self.buf:
+            self._flush()
+        self.pq.close()
+
+
+WRITERS = {w.ext: w for w in (XlsxWriter, CsvWriter, JsonlWriter, ParquetWriter)}
+
+
+def get_writer(fmt: str):
+    try:
+        return WRITERS[fmt]
+    except KeyError:
+        raise ValueError(f"unknown result format {fmt!r}; choose from {sorted(WRITERS)}") from None
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable byte sink for ZipFile; ``take()`` hands over what has piled up."""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buf += b
+        return len(b)
+
+    def take(self) -> bytes:
+        out, self.buf = bytes(self.buf), bytearray()
+        return out
+
+
+def iter_zip(entries: dict, fmt: str = "xlsx", extra: dict | None = None,
+             stamp=None, chunk_size: int = STREAM_CHUNK):
+    """
+    Yield the zip of ``{base name: record iterable}`` (one ``<base name>.<ext>``
+    member each) as byte chunks while the records are read; *extra* maps
+    names to small bytes/str members, or to callables returning them that
+    run after the records are in.  Nothing is written to disk.
+    """
+    writer_cls, sink = get_writer(fmt), _Sink()
+    with ZipFile(sink, "w", ZIP_DEFLATED) as zf:
+        for name, records in entries.items():
+            with zf.open(_member(f"{name}.{writer_cls.ext}", stamp), "w", force_zip64=True) as fh:
+                writer = writer_cls(fh, stamp)
+                for rec in records:
+                    writer.write(rec)
+                    if len(sink.buf) >= chunk_size:
+                        yield sink.take()
+                writer.close()
+            yield sink.take()
+        for name, data in (extra or {}).items():
+            zf.writestr(_member(name, stamp), data() if callable(data) else data)
+    yield sink.take()
+
+
+def write_zip(zip_path, entries: dict, fmt: str = "xlsx", extra: dict | None = None,
+              stamp=None) -> None:
+    """``iter_zip`` into the file at *zip_path*."""
+    with open(zip_path, "wb") as fh:
+        fh.writelines(iter_zip(entries, fmt, extra, stamp))
+
+
+def write_file(path, records, fmt: str = "xlsx") -> None:
+    """Stream *records* into a single result file at *path*."""
+    with open(path, "wb") as fh:
+        writer = get_writer(fmt)(fh)
+        for rec in records:
+            writer.write(rec)
+        writer.close()
@@ -6,6 +6,7 @@ Compatible with platforms like Render.com, Railway, Fly.io, or a VPS.
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url  # pip install dj-database-url
 
 # ----------------------------------------------------------------------------
@@ -137,6 +138,76 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://127.0.0.1:63
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TIMEZONE = "UTC"
 
+# Uploads with at least this many rows go through the provider batch APIs
+# (overnight latency, half price); 0 disables bulk mode
+TRANSLATION_BULK_MIN_ROWS = int(os.getenv("TRANSLATION_BULK_MIN_ROWS", "1000"))
+
+# Uploads with at least this many rows fan out as chunked chord subtasks
+# across workers (0 = always run in a single task)
+TRANSLATION_CHORD_MIN_ROWS = int(os.getenv("TRANSLATION_CHORD_MIN_ROWS", "0"))
+TRANSLATION_CHUNK_ROWS = int(os.getenv("TRANSLATION_CHUNK_ROWS", "25"))
+
+# Send only one row per canonical SQL (comments/whitespace/casing ignored)
+TRANSLATION_DEDUPE = os.getenv("TRANSLATION_DEDUPE", "True").lower() in {"1", "true", "yes"}
+
+# Rows that still fail after the per-call retries are queued in failed.jsonl
+# and re-run this many times, DELAY seconds after the job (0 = never)
+TRANSLATION_RERUN_ATTEMPTS = int(os.getenv("TRANSLATION_RERUN_ATTEMPTS", "2"))
+TRANSLATION_RERUN_DELAY = int(os.getenv("TRANSLATION_RERUN_DELAY", "300"))
+
+# File format of the results inside the job zip: xlsx, csv, jsonl or parquet
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "xlsx")
+
+# One working directory per job (payload, checkpoints); shared by web and workers
+TRANSLATION_JOB_ROOT = Path(os.getenv("TRANSLATION_JOB_ROOT",
+                                      Path(tempfile.gettempdir()) / "sql_site_jobs"))
+
+# The janitor (core.tasks.sweep_artifacts, run by celery beat) removes job
+# directories and MEDIA_ROOT/tmp files older than the TTL, then the oldest
+# others until both fit in the quota; running jobs are never touched
+ARTIFACT_TTL = int(os.getenv("ARTIFACT_TTL", str(24 * 3600)))
+ARTIFACT_QUOTA_MB = int(os.getenv("ARTIFACT_QUOTA_MB", "2048"))
+ARTIFACT_SWEEP_SECONDS = int(os.getenv("ARTIFACT_SWEEP_SECONDS", "900"))
+# A running job beats (Job.updated) as rows finish; the janitor marks one
+# silent for this long failed (its worker was lost)
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "3600"))
+
+# Scheduling (core.scheduler): uploads estimated at up to SCHED_INTERACTIVE_TOKENS
+# go to the "interactive" queue, bigger ones to "bulk"; run workers for both,
+# e.g. `celery -A sql_site worker -Q interactive` and `... -Q bulk,interactive`.
+# Smaller jobs and clients with fewer active jobs get the better priority.
+CELERY_TASK_DEFAULT_QUEUE = "interactive"
+# visibility_timeout: an unacknowledged (acks_late) task or one with an ETA
+# is handed to another worker after this long, so it must outlast the
+# longest single task run and every countdown (bulk jobs poll by re-scheduling)
+CELERY_VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(6 * 3600)))
+CELERY_BROKER_TRANSPORT_OPTIONS = {"priority_steps": list(range(10)),
+                                   "queue_order_strategy": "priority",
+                                   "visibility_timeout": CELERY_VISIBILITY_TIMEOUT}
+SCHED_INTERACTIVE_TOKENS = int(os.getenv("SCHED_INTERACTIVE_TOKENS", "200_000"))
+# per client (user, else IP): jobs queued or running at once, estimated tokens a day
+SCHED_USER_MAX_JOBS = int(os.getenv("SCHED_USER_MAX_JOBS", "3"))
+SCHED_USER_DAILY_TOKENS = int(os.getenv("SCHED_USER_DAILY_TOKENS", "20_000_000"))
+# a single job over this is rejected; interactive (non-bulk) work beyond what
+# the provider TPM budgets serve in SCHED_HORIZON seconds is started later
+SCHED_JOB_MAX_TOKENS = int(os.getenv("SCHED_JOB_MAX_TOKENS", "200_000_000"))
+SCHED_HORIZON = int(os.getenv("SCHED_HORIZON", "3600"))
+# deferring a job further than this is refused instead (well below the
+# visibility timeout, past which a delayed task is delivered twice)
+SCHED_MAX_DEFER = int(os.getenv("SCHED_MAX_DEFER", CELERY_VISIBILITY_TIMEOUT // 2))
+
+# Experiment grids (logic.parse_grid) posted by clients: the models they may
+# name besides logic.ANT_MODEL (comma-separated), the largest max_tokens and
+# the number of variants a job may run
+GRID_MODELS = [m.strip() for m in os.getenv("GRID_MODELS", "").split(",") if m.strip()]
+GRID_MAX_TOKENS = int(os.getenv("GRID_MAX_TOKENS", "8192"))
+GRID_MAX_VARIANTS = int(os.getenv("GRID_MAX_VARIANTS", "6"))
+
+CELERY_BEAT_SCHEDULE = {
+    "sweep-artifacts": {"task": "core.tasks.sweep_artifacts",
+                        "schedule": ARTIFACT_SWEEP_SECONDS},
+}
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
@@ -144,3 +215,17 @@ CACHES = {
         "TIMEOUT": 3600,
     }
 }
+
+# Redis used for pub/sub progress events (SSE stream)
+PROGRESS_REDIS_URL = os.getenv("PROGRESS_REDIS_URL", CACHES["default"]["LOCATION"])
+# SSE streams a web process serves at once; each holds a thread, so keep it
+# below the server's thread count – further pages poll instead
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "4"))
+
+# Redis hash shared by web and worker processes for the /metrics endpoint
+METRICS_REDIS_URL = os.getenv("METRICS_REDIS_URL", PROGRESS_REDIS_URL)
+# /metrics answers scrapers from these addresses or networks (REMOTE_ADDR,
+# so list the proxy's behind one) or sending "Authorization: Bearer <token>"
+METRICS_ALLOWED_IPS = [a.strip() for a in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+                       if a.strip()]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
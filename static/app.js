@@ -47,6 +47,78 @@ document.addEventListener("DOMContentLoaded", () => {
     refreshRun();
   });
 
+  // SQL viewer: only a window of lines is fetched and rendered; a spacer
+  // as tall as the whole source keeps the scrollbar honest
+  const LINE_PX = 18, WINDOW = 300;
+  const makeViewer = (jobId) => {
+    const box = document.createElement("div");  // attached once the source is there
+    box.className = "code-viewer";
+    box.innerHTML =
+      '<div class="code-spacer"><div class="code-mark" hidden></div><div class="code-window"></div></div>';
+    const spacer = box.querySelector(".code-spacer");
+    const mark   = box.querySelector(".code-mark");
+    const win    = box.querySelector(".code-window");
+    let first = 1, last = 0, busy = false;
+
+    const fetchWindow = async (start) => {      // -> true once lines are shown
+      busy = true;
+      try {
+        const r = await fetch(`/api/jobs/${jobId}/source/?start=${start}&count=${WINDOW}`);
+        if (!r.ok) return false;
+        const d = await r.json();             // {total_lines, start, end, html}
+        spacer.style.height = `${d.total_lines * LINE_PX}px`;
+        win.style.top       = `${(d.start - 1) * LINE_PX}px`;
+        win.innerHTML       = d.html;
+        [first, last]       = [d.start, d.end];
+        return true;
+      } finally {
+        busy = false;
+      }
+    };
+    const ensure = async () => {                // refetch when the view leaves the window
+      if (busy) return;
+      const top    = Math.floor(box.scrollTop / LINE_PX) + 1;
+      const bottom = top + Math.ceil(box.clientHeight / LINE_PX);
+      if (top < first || bottom > last) {
+        await fetchWindow(Math.max(1, top - Math.floor(WINDOW / 3)));
+        ensure();                               // the user may have scrolled on meanwhile
+      }
+    };
+    box.addEventListener("scroll", ensure);
+
+    return {
+      load: async () => {
+        if (!(await fetchWindow(1))) return false;
+        codeBox.replaceChildren(box);
+        return true;
+      },
+      jump: (a, b) => {                         // show and highlight lines a-b
+        mark.style.top    = `${(a - 1) * LINE_PX}px`;
+        mark.style.height = `${(b - a + 1) * LINE_PX}px`;
+        mark.hidden       = false;
+        box.scrollTop     = Math.max(0, (a - 1) * LINE_PX - box.clientHeight / 3);
+        ensure();
+      },
+    };
+  };
+  let viewer = null;
+
+  // "(lines a-b)" in a translation jumps the viewer to that range
+  previewBox.addEventListener("click", (ev) => {
+    const a = ev.target.closest(".line-jump");
+    if (!a || !viewer) return;
+    ev.preventDefault();
+    viewer.jump(Number(a.dataset.a), Number(a.dataset.b));
+  });
+
+  const showError = (e) => {
+    previewBox.innerHTML =
+      `<pre style="color:red;white-space:pre-wrap">${e.message}</pre>`;
+    if (bar) bar.setAttribute("hidden", "true");
+    btnRun.textContent = "Run";
+    btnRun.disabled    = false;
+  };
+
   // main run
   btnRun.addEventListener("click", async () => {
     const fd = new FormData();
@@ -76,35 +148,129 @@ document.addEventListener("DOMContentLoaded", () => {
       previewBox.innerHTML = j.html_trans;
       codeBox.innerHTML    = j.code_html;
 
-      // poll progress
-      const poll = setInterval(async () => {
-        const r2 = await fetch(`/api/progress/${j.job_id}/`);
-        if (!r2.ok) return;                       // ignore transient errors
-        const p = await r2.json();               // {status, progress, zip_url?}
+      // the worker reads the upload; its source shows up once ingested
+      let sourceShown = false, sourceLoading = false;
+      const loadSource = async () => {
+        if (sourceShown || sourceLoading) return;
+        sourceLoading = true;
+        try {
+          const v = makeViewer(j.job_id);
+          if (await v.load()) {
+            viewer      = v;
+            sourceShown = true;
+          }
+        } finally {
+          sourceLoading = false;
+        }
+      };
 
+      // live preview: rows finished since `cursor` are appended as they land
+      let cursor = "", pulling = false, pullAgain = false, tbody = null;
+      const esc = (v) => String(v ?? "")
+        .replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;")
+        .replace(/\r?\n/g, "<br>");
+      const linkLines = (html) => html.replace(/\(lines (\d+)-(\d+)\)/g,
+        '<a href="#" class="line-jump" data-a="$1" data-b="$2">(lines $1-$2)</a>');
+      const appendRows = (rows) => {
+        if (!rows.length) return;
+        if (!tbody) {
+          previewBox.innerHTML =
+            '<table class="tbl" border="1"><thead><tr>' +
+            "<th>SQL_Index</th><th>Type</th><th>Content</th></tr></thead><tbody></tbody></table>";
+          tbody = previewBox.querySelector("tbody");
+        }
+        for (const rec of rows) {
+          for (const t of rec.trans) {
+            tbody.insertAdjacentHTML("beforeend",
+              `<tr><td>${esc(t.SQL_Index)}</td><td>${esc(t.Type)}</td><td>${linkLines(esc(t.Content))}</td></tr>`);
+          }
+        }
+      };
+      const pullRows = async () => {              // -> progress payload or null
+        if (pulling) return null;
+        pulling = true;
+        try {
+          const r2 = await fetch(
+            `/api/progress/${j.job_id}/?cursor=${encodeURIComponent(cursor)}`);
+          if (!r2.ok) return null;                // ignore transient errors
+          const d = await r2.json();              // {status, progress, rows, cursor, zip_url?}
+          cursor = d.cursor;
+          appendRows(d.rows);
+          return d;
+        } finally {
+          pulling = false;
+        }
+      };
+      const pullSoon = async () => {              // event bursts: one pull in flight, one trailing
+        if (pulling) { pullAgain = true; return; }
+        do {
+          pullAgain = false;
+          await pullRows();
+        } while (pullAgain);
+      };
+      const drainRows = async () => {             // final catch-up once the job is done
+        while (pulling) await new Promise((r) => setTimeout(r, 100));
+        let d;
+        do { d = await pullRows(); } while (d && d.rows.length);
+      };
+
+      // progress: push via Server-Sent Events, fall back to polling
+      let poll = null, es = null;
+      const finish = () => {
+        if (poll) clearInterval(poll);
+        if (es) es.close();
+      };
+      const handle = (p) => {                     // {status, progress, zip_url?}
         if (bar && p.progress !== undefined) bar.value = p.progress;
+        if (p.status === "running" || p.status === "done") loadSource();
+        if (p.status === "queued") {              // {queue, queue_position, deferred_until?}
+          btnRun.textContent = p.deferred_until
+            ? `Deferred until ${new Date(p.deferred_until).toLocaleTimeString()}`
+            : `Queued (#${p.queue_position})`;
+        } else if (p.status === "running") {
+          btnRun.textContent = "Running…";
+        }
 
         if (p.status === "done") {
-          clearInterval(poll);
+          finish();
+          drainRows();
           if (bar) bar.setAttribute("hidden", "true");
 
           btnDownload.href     = p.zip_url;
-          btnDownload.download = p.zip_url.split("/").pop();
+          btnDownload.download = `${j.job_id}.zip`;
           btnDownload.classList.remove("disabled");
           btnRun.textContent = "Run";
           btnRun.disabled    = false;
         }
-        if (p.status === "failed") {
-          clearInterval(poll);
-          throw new Error("Job failed on server");
+        if (p.status === "failed" || p.status === "unknown") {
+          finish();
+          showError(new Error(p.error || "Job failed on server"));
         }
-      }, 2000);
+      };
+      const startPolling = () => {
+        poll = setInterval(async () => {
+          const d = await pullRows();
+          if (d) handle(d);
+        }, 2000);
+      };
+
+      if (window.EventSource) {
+        es = new EventSource(`/api/progress/${j.job_id}/stream/`);
+        es.onmessage = (ev) => {
+          const p = JSON.parse(ev.data);
+          if (p.status === "running") pullSoon();
+          handle(p);
+        };
+        es.onerror   = () => {                    // stream unavailable or full (204): poll
+          es.close();
+          es = null;
+          if (!poll) startPolling();
+        };
+      } else {
+        startPolling();
+      }
     } catch (e) {
-      previewBox.innerHTML =
-        `<pre style="color:red;white-space:pre-wrap">${e.message}</pre>`;
-      if (bar) bar.setAttribute("hidden", "true");
-      btnRun.textContent = "Run";
-      btnRun.disabled    = false;
+      showError(e);
     }
   });
 